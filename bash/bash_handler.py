@@ -121,6 +121,14 @@ def config_cli() -> Cli:
     """
     sequential_execution = Flag("-s", description=msg)
     cli.add_global_flag(sequential_execution)
+    # -----------------------------
+    msg = """ 
+    stores the register in a SQLite database (indexed by container
+    name, tag and state) instead of one file per page. Once used, 
+    the program keeps using it while the database exists
+    """
+    sqlite_register = Flag("--sqlite", description=msg)
+    cli.add_global_flag(sqlite_register)
     
     return cli    
     
@@ -1,5 +1,6 @@
 
 from bash.commands.loadbal_cmd.set_cmd.port_cmd.port import port
+import os
 import logging
 import concurrent.futures as conc
 
@@ -9,8 +10,10 @@ from ..reused_definitions import reused_opts, reused_flags
 # Imports para la funcion asociada al comando
 from program.controllers import bridges, containers
 from program import program
-from program.platform import platform
+from program.platform import platform, images, storage
 from dependencies.utils.tools import concat_array
+from dependencies.lxc import lxc
+from dependencies.utils.decorators import sequential_execution
 from ..reused_functions import (
     get_db_opts, get_cl_opts, get_lb_opts, get_servers_opts
 )
@@ -64,6 +67,12 @@ def get_deploy_cmd():
     # ++++++++++++++++++++++++++++
     climage = _def_climage_opt()
     deploy.add_option(climage)
+    # ++++++++++++++++++++++++++++
+    mirror = _def_mirror_opt()
+    deploy.add_option(mirror)
+    # ++++++++++++++++++++++++++++
+    storage_opt = _def_storage_opt()
+    deploy.add_option(storage_opt)
     
     # Flags ---------------------- 
     deploy.add_flag(reused_flags["-l"])
@@ -182,6 +191,33 @@ def _def_climage_opt():
     )
     return climage
 
+# --------------------------------------------------------------------
+def _def_mirror_opt():
+    msg = """ 
+    <directory> local package repository (flat or with dists/) used
+    instead of the internet ones when building the images of the
+    containers
+    """
+    mirror = Option(
+        "--mirror", description=msg, 
+        extra_arg=True, mandatory=True
+    )
+    return mirror
+
+# --------------------------------------------------------------------
+def _def_storage_opt():
+    msg = """ 
+    <size> creates (or reuses) a dedicated loop-backed btrfs storage 
+    pool of that size (20GB, 512MiB...) where every container of the
+    platform and every image build is created (copies are 
+    copy-on-write clones)
+    """
+    storage_opt = Option(
+        "--storage", description=msg, 
+        extra_arg=True, mandatory=True
+    )
+    return storage_opt
+
 # -------------------------------------------------------------------- 
 # -------------------------------------------------------------------- 
 deploy_logger = logging.getLogger(__name__)
@@ -200,6 +236,26 @@ def deploy(args:list=[], options:dict={}, flags:list=[], nested_cmd:dict={}):
               + "se debe destruir la anterior para crear otra nueva")
         deploy_logger.error(msg)
         return   
+    if "--mirror" in options:
+        mirror = options["--mirror"][0]
+        if not os.path.isdir(mirror):
+            msg = f" No existe el repositorio local de paquetes '{mirror}'"
+            deploy_logger.error(msg)
+            return
+        images.config_apt(mirror=mirror)
+    if "--storage" in options:
+        size = options["--storage"][0]
+        if not storage.valid_size(size):
+            msg = f" Tamaño de pool '{size}' no valido (ej: 20GB)"
+            deploy_logger.error(msg)
+            return
+        try:
+            storage.create(size)
+        except lxc.LxcError as err:
+            msg = (" No se ha podido crear el pool de " + 
+                   f"almacenamiento: {err}")
+            deploy_logger.error(msg)
+            return
     deploy_logger.info(" Desplegando la plataforma de servidores...\n")
     # Creando bridges
     bgs = net_devices.get_bridges(numBridges=2)
@@ -219,7 +275,7 @@ def deploy(args:list=[], options:dict={}, flags:list=[], nested_cmd:dict={}):
     simage, names = get_servers_opts(options, flags)
     # Configurando e Iniciando contenedores
     successful_cs = []
-    if "-s" in flags:
+    if sequential_execution():
         db = data_base.create_database(image=dbimage)
         if db is not None: successful_cs.append(db)
         lb = load_balancer.create_lb(
@@ -232,6 +288,15 @@ def deploy(args:list=[], options:dict={}, flags:list=[], nested_cmd:dict={}):
         servs = servers.create_servers(num_servs, *names, image=simage)
         successful_cs += servs
     else:
+        # Empezamos a construir a la vez las imagenes que falten (cada
+        # rol espera solo a la suya)
+        recipes = []
+        if dbimage is None: recipes.append(data_base.RECIPE)
+        if lbimage is None: recipes.append(load_balancer.RECIPE)
+        if "--client" in options and climage is None: 
+            recipes.append(client.RECIPE)
+        if simage is None: recipes.append(servers.RECIPE)
+        images.prepare(*recipes)
         # Utilizamos concurrencia de hilos
         with conc.ThreadPoolExecutor() as executor:
             threads = []
@@ -6,7 +6,8 @@ from dependencies.cli.aux_classes import Command, Flag, Option
 from ..reused_definitions import reused_opts, reused_flags
 # Imports para la funcion asociada al comando
 from program import program
-from program.platform import platform
+from program.platform import platform, storage
+from program.platform.machines import servers
 from dependencies.utils.tools import concat_array
 from program.controllers import bridges, containers
 from dependencies.register import register
@@ -83,6 +84,9 @@ def destroy(args:list=[], options:dict={}, flags:list=[], nested_cmd:dict={}):
     bgs = register.load(bridges.ID) 
     if cs == None and bgs == None:
         register.remove("updates")
+        servers.remove_template()
+        # El pool se conserva en lxc para el siguiente despliegue
+        storage.forget()
         destroy_logger.info(" Plataforma destruida")
     else:
         msg = (" Plataforma destruida parcialmente " +
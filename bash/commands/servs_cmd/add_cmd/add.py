@@ -82,6 +82,11 @@ def add(args:list=[], options:dict={}, flags:list=[], nested_cmd:dict={}):
             add_logger.error(msg)
             return
     image, names = get_servers_opts(options, flags)
+    if servers.TEMPLATE_NAME in names:
+        msg = (f" El nombre '{servers.TEMPLATE_NAME}' esta reservado " +
+                "para la plantilla de los servidores")
+        add_logger.error(msg)
+        return
     servs = servers.create_servers(num, *names, image=image)
     program.list_lxc_containers(*servs) 
     cs_s = concat_array(servs)
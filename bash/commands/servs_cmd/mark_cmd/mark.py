@@ -31,5 +31,4 @@ def mark(args:list=[], options:dict={}, flags:list=[], nested_cmd:dict={}):
     servs = get_cs(args, options, tags=[servers.TAG])
     if servs is None: return
     mark_logger.info(f" Marcando servidores '{concat_array(servs)}'...")
-    for serv in servs:
-        servers.mark_htmlindexes(serv)
\ No newline at end of file
+    servers.mark_htmlindexes(*servs)
\ No newline at end of file
@@ -32,5 +32,4 @@ def unmark(args:list=[], options:dict={}, flags:list=[], nested_cmd:dict={}):
     servs = get_cs(args, options, tags=[servers.TAG])
     if servs is None: return
     unmark_logger.info(f" Desmarcando servidores '{concat_array(servs)}'...")
-    for serv in servs:
-        servers.mark_htmlindexes(serv, undo=True)
\ No newline at end of file
+    servers.mark_htmlindexes(*servs, undo=True)
\ No newline at end of file
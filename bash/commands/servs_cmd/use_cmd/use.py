@@ -1,4 +1,6 @@
 
+import logging
+
 # Imports para definicion del comando
 from program.controllers import containers
 from dependencies import register
@@ -18,6 +20,13 @@ def get_use_cmd():
     # ++++++++++++++++++++++++++++
     on = _def_on_opt()
     use.add_option(on)
+    parallel = _def_parallel_opt()
+    use.add_option(parallel)
+    # Flags ---------------------- 
+    use.add_flag(Flag(
+        "--mount", description=("mounts the app folder of the host " +
+            "(read-only) in the servers instead of copying it")
+    ))
     
     return use
 
@@ -30,11 +39,32 @@ def _def_on_opt():
     )
     return on
 
+def _def_parallel_opt():
+    parallel = Option(
+        "--parallel", 
+        description=("<number> max number of servers that receive " + 
+                     "the app at the same time"), 
+        extra_arg=True, mandatory=True
+    )
+    return parallel
+
 # -------------------------------------------------------------------- 
 # -------------------------------------------------------------------- 
+use_logger = logging.getLogger(__name__)
 def use(args:list=[], options:dict={}, flags:list=[], nested_cmd:dict={}):
     app = args[0]
     serv_names = []
     if "--on" in options:
         serv_names = options["--on"]
-    use_app(app, *serv_names)
\ No newline at end of file
+    limit = None
+    if "--parallel" in options:
+        try:
+            limit = int(options["--parallel"][0])
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            err = (f" El numero de servidores en paralelo " +
+                   f"'{options['--parallel'][0]}' no es valido")
+            use_logger.error(err)
+            return
+    use_app(app, *serv_names, mount="--mount" in flags, limit=limit)
\ No newline at end of file
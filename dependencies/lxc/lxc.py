@@ -1,12 +1,54 @@
 
+import io
+import sys
+import asyncio
 import subprocess
+import threading
 from time import sleep
-import re
+from contextlib import suppress, asynccontextmanager
+from typing import NamedTuple
 import json
 import csv
 
+from .lxd_api import LxdClient, find_socket
 
 _lxc_list_formats = ["table", "csv", "json", "yaml"]
+# Cache de las listas de lxc durante la ejecucion del programa. Cada
+# tipo de lista ("list", "names", "network", "image", "storage") 
+# guarda el resultado de su ultima consulta. Las ordenes que se 
+# ejecutan con run() y modifican algo invalidan solo las listas 
+# afectadas
+_cache = {}
+_cache_lock = threading.Lock()
+# Ordenes de lxc que no modifican nada
+_READONLY_VERBS = {"list", "info", "exec", "file", "version", "monitor"}
+_READONLY_SUBVERBS = {"list", "show", "info", "get"}
+# Ordenes que modifican los contenedores
+_INSTANCE_VERBS = {
+    "init", "launch", "start", "stop", "restart", "delete", "pause",
+    "rename", "copy", "move", "config", "snapshot", "restore"
+}
+# Forma de ejecutar las ordenes de lxc: "auto" usa la API de LXD (a
+# traves de su socket unix) si esta disponible y si no, o si la orden
+# no se puede traducir, el binario 'lxc'. "cli" usa solo el binario y
+# "api" obliga a que el socket este disponible
+_transport = "auto"
+_socket_path:str = None
+_api:LxdClient = None
+_api_checked = False
+# Limite de ordenes de lxc ejecutandose a la vez con run_async (en el
+# anfitrion). Ademas, las ordenes sobre un mismo contenedor se
+# ejecutan de una en una
+MAX_CONCURRENCY = 8
+# Semaforo del anfitrion y candados de cada contenedor. Son comunes a
+# todo el proceso (varios hilos pueden tener su propio bucle de 
+# asyncio a la vez, ej: deploy) por lo que son de threading
+_host_sem = threading.BoundedSemaphore(MAX_CONCURRENCY)
+_c_locks = {}
+_c_locks_lock = threading.Lock()
+# Pool de almacenamiento en el que se crean los contenedores (None
+# para usar el del perfil default)
+STORAGE_POOL:str = None
 # --------------------------------------------------------------------
 class LxcError(Exception):
     """Excepcion personalizada para los errores al manipular 
@@ -20,37 +62,240 @@ class LxcNetworkError(Exception):
     pass
 
 # --------------------------------------------------------------------
-def run(cmd:list, stdout=True, stderr=True) -> str:
+def run(cmd:list, stdout=True, stderr=True, input=None) -> str:
     """Ejecuta un comando mediante subprocess y controla los 
     errores que puedan surgir. Espera a que termine el proceso
     (Llamada bloqueante)
 
     Args:
         cmd (list): Comando a ejecutar
+        input (bytes | callable, optional): Datos que se le pasan a
+            la orden por stdin. Si es una funcion se le pasa el stdin
+            del proceso para que vaya escribiendo en el (streaming)
 
     Raises:
         LxcError: Si surge algun error ejecutando el comando
         LxcNetworkError: Si surge algun error ejecutando en comando
             relacioneado con los bridge (networks)
     """
-    options = {}
-    if stdout:
-        options["stdout"] = subprocess.PIPE
-    options["stderr"] = subprocess.PIPE
-    process = subprocess.run(cmd, **options)
-    outcome = process.returncode
+    try:
+        outcome, out, err = _execute(cmd, stdout, input=input)
+    finally:
+        # Aunque falle puede haber modificado algo
+        invalidate(*_affected_lists(cmd))
+    return _check_outcome(cmd, outcome, out, err, stdout, stderr)
+
+async def run_async(cmd:list, stdout=True, stderr=True, 
+                    container:str=None, input=None) -> str:
+    """Version asincrona de run(). Como mucho se ejecutan a la vez
+    MAX_CONCURRENCY ordenes y, si se indica el contenedor sobre el que
+    actua la orden, nunca dos a la vez sobre el mismo contenedor. Asi
+    se pueden lanzar operaciones sobre muchos contenedores a la vez
+    (asyncio.gather) y tardar lo que tarde la mas lenta
+
+    Args:
+        cmd (list): Comando a ejecutar
+        container (str, optional): Contenedor sobre el que actua
+        input (bytes | callable, optional): Igual que en run()
+
+    Raises:
+        LxcError: Si surge algun error ejecutando el comando
+        LxcNetworkError: Si surge algun error ejecutando en comando
+            relacioneado con los bridge (networks)
+    """
+    async with _async_limits(container):
+        try:
+            if input is None:
+                outcome, out, err = await _execute_async(cmd, stdout)
+            else:
+                # La escritura en stdin es bloqueante (otro hilo)
+                loop = asyncio.get_running_loop()
+                outcome, out, err = await loop.run_in_executor(
+                    None, _execute, cmd, stdout, input
+                )
+        finally:
+            invalidate(*_affected_lists(cmd))
+    return _check_outcome(cmd, outcome, out, err, stdout, stderr)
+
+@asynccontextmanager
+async def _async_limits(container:str):
+    """Bloque en el que se tiene el candado del contenedor (si se 
+    indica) y un hueco del semaforo del anfitrion. Primero el del
+    contenedor, para no ocupar un hueco mientras se espera"""
+    c_lock = None
+    if container is not None:
+        with _c_locks_lock:
+            c_lock = _c_locks.setdefault(container, threading.Lock())
+        await _acquire(c_lock)
+    try:
+        host_sem = _host_sem
+        await _acquire(host_sem)
+        try:
+            yield
+        finally:
+            host_sem.release()
+    finally:
+        if c_lock is not None: c_lock.release()
+
+async def _acquire(lock):
+    """Espera a un candado de threading sin bloquear el bucle. No se 
+    espera en otro hilo porque los hilos del executor los necesitan 
+    las propias ordenes (se podrian quedar todos esperando)"""
+    delay = 0.005
+    while not lock.acquire(blocking=False):
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+def _check_outcome(cmd:list, outcome:int, out:str, err:str,
+                   stdout:bool, stderr:bool) -> str:
+    """Lanza el error correspondiente si la orden ha fallado y si no
+    devuelve su salida"""
     if outcome != 0:
         err_msg = f" Fallo al ejecutar el comando {cmd}"
         if stderr:
-            err = process.stderr.decode()[:-1]
-            err_msg += f"\nMensaje de error de lxc: -> {err}"
+            err_msg += f"\nMensaje de error de lxc: -> {err[:-1]}"
         elif stdout:
-            err_msg = process.stdout.decode()
+            err_msg = out
         if "network" in cmd:
             raise LxcNetworkError(err_msg)
         raise LxcError(err_msg)
     if stdout:
-        return process.stdout.decode()
+        return out
+
+def _execute(cmd:list, stdout:bool, input=None) -> tuple:
+    """Ejecuta la orden con la API de LXD si se puede o si no con
+    subprocess. Devuelve (codigo de salida, stdout, stderr). Si la
+    entrada (input) se va generando (funcion) se usa subprocess"""
+    global _api
+    if callable(input):
+        return _execute_streaming(cmd, stdout, input)
+    api = _api_client()
+    if api is not None:
+        try:
+            result = api.run(cmd, input=input)
+        except OSError:
+            # El socket ha dejado de estar disponible (sin haber 
+            # enviado nada que modifique algo), se usa la consola
+            _api = None
+            result = None
+        if result is not None:
+            if not stdout:
+                # Igual que con subprocess, la salida se muestra
+                sys.stdout.write(result[1])
+            return result
+    options = {"stderr": subprocess.PIPE}
+    if stdout:
+        options["stdout"] = subprocess.PIPE
+    process = subprocess.run(cmd, input=input, **options)
+    out = process.stdout.decode() if stdout else ""
+    return process.returncode, out, process.stderr.decode()
+
+def _execute_streaming(cmd:list, stdout:bool, write) -> tuple:
+    """Ejecuta la orden pasandole a write() su stdin para que escriba
+    en el mientras se ejecuta. La salida se lee en otros hilos para
+    que el proceso no se bloquee con las tuberias llenas"""
+    process = subprocess.Popen(
+        cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+        stdout=subprocess.PIPE if stdout else None
+    )
+    outputs = {}
+    def drain(name, pipe):
+        outputs[name] = pipe.read()
+    readers = [threading.Thread(target=drain, args=("err", process.stderr))]
+    if stdout:
+        readers.append(
+            threading.Thread(target=drain, args=("out", process.stdout))
+        )
+    for reader in readers: reader.start()
+    try:
+        write(process.stdin)
+    except BrokenPipeError:
+        # El proceso ha terminado antes de tiempo (el error esta en
+        # su stderr)
+        pass
+    finally:
+        with suppress(BrokenPipeError):
+            process.stdin.close()
+        for reader in readers: reader.join()
+        process.wait()
+    out = outputs["out"].decode() if stdout else ""
+    return process.returncode, out, outputs["err"].decode()
+
+async def _execute_async(cmd:list, stdout:bool) -> tuple:
+    """Version asincrona de _execute(). La API se usa desde otro hilo
+    (cada hilo tiene su propia conexion) y la consola con
+    asyncio.create_subprocess_exec"""
+    global _api
+    api = _api_client()
+    if api is not None:
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(None, api.run, cmd)
+        except OSError:
+            _api = None
+            result = None
+        if result is not None:
+            if not stdout:
+                sys.stdout.write(result[1])
+            return result
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE if stdout else None,
+        stderr=asyncio.subprocess.PIPE
+    )
+    out, err = await process.communicate()
+    out = out.decode() if stdout else ""
+    return process.returncode, out, err.decode()
+
+def config_concurrency(limit:int):
+    """Cambia el numero maximo de ordenes de lxc que se pueden
+    ejecutar a la vez con run_async en todo el proceso (se debe 
+    llamar antes de lanzar ordenes)"""
+    global MAX_CONCURRENCY, _host_sem
+    if limit < 1:
+        raise LxcError(f" Limite de concurrencia '{limit}' no valido")
+    MAX_CONCURRENCY = limit
+    _host_sem = threading.BoundedSemaphore(limit)
+
+def config_storage(pool:str=None):
+    """Elige el pool de almacenamiento en el que se crean a partir de
+    ahora los contenedores (init y copy). None para usar el del perfil
+    default de lxc"""
+    global STORAGE_POOL
+    STORAGE_POOL = pool
+
+def storage_args() -> list:
+    """Opciones de init y copy para crear el contenedor en el pool
+    configurado"""
+    return [] if STORAGE_POOL is None else ["-s", STORAGE_POOL]
+
+def config_transport(name:str="auto", socket_path:str=None):
+    """Permite elegir como se ejecutan las ordenes de lxc
+
+    Args:
+        name (str, optional): "auto", "api" o "cli"
+        socket_path (str, optional): Ruta del socket de LXD. Por 
+            defecto se busca en las ubicaciones habituales
+
+    Raises:
+        LxcError: Si se pide la API y el socket no esta disponible
+    """
+    global _transport, _socket_path, _api, _api_checked
+    if name not in ("auto", "api", "cli"):
+        raise LxcError(f" Forma de ejecutar lxc '{name}' no valida")
+    _transport = name; _socket_path = socket_path
+    _api = None; _api_checked = False
+    if name == "api" and _api_client() is None:
+        raise LxcError(" No se encuentra el socket de LXD")
+
+def _api_client() -> LxdClient:
+    global _api, _api_checked
+    if _transport == "cli": return None
+    if not _api_checked:
+        path = find_socket(_socket_path)
+        _api = LxdClient(path) if path is not None else None
+        _api_checked = True
+    return _api
 
 def Popen(cmd:list):
     """Ejecuta un comando mediante subprocess no bloqueante (
@@ -61,92 +306,331 @@ def Popen(cmd:list):
     """
     subprocess.Popen(cmd)
 # --------------------------------------------------------------------
+def _affected_lists(cmd:list) -> tuple:
+    """Devuelve las listas de lxc que puede modificar una orden"""
+    if len(cmd) < 2 or cmd[0] != "lxc": return ()
+    verb = cmd[1]
+    subverb = cmd[2] if len(cmd) > 2 else ""
+    if verb in _READONLY_VERBS: return ()
+    if verb == "network":
+        if subverb in _READONLY_SUBVERBS: return ()
+        if subverb in ("attach", "detach"): return ("network", "list")
+        return ("network",)
+    if verb == "image":
+        if subverb in _READONLY_SUBVERBS: return ()
+        return ("image",)
+    if verb == "publish":
+        return ("image",)
+    if verb == "storage":
+        if subverb in _READONLY_SUBVERBS: return ()
+        return ("storage",)
+    if verb in _INSTANCE_VERBS:
+        if verb == "config" and subverb in _READONLY_SUBVERBS: return ()
+        return ("list",)
+    # Orden desconocida, se invalida todo
+    return ("list", "network", "image", "storage")
+
+def invalidate(*kinds):
+    """Elimina de la cache las listas indicadas ("list", "network",
+    "image" o "storage"). Si no se indica ninguna se vacia la cache entera"""
+    with _cache_lock:
+        if len(kinds) == 0:
+            _cache.clear()
+        for kind in kinds:
+            _cache.pop(kind, None)
+            if kind == "list":
+                _cache.pop("names", None)
+
+def _cached_query(kind:str, cmd:list, parse, fresh:bool=False):
+    """Devuelve el resultado de la consulta guardado en la cache o
+    la ejecuta si no esta (o se pide fresh)"""
+    if not fresh:
+        with _cache_lock:
+            if kind in _cache:
+                return _cache[kind]
+    result = parse(run(cmd))
+    with _cache_lock:
+        _cache[kind] = result
+    return result
+
+# --------------------------------------------------------------------
+# Las listas de lxc se piden una sola vez en formato json y a partir
+# de ese resultado se generan tanto los diccionarios que usa el
+# programa como las tablas que se muestran (con el mismo aspecto que
+# las de lxc). Cada elemento se convierte en un registro (NamedTuple)
 # --------------------------------------------------------------------
-def _lxc_generic_list(cmd:list, print_:bool=False, 
-                        format_:str="table", as_str=False) -> dict:
+class ContainerInfo(NamedTuple):
+    name:str
+    state:str
+    ipv4:dict
+    ipv6:dict
+    type:str
+    snapshots:int
+    HEADERS = ["NAME", "STATE", "IPV4", "IPV6", "TYPE", "SNAPSHOTS"]
+
+    def as_dict(self) -> dict:
+        return dict(zip(self.HEADERS, self))
+
+    def cells(self) -> list:
+        return [
+            self.name, self.state, _nets_cell(self.ipv4),
+            _nets_cell(self.ipv6), self.type, str(self.snapshots)
+        ]
+
+class NetworkInfo(NamedTuple):
+    name:str
+    type:str
+    managed:str
+    description:str
+    used_by:str
+    HEADERS = ["NAME", "TYPE", "MANAGED", "DESCRIPTION", "USED BY"]
+
+    def as_dict(self) -> dict:
+        return dict(zip(self.HEADERS, self))
+
+    def cells(self) -> list:
+        return list(self)
+
+class ImageInfo(NamedTuple):
+    alias:str
+    fingerprint:str
+    public:str
+    description:str
+    architecture:str
+    type:str
+    size:str
+    upload_date:str
+    HEADERS = ["ALIAS", "FINGERPRINT", "PUBLIC", "DESCRIPTION",
+                "ARCHITECTURE", "TYPE", "SIZE", "UPLOAD DATE"]
+
+    def as_dict(self) -> dict:
+        return dict(zip(self.HEADERS, self))
+
+    def cells(self) -> list:
+        return list(self)
+
+class StorageInfo(NamedTuple):
+    name:str
+    driver:str
+    source:str
+    description:str
+    used_by:str
+    state:str
+    HEADERS = ["NAME", "DRIVER", "SOURCE", "DESCRIPTION", "USED BY",
+                "STATE"]
+
+    def as_dict(self) -> dict:
+        return dict(zip(self.HEADERS, self))
+
+    def cells(self) -> list:
+        return list(self)
+
+# --------------------------------------------------------------------
+def _nets_cell(nets:dict) -> str:
+    return "\n".join(f"{ip} ({eth})" for eth, ip in nets.items())
+
+def _addresses(state:dict, family:str) -> dict:
+    """Devuelve las ips globales de cada tarjeta de red {eth: ip}"""
+    nets = {}
+    networks = (state or {}).get("network") or {}
+    for eth, info in networks.items():
+        if eth == "lo": continue
+        for addr in info.get("addresses") or []:
+            if addr["family"] == family and addr["scope"] == "global":
+                nets.setdefault(eth, addr["address"])
+    return nets
+
+def _container_info(raw:dict) -> ContainerInfo:
+    type_ = raw.get("type", "container").upper()
+    if raw.get("ephemeral"): type_ += " (EPHEMERAL)"
+    return ContainerInfo(
+        name=raw["name"],
+        state=raw["status"].upper(),
+        ipv4=_addresses(raw.get("state"), "inet"),
+        ipv6=_addresses(raw.get("state"), "inet6"),
+        type=type_,
+        snapshots=len(raw.get("snapshots") or [])
+    )
+
+def _network_info(raw:dict) -> NetworkInfo:
+    return NetworkInfo(
+        name=raw["name"],
+        type=raw.get("type", ""),
+        managed="YES" if raw.get("managed") else "NO",
+        description=raw.get("description", ""),
+        used_by=str(len(raw.get("used_by") or []))
+    )
+
+def _image_info(raw:dict) -> ImageInfo:
+    aliases = raw.get("aliases") or []
+    props = raw.get("properties") or {}
+    return ImageInfo(
+        alias=aliases[0]["name"] if len(aliases) > 0 else "",
+        # Huella corta, la misma que muestra lxc en sus tablas
+        fingerprint=raw["fingerprint"][:12],
+        public="yes" if raw.get("public") else "no",
+        description=props.get("description", ""),
+        architecture=raw.get("architecture", ""),
+        type=raw.get("type", "container").upper(),
+        size=f"{raw.get('size', 0)/1024/1024:.2f}MB",
+        upload_date=raw.get("uploaded_at", "")
+    )
+
+def _storage_info(raw:dict) -> StorageInfo:
+    return StorageInfo(
+        name=raw["name"],
+        driver=raw.get("driver", ""),
+        source=(raw.get("config") or {}).get("source", ""),
+        description=raw.get("description", ""),
+        used_by=str(len(raw.get("used_by") or [])),
+        state=raw.get("status", "").upper()
+    )
+
+def render_table(headers:list, rows:list) -> str:
+    """Genera una tabla con el mismo formato que las de lxc. Las
+    celdas con varias lineas ocupan varias filas de texto
+
+    Args:
+        headers (list): Cabeceras de las columnas
+        rows (list): Filas (listas de celdas en forma de string)
+
+    Returns:
+        str: tabla
+    """
+    split_rows = [[cell.split("\n") for cell in row] for row in rows]
+    widths = [len(h) for h in headers]
+    for row in split_rows:
+        for i, lines in enumerate(row):
+            widths[i] = max([widths[i]] + [len(l) for l in lines])
+    dash_line = "+" + "+".join("-"*(w + 2) for w in widths) + "+"
+    lines = [dash_line]
+    lines.append(
+        "|" + "|".join(f" {h:^{w}} " for h, w in zip(headers, widths)) + "|"
+    )
+    lines.append(dash_line)
+    for row in split_rows:
+        height = max(len(cell) for cell in row)
+        for k in range(height):
+            cells = [cell[k] if k < len(cell) else "" for cell in row]
+            lines.append(
+                "|" + "|".join(
+                    f" {c:<{w}} " for c, w in zip(cells, widths)
+                ) + "|"
+            )
+        lines.append(dash_line)
+    return "\n".join(lines)
+
+def _render(raw:list, records:list, headers:list, format_:str) -> str:
+    """Representa la lista en el formato pedido"""
+    if format_ == "json":
+        return json.dumps(raw, indent=4, sort_keys=True)
+    rows = [r.cells() for r in records]
+    if format_ == "csv":
+        out = io.StringIO()
+        csv.writer(out, lineterminator="\n").writerows(rows)
+        return out.getvalue()[:-1]
+    return render_table(headers, rows)
+
+def _lxc_generic_list(kind:str, cmd:list, to_record, headers:list, 
+                        print_:bool=False, format_:str="table", 
+                        as_str=False, fresh:bool=False):
     if format_ not in _lxc_list_formats:
-        raise LxcError(f" El formato {format} no es valido")
-    out = run(cmd + ["--format", format_])
-    out = out[:-1]
-    if print_:
-        if format_ == "json":
-            json_list = json.loads(out)
-            out = json.dumps(json_list, indent=4, sort_keys=True)
-        print(out)
-    # Devuelve una lista con la informacion de cada imagen en
-    # forma de diccionario
-    if as_str:
-        return out
-    else:
-        csv = run(cmd + ["--format", "csv"])
-        return _process_lxccsv(csv)
-
-def lxc_list(print_:bool=False, format_:str="table", as_str=False) -> dict:
-    """Se encarga de mostrar la lista de contenedores de lxc, pero 
-    en caso de estar arrancados, como la ip tarda un rato en
-    aparecer, la funcion espera a que se haya cargado toda la
-    informacion para mostrar la lista. Comprueba que todas las ips
-    hayan aparecido"""
+        raise LxcError(f" El formato {format_} no es valido")
+    raw = _cached_query(
+        kind, cmd + ["--format", "json"], json.loads, fresh=fresh
+    )
+    records = [to_record(r) for r in raw]
+    if print_ or as_str:
+        if format_ == "yaml":
+            # No se genera a partir del json (no se usa pyyaml)
+            out = run(cmd + ["--format", "yaml"])[:-1]
+        else:
+            out = _render(raw, records, headers, format_)
+        if print_:
+            print(out)
+        if as_str:
+            return out
+    return records
+
+def lxc_names() -> list:
+    """Devuelve solo los nombres de los contenedores de lxc (pide a
+    lxc unicamente esa columna)"""
+    with _cache_lock:
+        if "list" in _cache:
+            return [raw["name"] for raw in _cache["list"]]
+    names = _cached_query(
+        "names", ["lxc", "list", "-c", "n", "--format", "csv"],
+        lambda out: [row[0] for row in csv.reader(io.StringIO(out)) if row]
+    )
+    return list(names)
+
+def lxc_list(print_:bool=False, format_:str="table", as_str=False,
+             fresh:bool=False) -> dict:
+    """Devuelve la informacion de los contenedores de lxc en forma de
+    diccionario {nombre: {NAME, STATE, IPV4 {eth: ip}, ...}} o la
+    tabla en forma de string si as_str es True. Con fresh se vuelve
+    a pedir a lxc aunque este en la cache (ej: para esperar a que
+    aparezcan las ips)"""
     cs_infolist = _lxc_generic_list(
-        ["lxc", "list"],
+        "list", ["lxc", "list"], _container_info, ContainerInfo.HEADERS,
         print_=print_, 
         format_=format_,
-        as_str=as_str
+        as_str=as_str,
+        fresh=fresh
     )
     if as_str: return cs_infolist
-    # Cambiamos la forma de presentar el diccionario
-    cs_infodict= {}
-    headers = ["NAME", "STATE", "IPV4", "IPV6", "TYPE", "SNAPSHOTS"]
-    for c_info in cs_infolist:
-        cs_infodict[c_info[0]] = dict(zip(headers, c_info))
-    # Modificamos la forma de presentar las networks ipv4
-    for name in cs_infodict:
-        info = cs_infodict[name]["IPV4"]
-        nets = {}
-        if info != "":
-            if type(info) != list:
-                info = [info]
-            for line in info:
-                splitted = re.split(r"\(| |\)", line)
-                while "" in splitted:
-                        splitted.remove("")
-                ipv4, current_eth = splitted
-                nets[current_eth] = ipv4
-        cs_infodict[name]["IPV4"] = nets
-    return cs_infodict
+    return {c_info.name: c_info.as_dict() for c_info in cs_infolist}
     
 def lxc_network_list(print_=False, format_="table", as_str=False) -> dict:
     """Muestra la network list de lxc (bridges creados)"""
     bgs_infolist = _lxc_generic_list(
-        ["lxc", "network", "list"],
+        "network", ["lxc", "network", "list"], 
+        _network_info, NetworkInfo.HEADERS,
         print_=print_, 
         format_=format_,
         as_str=as_str
     )
     if as_str: return bgs_infolist
-    # Cambiamos la forma de presentar el diccionario
-    bgs_infodict= {}
-    headers = ["NAME", "TYPE", "MANAGED", "DESCRIPTION", "USED BY"]
-    for b_info in bgs_infolist:
-        bgs_infodict[b_info[0]] = dict(zip(headers, b_info))
-    return bgs_infodict
+    return {b_info.name: b_info.as_dict() for b_info in bgs_infolist}
     
 
 def lxc_image_list(print_=False, format_="table", as_str=False) -> dict:
     image_infolist = _lxc_generic_list(
-        ["lxc", "image", "list"],
+        "image", ["lxc", "image", "list"], 
+        _image_info, ImageInfo.HEADERS,
         print_=print_, 
         format_=format_,
         as_str=as_str
     )
     if as_str: return image_infolist 
-    # Cambiamos la forma de presentar el diccionario
-    images_infodict= {}
-    headers = ["ALIAS", "FINGERPRINT", "PUBLIC", "DESCRIPTION",
-                    "ARCHITECTURE", "TYPE", "SIZE", "UPLOAD DATE"]
-    for im_info in image_infolist:
-        images_infodict[im_info[1]] = dict(zip(headers, im_info))
-    return images_infodict
+    return {
+        im_info.fingerprint: im_info.as_dict() 
+            for im_info in image_infolist
+    }
+
+def lxc_storage_list(print_=False, format_="table", as_str=False) -> dict:
+    """Muestra los pools de almacenamiento de lxc"""
+    pool_infolist = _lxc_generic_list(
+        "storage", ["lxc", "storage", "list"], 
+        _storage_info, StorageInfo.HEADERS,
+        print_=print_, 
+        format_=format_,
+        as_str=as_str
+    )
+    if as_str: return pool_infolist
+    return {p_info.name: p_info.as_dict() for p_info in pool_infolist}
+
+def lxc_default_pool() -> str:
+    """Devuelve el pool del perfil default (el que usan los 
+    contenedores creados sin indicar otro) o None si no tiene"""
+    raw = _cached_query(
+        "storage", ["lxc", "storage", "list", "--format", "json"], 
+        json.loads
+    )
+    for pool in raw:
+        if "/1.0/profiles/default" in (pool.get("used_by") or []):
+            return pool["name"]
+    return None
 
 def filter_lxc_table(table, *elements):
     splitted = table.split("\n")
@@ -190,59 +674,6 @@ def filter_lxc_table(table, *elements):
     return filtered_table
     
 # --------------------------------------------------------------------   
-def _process_lxccsv(string:str) -> list:
-    """Procesa un string csv devuelto por lxc.
-    
-     - NOTAS del csv que devuelve lxc:
-    Las celdas de mas de un elemento vienen con
-    un salto de linea entre elementos, no hay comas dentro, y el conjunto
-    viene entre comillas. Los cambios de linea del csv se marcan
-    con un salto de linea. Los strings de mas de una palabra 
-    vienen entre comillas (cuidado al hacer .split(",") si el string
-    tiene comas dentro, se fragmentara la celda).
-
-    Args:
-        string (str): csv a procesar
-
-    Returns:
-        list: Lista con las filas del documento csv
-    """
-    start = 0; mark = "#;#"; index = 0; pairs = []
-    while True:
-        for _ in range(2):
-            substring = string[start:]
-            index = substring.find('"')
-            start += index + 1
-            pairs.append(start)
-        if index == -1:
-            break
-        part_to_change = string[pairs[0]:pairs[1]-1]
-        new_part = part_to_change.replace(",", mark)
-        string = string.replace(part_to_change, new_part)
-        start += len(mark)
-        pairs = [] 
-    first_division = string.split(",")
-    rows = []
-    row = []
-    for elem in first_division:
-        # Procesamos las celdas con mas de un elemento
-        if '"' in elem and mark not in elem:
-            elem = re.split("\"|\n", elem)[1:-1]
-        # Procesamos los cambios de fila
-        elif "\n" in elem:
-            row_last_elem, elem = elem.split("\n")
-            if mark in row_last_elem:
-                row_last_elem = row_last_elem.replace(mark, ",")
-                row_last_elem = row_last_elem.replace('"', "")
-            if mark in elem:
-                elem = elem.replace(mark, ",")
-                elem = elem.replace('"', "")
-            row.append(row_last_elem)
-            rows.append(row)
-            row = []
-        row.append(elem)
-    return rows
-
 def _process_lxctable(string:str) -> dict:
     """Analiza una lista de lxc y proporciona toda su informacion 
     en forma de diccionario para que sea facilmente accesible.
@@ -16,6 +16,12 @@ class Bridge:
                 tener el bridge y el identificador de red que van a 
                 tener las ips de los contenedores que se conecten al el
         """
+    # Se guarda en el registro como una tupla (version, atributos...)
+    __slots__ = (
+        "name", "ipv4_nat", "ipv4_addr", "ipv6_nat", "ipv6_addr", "used_by"
+    )
+    RECORD_VERSION = 1
+
     def __init__(self, name:str,
                  ipv4_nat:bool=False, ipv4_addr:str=None,
                  ipv6_nat:bool=False, ipv6_addr:str=None):
@@ -25,6 +31,21 @@ class Bridge:
         self.ipv6_nat = "true" if ipv6_nat == True else "false"
         self.ipv6_addr = ipv6_addr if ipv6_addr != None else "none"
         self.used_by = []
+
+    def __getstate__(self) -> tuple:
+        return (self.RECORD_VERSION,) + tuple(
+            getattr(self, field) for field in self.__slots__
+        )
+
+    def __setstate__(self, state):
+        # Los bridges guardados antes de usar slots tienen sus
+        # atributos en un diccionario
+        if type(state) == dict:
+            values = [state.get(field) for field in self.__slots__]
+        else:
+            values = state[1:]
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
   
     def add_container(self, cs_name:str, with_eth:str):
         """Añade un contenedor a la red del bridge
@@ -1,8 +1,12 @@
 
+import io
+import os
+import tarfile
+import importlib
 from contextlib import suppress
 from time import sleep
 
-from ...lxc import lxc
+from ...lxc import lxc, readiness
 from ..lxc import LxcError
 
 # Posibles estados de los contenedores
@@ -12,6 +16,88 @@ FROZEN = "FROZEN"
 RUNNING = "RUNNING"
 DELETED = "DELETED"
 
+# --------------------------------------------------------------------
+# Los contenedores se guardan en el registro de forma compacta: los
+# atributos estan definidos con __slots__ (sin __dict__) y se
+# serializan como una tupla (version, valor1, valor2, ...) en el orden
+# de record_fields(). Las subclases (roles) añaden sus propios slots
+# al final. Si se añaden campos nuevos se incrementa RECORD_VERSION y
+# los registros antiguos (tuplas mas cortas) toman el valor por
+# defecto de FIELD_DEFAULTS
+# --------------------------------------------------------------------
+def _rebuild(module:str, cls_name:str, state:tuple):
+    """Reconstruye un contenedor guardado en el registro"""
+    cls = getattr(importlib.import_module(module), cls_name)
+    obj = cls.__new__(cls)
+    obj.__setstate__(state)
+    return obj
+
+# --------------------------------------------------------------------
+# Las carpetas se envian a los contenedores empaquetadas en un tar
+# (push_tar). members es una lista [(ruta en el anfitrion, ruta dentro
+# del tar)]
+# --------------------------------------------------------------------
+def _arcname(dir_path:str) -> str:
+    return os.path.basename(os.path.normpath(dir_path))
+
+def _tar_writer(members:list, compress:bool=False):
+    """Devuelve una funcion que escribe el tar en el fichero (stdin)
+    que se le pase, a la vez que lo empaqueta"""
+    mode = "w|gz" if compress else "w|"
+    def write(stdin):
+        with tarfile.open(fileobj=stdin, mode=mode) as tar:
+            for path, arcname in members:
+                tar.add(path, arcname=arcname)
+    return write
+
+def pack_tar(members:list, compress:bool=False) -> bytes:
+    """Empaqueta un tar en memoria para poder enviarselo a varios
+    contenedores (push_tar) sin volver a empaquetarlo"""
+    out = io.BytesIO()
+    _tar_writer(members, compress)(out)
+    return out.getvalue()
+
+# --------------------------------------------------------------------
+def _run_many(cs:list, check, cmd:list, options:list, 
+              new_state:str) -> dict:
+    errors = {}; targets = []
+    for c in cs:
+        try:
+            check(c)
+            targets.append(c)
+        except LxcError as err:
+            errors[c.name] = err
+    if len(targets) == 0: return errors
+    names = [c.name for c in targets]
+    try:
+        lxc.run(cmd + names + options)
+        done = names
+    except LxcError as err:
+        # Vemos con la lista de lxc cuales lo han conseguido y a cada
+        # uno de los otros le asignamos su linea de error (si la hay)
+        states = {
+            name: info["STATE"] for name, info in lxc.lxc_list().items()
+        }
+        done = []
+        for c in targets:
+            if states.get(c.name, DELETED) == new_state:
+                done.append(c.name)
+                continue
+            lines = [
+                l.split(f"{c.name}: ", 1)[1]
+                    for l in str(err).replace("-> ", "\n").split("\n")
+                    if l.startswith(f"{c.name}: ")
+            ]
+            msg = str(err) if len(lines) == 0 else "\n".join(lines)
+            errors[c.name] = LxcError(f" {c.tag} '{c.name}': {msg}")
+    for c in targets:
+        if c.name not in done: continue
+        c.state = new_state
+        if new_state != RUNNING:
+            c.started_up = False
+    return errors
+
+# --------------------------------------------------------------------
 class Container:
     """Clase envoltorio que permite controlar un contenedor de lxc
 
@@ -22,6 +108,13 @@ class Container:
             tag (str, optional): Tag para diferenciar la funcionalidad
                 de cada contenedor
         """
+    __slots__ = (
+        "name", "base_image", "state", "started_up", "tag",
+        "networks", "connected_networks", "config_error"
+    )
+    RECORD_VERSION = 1
+    FIELD_DEFAULTS = {"config_error": False}
+
     def __init__(self, name:str, base_image:str, tag:str=""):
         self.name = str(name)
         self.base_image = base_image
@@ -30,6 +123,44 @@ class Container:
         self.tag = tag
         self.networks = {}
         self.connected_networks = {}
+        self.config_error = False
+
+    @classmethod
+    def record_fields(cls) -> tuple:
+        """Devuelve los atributos del contenedor (los de la clase
+        base primero)"""
+        fields = ()
+        for klass in reversed(cls.__mro__):
+            fields += klass.__dict__.get("__slots__", ())
+        return fields
+
+    def __getstate__(self) -> tuple:
+        return (self.RECORD_VERSION,) + tuple(
+            getattr(self, field) for field in self.record_fields()
+        )
+
+    def __setstate__(self, state):
+        fields = self.record_fields()
+        defaults = {}
+        for klass in reversed(type(self).__mro__):
+            defaults.update(klass.__dict__.get("FIELD_DEFAULTS", {}))
+        if type(state) == dict:
+            # Atributos de un contenedor guardado antes de usar slots
+            values = [state.get(field, defaults.get(field)) for field in fields]
+        else:
+            version, values = state[0], list(state[1:])
+            if version > self.RECORD_VERSION:
+                err = (f" El registro del contenedor tiene una version " +
+                       f"({version}) mas reciente que la del programa")
+                raise LxcError(err)
+            values += [defaults.get(field) for field in fields[len(values):]]
+        for field, value in zip(fields, values):
+            setattr(self, field, value)
+
+    def __reduce__(self):
+        cls = type(self)
+        state = self.__getstate__()
+        return (_rebuild, (cls.__module__, cls.__qualname__, state))
         
     def execute(self, cmd:list, stdout=True, stderr=True):
         """Ejecuta un comando en el interior del contenedor
@@ -41,6 +172,14 @@ class Container:
         cmd = ["lxc", "exec", self.name, "--"] + cmd
         out = lxc.run(cmd, stdout=stdout, stderr=stderr)  
         return out  
+
+    async def execute_async(self, cmd:list, stdout=True, stderr=True):
+        """Version asincrona de execute()"""
+        await self.wait_for_startup_async()
+        cmd = ["lxc", "exec", self.name, "--"] + cmd
+        return await lxc.run_async(
+            cmd, stdout=stdout, stderr=stderr, container=self.name
+        )
         
     def add_to_network(self, eth:str, with_ip:str=None):
         """Añade una tarjeta de red para conectarse a una red (se 
@@ -72,6 +211,34 @@ class Container:
                 eth, "ipv4.address", self.networks[eth]]
         lxc.run(cmd)
         self.connected_networks[eth] = True
+
+    def add_device(self, device:str, type_:str, **config):
+        """Añade un dispositivo al contenedor (se puede hacer tanto si
+        esta arrancado como si no)
+
+        Args:
+            device (str): Nombre del dispositivo
+            type_ (str): Tipo de dispositivo de LXD (disk, nic...)
+            config: Configuracion del dispositivo. Ej: para montar una
+                carpeta del anfitrion en modo lectura -> source=...,
+                path=..., readonly=True
+        """
+        cmd = ["lxc", "config", "device", "add", self.name, device, type_]
+        for key, value in config.items():
+            if type(value) == bool: value = str(value).lower()
+            cmd.append(f"{key}={value}")
+        lxc.run(cmd)
+
+    def remove_device(self, device:str):
+        """Elimina un dispositivo del contenedor"""
+        lxc.run(["lxc", "config", "device", "remove", self.name, device])
+
+    async def remove_device_async(self, device:str):
+        """Version asincrona de remove_device()"""
+        await lxc.run_async(
+            ["lxc", "config", "device", "remove", self.name, device],
+            container=self.name
+        )
     
     def open_terminal(self):
         """Abre la terminal del contenedor (utiliza 
@@ -89,16 +256,33 @@ class Container:
             "-fg", "green", "-e", f"lxc exec {self.name} bash"
         ])
                 
+    # Orden para saber si el sistema del contenedor ha arrancado
+    _ask_if_running = ["systemctl", "is-system-running"]
+
     def refresh(self):
         if self.state != RUNNING: 
             self.started_up = False
             return
         cmd = ["lxc", "exec", self.name, "--"]
-        ask_if_running = ["systemctl", "is-system-running"]
         try:
-            out = lxc.run(cmd + ask_if_running, stderr=False)
+            out = lxc.run(cmd + self._ask_if_running, stderr=False)
         except LxcError as err:
             out = str(err)
+        self._set_started_up(out)
+
+    async def refresh_async(self):
+        """Version asincrona de refresh()"""
+        if self.state != RUNNING: 
+            self.started_up = False
+            return
+        cmd = ["lxc", "exec", self.name, "--"] + self._ask_if_running
+        try:
+            out = await lxc.run_async(cmd, stderr=False, container=self.name)
+        except LxcError as err:
+            out = str(err)
+        self._set_started_up(out)
+
+    def _set_started_up(self, out:str):
         state = out.strip()
         risky_cond = state == "starting"
         if state == "running" or state == "degraded" or risky_cond:
@@ -106,19 +290,25 @@ class Container:
             return
         self.started_up = False
                 
-    def wait_for_startup(self):
+    def wait_for_startup(self, timeout:float=None):
         """Espera a que el contenedor haya terminado de arrancarse
         por completo. (Que todos los archivos, carpetas y
         configuraciones del contenedor hayan finalizado). Es util
         para cuando se quiere realizar operaciones nada mas se 
         hace un start del contenedor (puede haber fallos si no todos
         los archivos se han creado o no todo ha acabado de 
-        configurarse)"""
+        configurarse). Para esperar a varios a la vez se puede usar
+        readiness.wait_ready()"""
+        readiness.wait_ready(self, timeout=timeout)
+
+    async def wait_for_startup_async(self, timeout:float=None):
+        """Version asincrona de wait_for_startup()"""
+        await readiness.wait_ready_async(self, timeout=timeout)
+
+    def _check_running(self):
         if self.state != RUNNING: 
             err = (f"El contenedor '{self.name}' no se ha arrancado")
             raise LxcError(err)
-        while not self.started_up:
-            self.refresh()
     
     def update_apt(self):
         self.execute(["apt-get","update"])
@@ -137,13 +327,130 @@ class Container:
         lxc.run(cmd)
 
     def push(self, file:str, to_path:str):
+        """Envia un fichero o una carpeta al contenedor. Las carpetas
+        se envian con push_dir()"""
+        if os.path.isdir(file):
+            self.push_dir(file, to_path)
+            return
+        self.wait_for_startup()
+        lxc.run(self._push_cmd(file, to_path))
+
+    async def push_async(self, file:str, to_path:str):
+        """Version asincrona de push()"""
+        if os.path.isdir(file):
+            await self.push_dir_async(file, to_path)
+            return
+        await self.wait_for_startup_async()
+        await lxc.run_async(
+            self._push_cmd(file, to_path), container=self.name
+        )
+
+    def push_dir(self, dir_path:str, to_path:str, compress:bool=False):
+        """Envia una carpeta al contenedor en una sola transferencia
+        (en vez de un envio por fichero como 'lxc file push -r'). La
+        carpeta se empaqueta en un tar a la vez que se le pasa por
+        stdin a 'tar -x' dentro del contenedor. Igual que con push, 
+        la carpeta se crea dentro de to_path
+
+        Args:
+            dir_path (str): Carpeta a enviar
+            to_path (str): Carpeta del contenedor donde se deja
+            compress (bool, optional): Si se comprime con gzip (solo
+                compensa si los ficheros se comprimen bien y la
+                conexion con LXD es lenta)
+        """
+        members = [(dir_path, _arcname(dir_path))]
+        self.push_tar(_tar_writer(members, compress), to_path, compress)
+
+    async def push_dir_async(self, dir_path:str, to_path:str, 
+                             compress:bool=False):
+        """Version asincrona de push_dir()"""
+        members = [(dir_path, _arcname(dir_path))]
+        await self.push_tar_async(
+            _tar_writer(members, compress), to_path, compress
+        )
+
+    def push_files(self, base_dir:str, files:list, to_path:str, 
+                   compress:bool=False):
+        """Envia solo algunos ficheros de una carpeta en una sola 
+        transferencia (igual que push_dir). Cada fichero se deja en 
+        to_path con su misma ruta relativa a base_dir
+
+        Args:
+            base_dir (str): Carpeta en la que estan los ficheros
+            files (list): Rutas de los ficheros relativas a base_dir
+            to_path (str): Carpeta del contenedor donde se dejan
+            compress (bool, optional): Si se comprime con gzip
+        """
+        members = [(os.path.join(base_dir, f), f) for f in files]
+        self.push_tar(_tar_writer(members, compress), to_path, compress)
+
+    def push_tar(self, tar, to_path:str, compress:bool=False):
+        """Extrae un tar en la carpeta to_path del contenedor
+
+        Args:
+            tar (bytes | callable): Tar ya empaquetado (pack_tar) o
+                funcion que lo va escribiendo en el stdin que recibe
+            to_path (str): Carpeta del contenedor donde se extrae
+            compress (bool, optional): Si el tar esta comprimido con
+                gzip
+        """
         self.wait_for_startup()
+        lxc.run(self._untar_cmd(to_path, compress), input=tar)
+
+    async def push_tar_async(self, tar, to_path:str, compress:bool=False):
+        """Version asincrona de push_tar()"""
+        await self.wait_for_startup_async()
+        await lxc.run_async(
+            self._untar_cmd(to_path, compress), input=tar,
+            container=self.name
+        )
+
+    def _untar_cmd(self, to_path:str, compress:bool) -> list:
+        if not to_path.startswith("/"):
+            to_path = "/" + to_path
+        tar_flags = "-xzf" if compress else "-xf"
+        return ["lxc", "exec", self.name, "--", 
+                    "tar", tar_flags, "-", "-C", to_path]
+
+    def push_bytes(self, data, dest_path:str, mode:int=0o644):
+        """Crea (o sustituye) un fichero del contenedor con el
+        contenido que se le pasa, sin crear ficheros temporales en el
+        anfitrion ('lxc file push -' con el contenido por stdin)
+
+        Args:
+            data (bytes | str): Contenido del fichero
+            dest_path (str): Ruta del fichero en el contenedor
+            mode (int, optional): Permisos del fichero (propietario
+                root)
+        """
+        self.wait_for_startup()
+        data, cmd = self._push_bytes_args(data, dest_path, mode)
+        lxc.run(cmd, input=data)
+
+    async def push_bytes_async(self, data, dest_path:str, 
+                               mode:int=0o644):
+        """Version asincrona de push_bytes()"""
+        await self.wait_for_startup_async()
+        data, cmd = self._push_bytes_args(data, dest_path, mode)
+        await lxc.run_async(cmd, input=data, container=self.name)
+
+    def _push_bytes_args(self, data, dest_path:str, mode:int) -> tuple:
+        if type(data) == str:
+            data = data.encode()
+        if dest_path.startswith("/"):
+            dest_path = dest_path[1:]
+        cmd = ["lxc", "file", "push", "-", f"{self.name}/{dest_path}",
+                "--mode", f"{mode:04o}", "--uid", "0", "--gid", "0"]
+        return data, cmd
+
+    def _push_cmd(self, file:str, to_path:str) -> list:
         if to_path.startswith("/"):
             to_path = to_path[1:]
         c_path = f"{self.name}/{to_path}"
         #"-r" se añade para que se haga de forma recursiva por si 
         # se pasa una carpeta en vez de un fichero
-        lxc.run(["lxc", "file", "push", "-r", file, c_path])
+        return ["lxc", "file", "push", "-r", file, c_path]
     
     def pull(self, file_path:str, in_path:str):
         # Se puede introducir en file "." para que se descarguen todos 
@@ -162,21 +469,76 @@ class Container:
         Raises:
             LxcError: Si el contenedor ya se ha iniciado
         """
+        self._check_init()
+        lxc.run(
+            ["lxc", "init", self.base_image, self.name] + lxc.storage_args()
+        )  
+        self.state = STOPPED
+        # Se limitan los recursos del contenedor 
+        for l in self._limits: 
+            with suppress(LxcError):
+                lxc.run(["lxc", "config", "set", self.name] + self._limits[l])
+
+    async def init_async(self):
+        """Version asincrona de init()"""
+        self._check_init()
+        await lxc.run_async(
+            ["lxc", "init", self.base_image, self.name] + lxc.storage_args(),
+            container=self.name
+        )
+        self.state = STOPPED
+        for l in self._limits: 
+            with suppress(LxcError):
+                await lxc.run_async(
+                    ["lxc", "config", "set", self.name] + self._limits[l],
+                    container=self.name
+                )
+
+    def copy(self, source:str):
+        """Crea el contenedor copiando otro (parado) en vez de desde
+        su imagen. En almacenamientos btrfs/zfs la copia es un clon
+        (copy-on-write) casi instantaneo
+
+        Args:
+            source (str): Nombre del contenedor que se copia
+
+        Raises:
+            LxcError: Si el contenedor ya se ha iniciado
+        """
+        self._check_init()
+        lxc.run(["lxc", "copy", source, self.name] + lxc.storage_args())
+        self.state = STOPPED
+        for l in self._limits: 
+            with suppress(LxcError):
+                lxc.run(["lxc", "config", "set", self.name] + self._limits[l])
+
+    async def copy_async(self, source:str):
+        """Version asincrona de copy()"""
+        self._check_init()
+        await lxc.run_async(
+            ["lxc", "copy", source, self.name] + lxc.storage_args(),
+            container=self.name
+        )
+        self.state = STOPPED
+        for l in self._limits: 
+            with suppress(LxcError):
+                await lxc.run_async(
+                    ["lxc", "config", "set", self.name] + self._limits[l],
+                    container=self.name
+                )
+
+    # Limites de recursos de los contenedores
+    _limits = {
+        "cpu": ["limits.cpu.allowance", "40ms/200ms"], 
+        "memory": ["limits.memory", "1024MB"],
+        "cores": ["limits.cpu", "2"]
+    }
+
+    def _check_init(self):
         if self.state != NOT_INIT:
             err = (f" {self.tag} '{self.name}' esta '{self.state}' " +
                                 "y no puede ser inicializado de nuevo")
             raise LxcError(err)
-        lxc.run(["lxc", "init", self.base_image, self.name])  
-        self.state = STOPPED
-        # Se limitan los recursos del contenedor 
-        limits = {
-            "cpu": ["limits.cpu.allowance", "40ms/200ms"], 
-            "memory": ["limits.memory", "1024MB"],
-            "cores": ["limits.cpu", "2"]
-        }
-        for l in limits: 
-            with suppress(LxcError):
-                lxc.run(["lxc", "config", "set", self.name] + limits[l])
                 
     def restart(self):
         if self.state != RUNNING:
@@ -192,6 +554,17 @@ class Container:
             LxcError: Si ya esta arrancado
             LxcError: Si no se puede arrancar
         """
+        self._check_start()
+        lxc.run(["lxc", "start", self.name])  
+        self.state = RUNNING
+
+    async def start_async(self):
+        """Version asincrona de start()"""
+        self._check_start()
+        await lxc.run_async(["lxc", "start", self.name], container=self.name)
+        self.state = RUNNING
+
+    def _check_start(self):
         if self.state == RUNNING:
             err = f" {self.tag} '{self.name}' ya esta arrancado"
             raise LxcError(err)
@@ -199,8 +572,6 @@ class Container:
             err = (f" {self.tag} '{self.name}' esta " +
                         f"'{self.state}' y no puede ser arrancado")
             raise LxcError(err)
-        lxc.run(["lxc", "start", self.name])  
-        self.state = RUNNING
         
     def stop(self):
         """Para el contenedor
@@ -209,6 +580,21 @@ class Container:
             LxcError: Si ya esta parado
             LxcError: Si no puede pararse
         """
+        self._check_stop()
+        lxc.run(["lxc", "stop", self.name, "--force"])  
+        self.state = STOPPED
+        self.started_up = False
+
+    async def stop_async(self):
+        """Version asincrona de stop()"""
+        self._check_stop()
+        await lxc.run_async(
+            ["lxc", "stop", self.name, "--force"], container=self.name
+        )
+        self.state = STOPPED
+        self.started_up = False
+
+    def _check_stop(self):
         if self.state == STOPPED:
             err = (f" {self.tag} '{self.name}' ya esta detenido")
             raise LxcError(err)
@@ -216,9 +602,6 @@ class Container:
             err = (f" {self.tag} '{self.name}' esta " +
                         f"'{self.state}' y no puede ser detenido")
             raise LxcError()
-        lxc.run(["lxc", "stop", self.name, "--force"])  
-        self.state = STOPPED
-        self.started_up = False
         
     def delete(self):
         """Elimina el contenedor
@@ -226,13 +609,23 @@ class Container:
         Raises:
             LxcError: Si no esta parado 
         """
+        self._check_delete()
+        lxc.run(["lxc", "delete", self.name])  
+        self.state = DELETED
+        self.started_up = False
+
+    async def delete_async(self):
+        """Version asincrona de delete()"""
+        self._check_delete()
+        await lxc.run_async(["lxc", "delete", self.name], container=self.name)
+        self.state = DELETED
+        self.started_up = False
+
+    def _check_delete(self):
         if self.state != STOPPED:
             err = (f" {self.tag} '{self.name}' esta " +
                         f"'{self.state}' y no puede ser eliminado")
             raise LxcError(err)
-        lxc.run(["lxc", "delete", self.name])  
-        self.state = DELETED
-        self.started_up = False
     
     def pause(self):
         """Pausa el contenedor
@@ -241,6 +634,12 @@ class Container:
             LxcError: Si ya esta pausado
             LxcError: Si no se puede pausar
         """
+        self._check_pause()
+        lxc.run(["lxc", "pause", self.name])  
+        self.state = FROZEN
+        self.started_up = False
+
+    def _check_pause(self):
         if self.state == FROZEN:
             err = (f" {self.tag} '{self.name}' ya esta pausado")
             raise LxcError(err)
@@ -248,9 +647,39 @@ class Container:
             err = (f" {self.tag} '{self.name}' esta " +
                         f"'{self.state}' y no puede ser pausado")
             raise LxcError(err)
-        lxc.run(["lxc", "pause", self.name])  
-        self.state = FROZEN
-        self.started_up = False
+
+    # ----------------------------------------------------------------
+    # Operaciones sobre varios contenedores con una sola orden de lxc
+    # (lxc start c1 c2 ...). Devuelven {nombre: error} de los que no
+    # se han podido completar y actualizan el estado del resto
+    # ----------------------------------------------------------------
+    @staticmethod
+    def start_many(cs:list) -> dict:
+        """Arranca varios contenedores a la vez"""
+        return _run_many(
+            cs, Container._check_start, ["lxc", "start"], [], RUNNING
+        )
+
+    @staticmethod
+    def stop_many(cs:list) -> dict:
+        """Detiene varios contenedores a la vez"""
+        return _run_many(
+            cs, Container._check_stop, ["lxc", "stop"], ["--force"], STOPPED
+        )
+
+    @staticmethod
+    def pause_many(cs:list) -> dict:
+        """Pausa varios contenedores a la vez"""
+        return _run_many(
+            cs, Container._check_pause, ["lxc", "pause"], [], FROZEN
+        )
+
+    @staticmethod
+    def delete_many(cs:list) -> dict:
+        """Elimina varios contenedores a la vez"""
+        return _run_many(
+            cs, Container._check_delete, ["lxc", "delete"], [], DELETED
+        )
     
     def __str__(self):
         """Define como se va a representar el contenedor en forma
@@ -0,0 +1,484 @@
+import os
+import re
+import json
+import select
+import socket
+import threading
+import http.client
+from urllib.parse import quote
+
+# ------------------------ CLIENTE API LXD ---------------------------
+# --------------------------------------------------------------------
+# Cliente de la API REST de LXD a traves de su socket unix. Evita
+# tener que arrancar el binario 'lxc' (decenas de milisegundos por
+# orden) para las operaciones que mas se usan: listas, ciclo de vida
+# de los contenedores, configuracion, networks, publish, exec y
+# ficheros sueltos. Cada hilo mantiene abierta su propia conexion
+# HTTP/1.1 (keep-alive) y la reutiliza en todas las peticiones
+# --------------------------------------------------------------------
+# La entrada es la misma orden de lxc que se le pasaria a la consola
+# (["lxc", "start", "s1"]). run() devuelve None si la orden no se
+# puede traducir a la API (imagenes remotas, copias recursivas...)
+# y en ese caso se debe ejecutar con el binario 'lxc'
+# --------------------------------------------------------------------
+
+# Ubicaciones habituales del socket de LXD (snap y paquete)
+SOCKET_PATHS = [
+    "/var/snap/lxd/common/lxd/unix.socket",
+    "/var/lib/lxd/unix.socket"
+]
+API = "/1.0"
+_FINGERPRINT = re.compile(r"[0-9a-f]{12,64}")
+# Entorno con el que 'lxc exec' ejecuta las ordenes (como root y sin
+# terminal). TERM se pasa solo si lo tiene el anfitrion
+EXEC_ENV = {
+    "PATH": "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:" +
+            "/sbin:/bin:/snap/bin",
+    "HOME": "/root",
+    "USER": "root",
+    "LANG": "C.UTF-8"
+}
+# --------------------------------------------------------------------
+class LxdApiError(Exception):
+    """Error devuelto por la API de LXD"""
+    pass
+
+class LxdConnectionLost(LxdApiError):
+    """Se ha perdido la conexion despues de enviar una peticion que 
+    modifica algo (no se sabe si LXD la ha ejecutado)"""
+    pass
+
+# --------------------------------------------------------------------
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path:str, timeout:float=None):
+        super().__init__("lxd", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+# --------------------------------------------------------------------
+def find_socket(socket_path:str=None) -> str:
+    """Devuelve la ruta del socket de LXD si existe y se puede usar.
+    Por orden: la indicada, la variable de entorno LXD_SOCKET (o
+    LXD_DIR/unix.socket) y las ubicaciones habituales"""
+    candidates = [socket_path, os.environ.get("LXD_SOCKET")]
+    if "LXD_DIR" in os.environ:
+        candidates.append(os.path.join(os.environ["LXD_DIR"], "unix.socket"))
+    candidates += SOCKET_PATHS
+    for path in candidates:
+        if path is None: continue
+        if os.path.exists(path) and os.access(path, os.R_OK | os.W_OK):
+            return path
+    return None
+
+# --------------------------------------------------------------------
+class LxdClient:
+    """Cliente de la API de LXD
+
+        Args:
+            socket_path (str): Ruta del socket unix de LXD
+        """
+    def __init__(self, socket_path:str):
+        self.socket_path = socket_path
+        self._local = threading.local()
+
+    def _connection(self) -> _UnixHTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and conn.sock is not None:
+            # Si LXD ha cerrado la conexion guardada (keep-alive) el
+            # socket se puede leer (EOF) sin haber pedido nada
+            if select.select([conn.sock], [], [], 0)[0]:
+                self.close()
+                conn = None
+        if conn is None:
+            conn = _UnixHTTPConnection(self.socket_path)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def request(self, method:str, path:str, body=None,
+                headers:dict=None) -> tuple:
+        """Realiza una peticion y devuelve (respuesta, cuerpo). Las
+        conexiones que LXD ya ha cerrado se descartan antes de enviar
+        nada. Si aun asi falla, solo se reintentan (con una conexion
+        nueva) las peticiones GET: el resto (crear contenedores, exec,
+        publish...) podria haberse ejecutado ya
+
+        Raises:
+            OSError: Si no se ha podido conectar con LXD sin haber 
+                enviado antes nada que modifique algo en la orden
+            LxdConnectionLost: Si falla despues de haberlo enviado
+        """
+        headers = dict(headers or {})
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                if conn.sock is None: conn.connect()
+            except OSError as err:
+                self.close()
+                if not getattr(self._local, "sent", False): raise
+                raise LxdConnectionLost(f"LXD connection lost: {err}")
+            if method != "GET": self._local.sent = True
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                return response, response.read()
+            except (http.client.HTTPException, OSError) as err:
+                self.close()
+                if method == "GET":
+                    if attempt == 0: continue
+                    # Una orden que solo consulta se puede repetir
+                    if not getattr(self._local, "sent", False): 
+                        raise ConnectionError(str(err)) from err
+                raise LxdConnectionLost(f"LXD connection lost: {err}")
+
+    def call(self, method:str, path:str, body=None, wait:bool=True) -> dict:
+        """Realiza una peticion a la API y devuelve el campo metadata
+        de la respuesta. Si la operacion es asincrona espera a que
+        termine (wait)
+
+        Raises:
+            LxdApiError: Si LXD devuelve un error
+        """
+        data = self._send(method, path, body)
+        if data.get("type") == "async" and wait:
+            return self.wait(data["operation"])
+        return data.get("metadata")
+
+    def submit(self, method:str, path:str, body=None) -> str:
+        """Lanza una peticion sin esperar a que termine la operacion.
+        Devuelve la operacion (para wait) o None si ya ha terminado"""
+        data = self._send(method, path, body)
+        if data.get("type") == "async":
+            return data["operation"]
+        return None
+
+    def _send(self, method:str, path:str, body=None) -> dict:
+        response, raw = self.request(method, path, body=body)
+        data = json.loads(raw)
+        if data.get("type") == "error":
+            raise LxdApiError(data.get("error", f"HTTP {response.status}"))
+        return data
+
+    def wait(self, operation:str) -> dict:
+        metadata = self.call("GET", operation + "/wait")
+        if metadata.get("status_code") != 200:
+            raise LxdApiError(metadata.get("err") or metadata.get("status"))
+        return metadata
+
+    # ----------------------------------------------------------------
+    def run(self, cmd:list, input:bytes=None) -> tuple:
+        """Ejecuta una orden de lxc a traves de la API
+
+        Args:
+            cmd (list): Orden de lxc (["lxc", ...])
+            input (bytes, optional): Lo que recibiria la orden por
+                stdin (solo para 'lxc file push -')
+
+        Returns:
+            tuple: (codigo de salida, stdout, stderr) como los daria la
+                orden de consola o None si no se puede traducir
+        """
+        if len(cmd) < 2 or cmd[0] != "lxc": return None
+        handler = getattr(self, "_cmd_" + cmd[1], None)
+        if handler is None: return None
+        if input is not None and cmd[1] != "file": return None
+        # Si se pierde la conexion despues de enviar algo que modifica
+        # la orden ya no se puede repetir con la consola
+        self._local.sent = False
+        try:
+            if input is not None:
+                return handler(cmd[2:], input=input)
+            return handler(cmd[2:])
+        except LxdApiError as err:
+            return 1, "", f"Error: {err}\n"
+
+    def _instance(self, name:str) -> str:
+        return f"{API}/instances/{quote(name)}"
+
+    def _state(self, names:list, action:str, force:bool=False):
+        if any(n.startswith("-") for n in names): return None
+        body = {"action": action, "timeout": -1, "force": force}
+        return self._batch(names, action, "PUT", "/state", body)
+
+    def _batch(self, names:list, verb:str, method:str, 
+               subpath:str="", body=None) -> tuple:
+        """Lanza la misma operacion sobre varios contenedores a la vez
+        (LXD las ejecuta en paralelo) y espera a que terminen todas.
+        Los errores se devuelven como los da la consola: una linea por
+        contenedor (nombre: error: ...)"""
+        if len(names) == 0: return None
+        ops = {}; errors = {}
+        for name in names:
+            try:
+                ops[name] = self.submit(
+                    method, self._instance(name) + subpath, body
+                )
+            except LxdApiError as err:
+                errors[name] = err
+        for name, op in ops.items():
+            if op is None: continue
+            try:
+                self.wait(op)
+            except LxdApiError as err:
+                errors[name] = err
+        if len(errors) == 0:
+            return 0, "", ""
+        if len(names) == 1:
+            return 1, "", f"Error: {errors[names[0]]}\n"
+        lines = "".join(f"{n}: error: {err}\n" for n, err in errors.items())
+        return 1, "", lines + f"Error: Some instances failed to {verb}\n"
+
+    def _cmd_list(self, args:list) -> tuple:
+        if args == ["--format", "json"]:
+            instances = self.call("GET", f"{API}/instances?recursion=2")
+            return 0, json.dumps(instances), ""
+        if args == ["-c", "n", "--format", "csv"]:
+            urls = self.call("GET", f"{API}/instances")
+            names = [url.rsplit("/", 1)[-1] for url in urls]
+            return 0, "".join(f"{n}\n" for n in names), ""
+        return None
+
+    def _cmd_init(self, args:list) -> tuple:
+        args, body = self._pool_body(args)
+        if len(args) != 2: return None
+        image, name = args
+        # Las imagenes remotas (remote:alias) las descarga la consola
+        if ":" in image: return None
+        if _FINGERPRINT.fullmatch(image):
+            source = {"type": "image", "fingerprint": image}
+        else:
+            source = {"type": "image", "alias": image}
+        body.update({"name": name, "source": source})
+        self.call("POST", f"{API}/instances", body)
+        return 0, "", ""
+
+    def _cmd_copy(self, args:list) -> tuple:
+        args, body = self._pool_body(args)
+        if len(args) != 2: return None
+        source, name = args
+        if ":" in source or "/" in source: return None
+        source = {"type": "copy", "source": source}
+        body.update({"name": name, "source": source})
+        self.call("POST", f"{API}/instances", body)
+        return 0, "", ""
+
+    def _pool_body(self, args:list) -> tuple:
+        """Quita de los argumentos el pool (-s pool) y lo convierte en
+        el disco raiz del contenedor, como hace la consola"""
+        if "-s" not in args: return args, {}
+        i = args.index("-s")
+        if i + 1 >= len(args): return args, {}
+        pool = args[i + 1]
+        root = {"type": "disk", "path": "/", "pool": pool}
+        return args[:i] + args[i+2:], {"devices": {"root": root}}
+
+    def _cmd_start(self, args:list) -> tuple:
+        return self._state(args, "start")
+
+    def _cmd_stop(self, args:list) -> tuple:
+        force = "--force" in args
+        args = [a for a in args if a != "--force"]
+        return self._state(args, "stop", force=force)
+
+    def _cmd_restart(self, args:list) -> tuple:
+        return self._state(args, "restart")
+
+    def _cmd_pause(self, args:list) -> tuple:
+        return self._state(args, "freeze")
+
+    def _cmd_delete(self, args:list) -> tuple:
+        if any(a.startswith("-") for a in args): return None
+        return self._batch(args, "delete", "DELETE")
+
+    def _cmd_config(self, args:list) -> tuple:
+        if len(args) == 4 and args[0] == "set":
+            _, name, key, value = args
+            self.call("PATCH", self._instance(name), {"config": {key: value}})
+            return 0, "", ""
+        if len(args) == 6 and args[:2] == ["device", "set"]:
+            _, _, name, device, key, value = args
+            devices = self.call("GET", self._instance(name))["devices"]
+            if device not in devices:
+                raise LxdApiError(f"Device doesn't exist: {device}")
+            devices[device][key] = value
+            body = {"devices": {device: devices[device]}}
+            self.call("PATCH", self._instance(name), body)
+            return 0, "", ""
+        if len(args) >= 5 and args[:2] == ["device", "add"]:
+            _, _, name, device, type_ = args[:5]
+            if any("=" not in a for a in args[5:]): return None
+            config = dict(a.split("=", 1) for a in args[5:])
+            config["type"] = type_
+            body = {"devices": {device: config}}
+            instance = self.call("GET", self._instance(name))
+            if device in instance["devices"]:
+                raise LxdApiError("The device already exists")
+            self.call("PATCH", self._instance(name), body)
+            return 0, "", ""
+        if len(args) == 4 and args[:2] == ["device", "remove"]:
+            _, _, name, device = args
+            instance = self.call("GET", self._instance(name))
+            if device not in instance["devices"]:
+                raise LxdApiError(f"Device doesn't exist: {device}")
+            # PATCH no puede quitar dispositivos: se sustituye la
+            # configuracion entera sin el
+            instance["devices"].pop(device)
+            writable = ("architecture", "config", "devices", "ephemeral",
+                        "profiles", "stateful", "description")
+            body = {key: instance[key] for key in writable if key in instance}
+            self.call("PUT", self._instance(name), body)
+            return 0, "", ""
+        return None
+
+    def _cmd_network(self, args:list) -> tuple:
+        if args == ["list", "--format", "json"]:
+            networks = self.call("GET", f"{API}/networks?recursion=1")
+            return 0, json.dumps(networks), ""
+        if len(args) == 2 and args[0] == "create":
+            self.call("POST", f"{API}/networks", {"name": args[1]})
+            return 0, "", ""
+        if len(args) == 2 and args[0] == "delete":
+            self.call("DELETE", f"{API}/networks/{quote(args[1])}")
+            return 0, "", ""
+        if len(args) == 4 and args[0] == "set":
+            _, name, key, value = args
+            body = {"config": {key: value}}
+            self.call("PATCH", f"{API}/networks/{quote(name)}", body)
+            return 0, "", ""
+        if len(args) == 4 and args[0] == "attach":
+            _, network, name, eth = args
+            device = {"type": "nic", "network": network, "name": eth}
+            body = {"devices": {eth: device}}
+            self.call("PATCH", self._instance(name), body)
+            return 0, "", ""
+        return None
+
+    def _cmd_image(self, args:list) -> tuple:
+        if args == ["list", "--format", "json"]:
+            images = self.call("GET", f"{API}/images?recursion=1")
+            return 0, json.dumps(images), ""
+        return None
+
+    def _cmd_publish(self, args:list) -> tuple:
+        aliases = []
+        if len(args) == 3 and args[1] == "--alias":
+            aliases = [{"name": args[2]}]
+        elif len(args) != 1:
+            return None
+        body = {
+            "source": {"type": "instance", "name": args[0]},
+            "aliases": aliases
+        }
+        self.call("POST", f"{API}/images", body)
+        return 0, "", ""
+
+    def _cmd_exec(self, args:list) -> tuple:
+        if len(args) < 3 or args[1] != "--": return None
+        name, command = args[0], args[2:]
+        environment = dict(EXEC_ENV)
+        if "TERM" in os.environ:
+            environment["TERM"] = os.environ["TERM"]
+        body = {
+            "command": command,
+            "environment": environment,
+            "interactive": False,
+            "wait-for-websocket": False,
+            "record-output": True
+        }
+        metadata = self.call("POST", self._instance(name) + "/exec", body)
+        output = metadata["metadata"].get("output", {})
+        code = metadata["metadata"].get("return", 0)
+        stdout = self._exec_log(output.get("1"))
+        stderr = self._exec_log(output.get("2"))
+        return code, stdout, stderr
+
+    def _exec_log(self, path:str) -> str:
+        if path is None: return ""
+        response, raw = self.request("GET", path)
+        self.request("DELETE", path)
+        return raw.decode(errors="replace")
+
+    def _files(self, c_path:str) -> str:
+        name, path = c_path.split("/", 1)
+        return self._instance(name) + "/files?path=" + quote("/" + path)
+
+    def _cmd_file(self, args:list, input:bytes=None) -> tuple:
+        if len(args) < 3: return None
+        action, paths, opts = args[0], [], {}
+        rest = iter(args[1:])
+        for arg in rest:
+            if arg in ("--mode", "--uid", "--gid"):
+                opts[arg] = next(rest, None)
+            elif arg != "-r":
+                paths.append(arg)
+        if len(paths) != 2 or None in opts.values(): return None
+        if action == "push":
+            src, c_path = paths
+            to_dir = c_path.endswith("/")
+            if src == "-":
+                # Contenido por stdin (si no nos lo pasan lo hace la
+                # consola con el stdin del programa)
+                if input is None: return None
+                data = input
+                uid, gid, mode = "0", "0", "0644"
+            else:
+                # Las carpetas las copia la consola (recursivo)
+                if not os.path.isfile(src): return None
+                if to_dir:
+                    c_path += os.path.basename(src)
+                stat = os.stat(src)
+                uid, gid = str(stat.st_uid), str(stat.st_gid)
+                mode = f"{stat.st_mode & 0o777:04o}"
+                with open(src, "rb") as file:
+                    data = file.read()
+            headers = {
+                "X-LXD-type": "file",
+                "X-LXD-uid": opts.get("--uid", uid),
+                "X-LXD-gid": opts.get("--gid", gid),
+                "X-LXD-mode": opts.get("--mode", mode),
+                "X-LXD-write": "overwrite"
+            }
+            response, raw = self.request(
+                "POST", self._files(c_path), body=data, headers=headers
+            )
+            # Si el destino es una carpeta ya existente se deja a la
+            # consola (copia el fichero dentro)
+            if response.status >= 400 and src != "-" and not to_dir:
+                return None
+            self._check_raw(response, raw)
+            return 0, "", ""
+        if action == "pull" and len(opts) == 0:
+            c_path, dest = paths
+            response, raw = self.request("GET", self._files(c_path))
+            self._check_raw(response, raw)
+            if response.getheader("X-LXD-type") != "file":
+                return None
+            if os.path.isdir(dest):
+                dest = os.path.join(dest, os.path.basename(c_path))
+            with open(dest, "wb") as file:
+                file.write(raw)
+            return 0, "", ""
+        return None
+
+    def _check_raw(self, response, raw:bytes):
+        if response.status >= 400:
+            try:
+                err = json.loads(raw).get("error")
+            except ValueError:
+                err = raw.decode(errors="replace")
+            raise LxdApiError(err)
+
+# --------------------------------------------------------------------
@@ -0,0 +1,294 @@
+import os
+import glob
+import json
+import queue
+import asyncio
+import threading
+import subprocess
+from time import monotonic, sleep
+
+from . import lxc
+from .lxc import LxcError
+
+# ----------------------- ARRANQUE DE CONTENEDORES -------------------
+# --------------------------------------------------------------------
+# Espera a que uno o varios contenedores terminen de arrancar (que
+# systemd haya terminado el arranque). En vez de preguntar sin parar
+# con 'lxc exec ... systemctl is-system-running' se pregunta cada vez
+# menos a menudo (backoff exponencial) y, mientras tanto, se escuchan
+# los eventos de ciclo de vida de LXD ('lxc monitor'): si un
+# contenedor se (re)arranca se vuelve a preguntar enseguida y si se
+# detiene o se elimina se deja de esperar por el
+# --------------------------------------------------------------------
+# Si 'lxc monitor' no esta disponible solo se usa el backoff
+# --------------------------------------------------------------------
+# Tambien permite esperar a que los contenedores tengan ip. Entre
+# listas de lxc se vigilan los ficheros de concesiones DHCP de los
+# bridges (basta con un stat): en cuanto cambian se vuelve a pedir la
+# lista y si no, se pide cada vez menos a menudo. Las carpetas de LXD
+# normalmente solo las puede leer root: si al empezar no se encuentra
+# ninguna concesion no se vigilan y solo se usa el backoff
+# --------------------------------------------------------------------
+
+# Tiempo entre preguntas (empieza en INITIAL_DELAY y se va doblando
+# hasta MAX_DELAY)
+INITIAL_DELAY = 0.1
+MAX_DELAY = 2
+# Tiempo maximo de espera por defecto (segundos)
+TIMEOUT = 180
+# Eventos de LXD tras los que se vuelve a preguntar enseguida
+WAKE_ACTIONS = {"instance-started", "instance-restarted", "instance-ready"}
+# Eventos de LXD tras los que el contenedor ya no va a arrancar
+STOP_ACTIONS = {"instance-stopped", "instance-shutdown", "instance-deleted"}
+MONITOR_CMD = ["lxc", "monitor", "--type=lifecycle", "--format=json"]
+# Carpetas de LXD (snap y paquete) donde estan las concesiones DHCP
+LXD_DIRS = ["/var/snap/lxd/common/lxd", "/var/lib/lxd"]
+LEASES = "networks/*/dnsmasq.leases"
+# Cada cuanto se mira si han cambiado las concesiones (segundos)
+LEASE_POLL = 0.05
+# --------------------------------------------------------------------
+def _parse_event(line:str) -> tuple:
+    """Devuelve (contenedor, accion) de un evento de 'lxc monitor' o
+    None si no es un evento de ciclo de vida de un contenedor"""
+    try:
+        event = json.loads(line)
+        action = event["metadata"]["action"]
+        source = event["metadata"]["source"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    if not source.startswith("/1.0/instances/"):
+        return None
+    name = source.split("/")[3].split("?")[0]
+    return name, action
+
+# --------------------------------------------------------------------
+class _Waiter:
+    """Estado de una espera: contenedores pendientes, cuando hay que
+    volver a preguntar a cada uno y los que han fallado"""
+    def __init__(self, cs:tuple, timeout:float):
+        self.pending = {}
+        for c in cs:
+            if c.started_up: continue
+            c._check_running()
+            self.pending[c.name] = c
+        now = monotonic()
+        self.deadline = now + (TIMEOUT if timeout is None else timeout)
+        self.delays = {name: INITIAL_DELAY for name in self.pending}
+        self.next_poll = {name: now for name in self.pending}
+        self.failed = {}
+
+    def due(self) -> list:
+        now = monotonic()
+        return [
+            c for name, c in self.pending.items()
+                if self.next_poll[name] <= now
+        ]
+
+    def polled(self, c):
+        if c.started_up:
+            self._done(c.name)
+            return
+        delay = self.delays[c.name]
+        self.next_poll[c.name] = monotonic() + delay
+        self.delays[c.name] = min(delay*2, MAX_DELAY)
+
+    def event(self, name:str, action:str):
+        if name not in self.pending: return
+        if action in WAKE_ACTIONS:
+            self.delays[name] = INITIAL_DELAY
+            self.next_poll[name] = monotonic()
+        elif action in STOP_ACTIONS:
+            self.failed[name] = (f" El contenedor '{name}' se ha detenido " +
+                                 "antes de terminar de arrancar")
+            self._done(name)
+
+    def _done(self, name:str):
+        self.pending.pop(name)
+        self.delays.pop(name)
+        self.next_poll.pop(name)
+
+    def wait_time(self) -> float:
+        """Tiempo hasta la siguiente pregunta. Si se ha superado el
+        tiempo maximo de espera da por fallidos los pendientes"""
+        now = monotonic()
+        if now >= self.deadline:
+            for name in self.pending:
+                self.failed[name] = (f" Timeout esperando a que el " +
+                                     f"contenedor '{name}' arranque")
+            self.pending = {}
+            return 0
+        return max(0, min(min(self.next_poll.values()), self.deadline) - now)
+
+    def check(self):
+        if self.failed:
+            raise LxcError("\n".join(self.failed.values()))
+
+# --------------------------------------------------------------------
+class _Monitor:
+    """Escucha los eventos de ciclo de vida de LXD en un hilo"""
+    def __init__(self):
+        self.events = queue.Queue()
+        try:
+            self.process = subprocess.Popen(
+                MONITOR_CMD, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, text=True
+            )
+        except OSError:
+            self.process = None
+            return
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            event = _parse_event(line)
+            if event is not None:
+                self.events.put(event)
+
+    def get(self, timeout:float) -> tuple:
+        """Devuelve el siguiente evento o None si no llega ninguno en
+        timeout segundos"""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        if self.process is None: return
+        self.process.terminate()
+        self.process.wait()
+
+def wait_ready(*cs, timeout:float=None):
+    """Espera a que terminen de arrancar los contenedores
+
+    Args:
+        cs (Container): Contenedores arrancados a esperar
+        timeout (float, optional): Tiempo maximo de espera en
+            segundos. Por defecto TIMEOUT
+
+    Raises:
+        LxcError: Si algun contenedor no esta arrancado, se detiene
+            mientras se espera o no termina de arrancar a tiempo
+    """
+    waiter = _Waiter(cs, timeout)
+    monitor = None
+    try:
+        while waiter.pending:
+            for c in waiter.due():
+                c.refresh()
+                waiter.polled(c)
+            if not waiter.pending: break
+            # Solo se escuchan eventos si hay que esperar
+            if monitor is None: monitor = _Monitor()
+            event = monitor.get(waiter.wait_time())
+            while event is not None:
+                waiter.event(*event)
+                event = monitor.get(0)
+    finally:
+        if monitor is not None: monitor.close()
+    waiter.check()
+
+# --------------------------------------------------------------------
+async def wait_ready_async(*cs, timeout:float=None):
+    """Version asincrona de wait_ready(). Pregunta a la vez a todos los
+    contenedores a los que les toca (refresh_async)"""
+    waiter = _Waiter(cs, timeout)
+    monitor = None; reader = None
+    events = asyncio.Queue()
+
+    async def read_events():
+        async for line in monitor.stdout:
+            event = _parse_event(line.decode(errors="replace"))
+            if event is not None:
+                events.put_nowait(event)
+    try:
+        while waiter.pending:
+            due = waiter.due()
+            await asyncio.gather(*(c.refresh_async() for c in due))
+            for c in due: waiter.polled(c)
+            if not waiter.pending: break
+            if monitor is None:
+                try:
+                    monitor = await asyncio.create_subprocess_exec(
+                        *MONITOR_CMD, stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.DEVNULL
+                    )
+                    reader = asyncio.ensure_future(read_events())
+                except OSError:
+                    monitor = False
+            try:
+                event = await asyncio.wait_for(
+                    events.get(), waiter.wait_time()
+                )
+            except asyncio.TimeoutError:
+                continue
+            waiter.event(*event)
+            while not events.empty():
+                waiter.event(*events.get_nowait())
+    finally:
+        if reader is not None: reader.cancel()
+        if monitor:
+            monitor.terminate()
+            await monitor.wait()
+    waiter.check()
+
+# --------------------------------------------------------------------
+def _lease_stamps() -> dict:
+    """Devuelve {fichero: mtime} de las concesiones DHCP de LXD"""
+    dirs = LXD_DIRS
+    if "LXD_DIR" in os.environ:
+        dirs = [os.environ["LXD_DIR"]] + dirs
+    stamps = {}
+    for d in dirs:
+        for path in glob.glob(os.path.join(d, LEASES)):
+            try:
+                stamps[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass
+    return stamps
+
+def _missing_ips(expected:dict, cs_info:dict) -> list:
+    missing = []
+    for name, eths in expected.items():
+        ipv4 = cs_info.get(name, {}).get("IPV4", {})
+        if any(eth not in ipv4 for eth in eths):
+            missing.append(name)
+    return missing
+
+def wait_for_ips(expected:dict, timeout:float=10) -> dict:
+    """Espera a que los contenedores tengan ip en sus tarjetas de red
+
+    Args:
+        expected (dict): Tarjetas de red de cada contenedor
+            {nombre: [eth0, ...]}
+        timeout (float, optional): Tiempo maximo de espera en segundos
+
+    Raises:
+        LxcError: Si no aparecen todas las ips a tiempo
+
+    Returns:
+        dict: La ultima lista de contenedores de lxc (lxc_list)
+    """
+    deadline = monotonic() + timeout
+    delay = INITIAL_DELAY; next_fetch = 0
+    stamps = _lease_stamps()
+    # Sin acceso a las concesiones no tiene sentido mirarlas
+    watch = len(stamps) > 0
+    while True:
+        now = monotonic()
+        current = _lease_stamps() if watch else stamps
+        if current != stamps:
+            stamps = current
+            next_fetch = now; delay = INITIAL_DELAY
+        if now >= next_fetch:
+            cs_info = lxc.lxc_list(fresh=True)
+            missing = _missing_ips(expected, cs_info)
+            if not missing: return cs_info
+            next_fetch = now + delay
+            delay = min(delay*2, MAX_DELAY)
+        if now >= deadline:
+            names = ", ".join(missing)
+            raise LxcError(f" Timeout esperando las ips de '{names}'")
+        poll = LEASE_POLL if watch else MAX_DELAY
+        sleep(max(0, min(poll, next_fetch - now, deadline - now)))
+
+# --------------------------------------------------------------------
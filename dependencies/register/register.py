@@ -1,68 +1,647 @@
-
+import io
 import os
+import re
+import fcntl
 import pickle
+import shutil
+import struct
 import threading
+from contextlib import contextmanager
+
+from ..utils.tools import obj_attrs
 
 # --------------------------- REGISTER  ------------------------------
 # --------------------------------------------------------------------
 # Modulo que proporciona funciones para almacenar objetos en forma
-# binaria. Se crea un fichero registro el cual contiene un diccionario
-# con tantas paginas como informacion se quiera guardar. En cada 
-# pagina, identificada con una clave (register_id) se encuentra la
-# informacion relacionada que se quiera guardar junta (una lista con 
-# objetos, otro diccionario u objetos o valores aislados). Es una 
-# forma de centralizar y facilitar la serializacion de objetos 
-# (guardar objetos de forma binaria y ordenada en un mismo fichero)
+# binaria. Se crea un registro el cual contiene tantas paginas como
+# informacion se quiera guardar. En cada pagina, identificada con una
+# clave (register_id) se encuentra la informacion relacionada que se
+# quiera guardar junta (una lista con objetos, otro diccionario u
+# objetos o valores aislados). Es una forma de centralizar y facilitar
+# la serializacion de objetos (guardar objetos de forma binaria y
+# ordenada en un mismo sitio)
+# --------------------------------------------------------------------
+# Por defecto el registro es una carpeta con un indice (cabecera) que
+# asocia cada register_id con el fichero de su pagina, y un fichero
+# por pagina. Asi, cargar o actualizar una pagina solo deserializa o
+# escribe esa pagina y no el registro entero (el coste es O(pagina) y
+# no O(registro)). Los registros antiguos (un unico fichero pickle con
+# un diccionario) se migran automaticamente la primera vez que se
+# accede a ellos. Opcionalmente se puede usar una base de datos SQLite
+# (config_backend) en la que las paginas que son listas de objetos con
+# nombre (contenedores, bridges) se guardan como filas indexadas por
+# nombre, tag y estado, lo que permite consultarlas (query, find) sin
+# deserializar la pagina entera. Dentro de una sesion se consultan 
+# igual, superponiendo los objetos que la sesion haya cambiado
+# --------------------------------------------------------------------
+# Con transaction() se abre una sesion en memoria: todas las llamadas
+# a add/update/load/remove que se hagan dentro trabajan sobre las
+# paginas ya cargadas y al salir del bloque se escriben de una vez
+# solo las paginas modificadas (una carga y un guardado por pagina).
+# Dentro de la sesion cada carga tambien devuelve su propia copia: 
+# solo se guarda lo que se pasa a add/update
+# --------------------------------------------------------------------
+# Para que varios procesos puedan usar el registro a la vez se usa un
+# fichero candado (fcntl): las lecturas toman un bloqueo compartido y
+# las escrituras uno exclusivo, solo mientras se lee o se escribe la
+# pagina. Una transaccion no mantiene el bloqueo durante el bloque
+# (que puede durar minutos o esperar al usuario): al cerrarse toma el
+# bloqueo exclusivo, vuelve a leer las paginas que ha modificado y les
+# aplica solo sus cambios respecto a lo que leyo (_merge), atributo a
+# atributo. Asi dos ordenes que cambian contenedores (o atributos de
+# un contenedor) distintos a la vez no se pisan y las de solo lectura
+# nunca esperan a las demas. Cada fichero se escribe en uno temporal
+# y se renombra, por lo que nunca se lee un fichero a medio escribir
+# --------------------------------------------------------------------
+# Dentro de un mismo proceso, los hilos que cargan una pagina, la 
+# modifican y la vuelven a guardar lo hacen dentro de atomic(): asi
+# solo un hilo escribe a la vez y no se pierden cambios
+# --------------------------------------------------------------------
+# Cada fichero (indice y paginas) empieza con una cabecera con un
+# numero de generacion que aumenta en cada escritura. El proceso
+# guarda los bytes que ya ha leido junto con (inodo, mtime,
+# generacion) del fichero, de forma que si se vuelve a cargar sin que
+# haya cambiado no se vuelve a leer. Cada carga deserializa su propia
+# copia: modificar lo cargado (sin guardarlo) no cambia lo que 
+# devuelven las siguientes cargas
 # --------------------------------------------------------------------
 
-# Ubicacion relativa del registro        
+# Ubicacion relativa del registro
 REL_PATH = ".register"
-# Candando para evitar problemas de concurrencia accediendo al registro
+# Nombre del fichero indice dentro de la carpeta del registro
+INDEX_NAME = "index"
+# Extension de los ficheros de las paginas
+PAGE_EXT = ".page"
+# Extension del fichero candado (entre procesos) del registro
+LOCK_EXT = ".lock"
+# Cabecera de los ficheros: marca + numero de generacion
+GEN_MAGIC = b"RGEN"
+GEN_HEADER = struct.Struct(">4sQ")
+# Candando para evitar problemas de concurrencia entre hilos accediendo
+# al registro
 reg_lock = threading.Lock()
+# Solo un hilo puede modificar el registro a la vez (ver atomic)
+_writer_lock = threading.RLock()
+# Descriptor del fichero candado mientras un hilo tiene el bloqueo
+# (cada hilo guarda el suyo, nunca se comparte)
+_held = threading.local()
+# --------------------------------------------------------------------
+# Decorador para bloquear las funciones que puedan llegar a sufrir
+# problemas de concurrencia (entre hilos y entre procesos)
+def lock(exclusive:bool=True):
+    def _lock(func):
+        def locked(*args, **opt_args):
+            if not exclusive:
+                with reg_lock, _disk_access(exclusive):
+                    return func(*args, **opt_args)
+            # Dentro de una sesion las escrituras son en memoria y
+            # solo se escribe en disco al cerrarla
+            with _writer_lock, reg_lock, \
+                    _disk_access(exclusive and _session is None):
+                return func(*args, **opt_args)
+        return locked
+    return _lock
+
+@contextmanager
+def atomic():
+    """Bloque en el que solo el hilo que lo ejecuta puede modificar el
+    registro. Sirve para cargar una pagina, modificarla y guardarla sin
+    que otro hilo la cambie entre medias (los demas hilos que quieran 
+    escribir esperan a que termine el bloque)"""
+    with _writer_lock:
+        yield
+
+# --------------------------------------------------------------------
+@contextmanager
+def _disk_access(exclusive:bool=False):
+    """Bloquea el registro frente a otros procesos mientras dura el
+    bloque (compartido para leer, exclusivo para escribir). Se usa 
+    siempre con reg_lock tomado, asi que solo un hilo a la vez tiene
+    el fichero candado abierto. Si el hilo ya tiene el bloqueo (bloque
+    anidado) no hace nada"""
+    if getattr(_held, "fd", None) is not None:
+        yield
+        return
+    # Si hay que migrar un registro antiguo se va a escribir
+    if os.path.isfile(REL_PATH):
+        exclusive = True
+    fd = os.open(REL_PATH + LOCK_EXT, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        _held.fd = fd
+        yield
+    finally:
+        _held.fd = None
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+# --------------------------------------------------------------------
+# Clases de objetos guardados en registros antiguos que ahora se deben
+# cargar con otra clase: (modulo, nombre) -> clase
+_renamed_classes = {}
+
+def rename_class(module:str, name:str, cls:type):
+    """Hace que los objetos guardados con la clase module.name se
+    carguen con la clase indicada (para migrar registros antiguos)
+
+    Args:
+        module (str): Modulo de la clase guardada
+        name (str): Nombre de la clase guardada
+        cls (type): Clase con la que se cargan
+    """
+    _renamed_classes[(module, name)] = cls
+
+class _Unpickler(pickle.Unpickler):
+    def find_class(self, module:str, name:str):
+        cls = _renamed_classes.get((module, name))
+        if cls is not None:
+            return cls
+        return super().find_class(module, name)
+
+def unpickle(file) -> object:
+    return _Unpickler(file).load()
+
+def unpickle_bytes(data:bytes) -> object:
+    return unpickle(io.BytesIO(data))
+
+# --------------------------------------------------------------------
+def matches(obj:object, filters:dict) -> bool:
+    """Indica si los atributos de un objeto cumplen los filtros. Si
+    el valor de un filtro es una lista, tupla o set, basta con que el
+    atributo sea uno de sus elementos"""
+    for attr, value in filters.items():
+        current = getattr(obj, attr, None)
+        if type(value) in (list, tuple, set):
+            if current not in value: return False
+        elif current != value:
+            return False
+    return True
+
 # --------------------------------------------------------------------
-# Decorador para bloquear las funciones que puedan llegar a sufrir 
-# problemas de concurrencia
-def lock(func):
-    def locked(*args, **opt_args):
-        # Otra opcion es usar "with reg_lock:"
-        reg_lock.acquire()
-        output = func(*args, **opt_args)
-        reg_lock.release()
-        return output
-    return locked
-
-@lock
-def _save(register:dict):
-    with open(REL_PATH, "wb") as file:
-        pickle.dump(register, file)
-        
-@lock
-def _load():
-    with open(REL_PATH, "rb") as file:
-        return pickle.load(file)
-
-@lock
-def _remove():
-    if os.path.exists(REL_PATH): 
+class _PageFiles:
+    """Almacenamiento por defecto: una carpeta con un fichero indice
+    y un fichero pickle por pagina"""
+    name = "pickle"
+    # Las consultas necesitan deserializar la pagina entera
+    indexed = False
+
+    def __init__(self):
+        # Ficheros ya leidos por el proceso:
+        # ruta -> ((inodo, mtime, generacion), bytes del objeto)
+        self._cache = {}
+
+    def _index_path(self) -> str:
+        return os.path.join(REL_PATH, INDEX_NAME)
+
+    def _page_path(self, page_file:str) -> str:
+        return os.path.join(REL_PATH, page_file)
+
+    def _read_generation(self, file) -> int:
+        """Lee la cabecera del fichero y deja el cursor al comienzo
+        del objeto serializado. Los ficheros sin cabecera (anteriores)
+        tienen generacion 0"""
+        header = file.read(GEN_HEADER.size)
+        if len(header) == GEN_HEADER.size and header[:4] == GEN_MAGIC:
+            return GEN_HEADER.unpack(header)[1]
+        file.seek(0)
+        return 0
+
+    def _generation(self, path:str) -> int:
+        try:
+            with open(path, "rb") as file:
+                return self._read_generation(file)
+        except FileNotFoundError:
+            return 0
+
+    def _load(self, path:str) -> object:
+        """Carga un fichero. Si no ha cambiado desde la ultima vez que
+        lo cargo el proceso, deserializa los bytes guardados sin 
+        volver a leerlo"""
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            generation = self._read_generation(file)
+            key = (stat.st_ino, stat.st_mtime_ns, generation)
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == key:
+                data = cached[1]
+            else:
+                data = file.read()
+        self._cache[path] = (key, data)
+        return unpickle_bytes(data)
+
+    def _dump(self, obj:object, path:str):
+        """Serializa el objeto en un fichero temporal y lo renombra al
+        destino (os.replace es atomico)"""
+        generation = self._generation(path) + 1
+        data = pickle.dumps(obj)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(GEN_HEADER.pack(GEN_MAGIC, generation))
+            file.write(data)
+            file.flush()
+            stat = os.fstat(file.fileno())
+        os.replace(tmp_path, path)
+        key = (stat.st_ino, stat.st_mtime_ns, generation)
+        self._cache[path] = (key, data)
+
+    def _migrate_legacy(self):
+        """Si el registro tiene el formato antiguo (un unico fichero con
+        todo el diccionario serializado) lo convierte al formato de
+        paginas"""
+        if not os.path.isfile(REL_PATH):
+            return
+        with open(REL_PATH, "rb") as file:
+            register = unpickle(file)
         os.remove(REL_PATH)
+        self.write_all(register)
+
+    def _new_page_file(self, index:dict, register_id:any) -> str:
+        """Genera un nombre de fichero legible y no usado"""
+        base = re.sub(r"[^\w\-]", "_", str(register_id))[:40]
+        used = set(index.values())
+        page_file = base + PAGE_EXT; k = 1
+        while page_file in used:
+            page_file = f"{base}_{k}{PAGE_EXT}"
+            k += 1
+        return page_file
+
+    def index(self) -> dict:
+        self._migrate_legacy()
+        try:
+            # Copia, ya que quien lo pide lo modifica antes de guardarlo
+            return dict(self._load(self._index_path()))
+        except FileNotFoundError:
+            return None
+
+    def read(self, index:dict, register_id:any) -> object:
+        return self._load(self._page_path(index[register_id]))
+
+    def query(self, index:dict, register_id:any, filters:dict) -> list:
+        page = self.read(index, register_id)
+        if type(page) != list: return []
+        return [obj for obj in page if matches(obj, filters)]
+
+    def write(self, index:dict, register_id:any, obj:object):
+        """Escribe una unica pagina. Solo se reescribe el indice si la
+        pagina es nueva"""
+        new_page = register_id not in index
+        if new_page:
+            os.makedirs(REL_PATH, exist_ok=True)
+            index[register_id] = self._new_page_file(index, register_id)
+        self._dump(obj, self._page_path(index[register_id]))
+        if new_page:
+            self._dump(index, self._index_path())
+
+    def delete(self, index:dict, register_id:any):
+        page_file = index.pop(register_id)
+        if len(index) == 0:
+            self.remove()
+            return
+        self._dump(index, self._index_path())
+        self._cache.pop(self._page_path(page_file), None)
+        if os.path.exists(self._page_path(page_file)):
+            os.remove(self._page_path(page_file))
+
+    def write_all(self, register:dict):
+        self.remove()
+        if len(register) == 0: return
+        os.makedirs(REL_PATH)
+        index = {}
+        for register_id, obj in register.items():
+            index[register_id] = self._new_page_file(index, register_id)
+            self._dump(obj, self._page_path(index[register_id]))
+        self._dump(index, self._index_path())
+
+    def remove(self):
+        self._cache = {}
+        if os.path.isdir(REL_PATH):
+            shutil.rmtree(REL_PATH)
+        elif os.path.exists(REL_PATH):
+            os.remove(REL_PATH)
+
+    @contextmanager
+    def batch(self):
+        yield
+
+_backend = _PageFiles()
+# --------------------------------------------------------------------
+# Sesion de escritura diferida (transaction). Mientras haya una abierta
+# las paginas se leen una sola vez del disco y las modificaciones se
+# quedan en memoria hasta que se cierra la sesion mas externa
+class _Session:
+    def __init__(self):
+        self.depth = 0
+        self.ids = None
+        self.index = None
+        # Paginas serializadas (cada carga deserializa su propia copia,
+        # solo cambia lo que se pasa a add/update)
+        self.pages = {}
+        # Pagina serializada tal y como se leyo (None si no existia) 
+        # para saber que se ha cambiado en la sesion
+        self.base = {}
+        # Objetos de base por nombre (solo para listas con nombre)
+        self.base_records = {}
+        # Listas con nombre modificadas: register_id -> (nombres en
+        # orden, nombre -> objeto serializado o None si se ha quitado)
+        # con los objetos que ha cambiado la sesion (ver _overlay)
+        self.touched = {}
+        self.dirty = set()
+        self.removed = set()
+        self.cleared = False
+
+_session:_Session = None
+
+def _page_ids() -> dict:
+    """Devuelve las claves de las paginas existentes (en orden)"""
+    if _session is None:
+        index = _backend.index()
+        return {} if index is None else index
+    if _session.ids is None:
+        _session.index = _backend.index()
+        if _session.index is None: _session.index = {}
+        _session.ids = dict.fromkeys(_session.index)
+    return _session.ids
+
+def _get_page(register_id:any) -> object:
+    if _session is None:
+        return _backend.read(_backend.index(), register_id)
+    if register_id not in _session.pages:
+        _page_ids()
+        page = pickle.dumps(_backend.read(_session.index, register_id))
+        _session.base[register_id] = page
+        _session.pages[register_id] = page
+    return unpickle_bytes(_session.pages[register_id])
+
+def _query_page(register_id:any, filters:dict) -> list:
+    if register_id not in _page_ids():
+        return []
+    if _session is None:
+        return _backend.query(_backend.index(), register_id, filters)
+    if _backend.indexed and not _session.cleared:
+        if register_id not in _session.dirty:
+            # La pagina no se ha modificado en la sesion, se puede
+            # consultar directamente en el almacenamiento
+            return _backend.query(_session.index, register_id, filters)
+        if register_id in _session.touched:
+            return _overlay(register_id, filters)
+    page = _get_page(register_id)
+    if type(page) != list: return []
+    return [obj for obj in page if matches(obj, filters)]
+
+def _put_page(register_id:any, obj:object):
+    if _session is None:
+        index = _backend.index()
+        _backend.write({} if index is None else index, register_id, obj)
+        return
+    data = pickle.dumps(obj)
+    # Guardar lo mismo que ya hay no cambia nada
+    if _session.pages.get(register_id) == data: return
+    _page_ids()[register_id] = None
+    if register_id not in _session.index:
+        _session.base.setdefault(register_id, None)
+    _session.pages[register_id] = data
+    _session.dirty.add(register_id)
+    _session.removed.discard(register_id)
+    _session.touched.pop(register_id, None)
+    if _backend.indexed and _named(obj):
+        base = _base_records(register_id)
+        if base is None: return
+        records = {o.name: pickle.dumps(o) for o in obj}
+        changed = {
+            name: record for name, record in records.items() 
+                if base.get(name) != record
+        }
+        changed.update((name, None) for name in base if name not in records)
+        _session.touched[register_id] = (list(records), changed)
+
+def _base_records(register_id:any) -> dict:
+    """Objetos (serializados) por nombre de una lista tal y como se
+    leyo en la sesion. None si no se leyo o no es una lista con nombre"""
+    if register_id not in _session.base_records:
+        base = _session.base.get(register_id)
+        if base is not None: base = unpickle_bytes(base)
+        records = None
+        if base is not None and _named(base):
+            records = {o.name: pickle.dumps(o) for o in base}
+        _session.base_records[register_id] = records
+    return _session.base_records[register_id]
+
+def _overlay(register_id:any, filters:dict) -> list:
+    """Consulta una lista modificada en la sesion usando los indices
+    del almacenamiento: solo se deserializan las filas que cumplen los
+    filtros y los objetos que ha cambiado la sesion, que sustituyen a 
+    los del almacenamiento"""
+    order, changed = _session.touched[register_id]
+    found = {
+        obj.name: obj 
+            for obj in _backend.query(_session.index, register_id, filters)
+                if obj.name not in changed
+    }
+    for name, data in changed.items():
+        if data is None: continue
+        obj = unpickle_bytes(data)
+        if matches(obj, filters): found[name] = obj
+    positions = {name: i for i, name in enumerate(order)}
+    return sorted(
+        found.values(), key=lambda o: positions.get(o.name, len(order))
+    )
+
+def _drop_page(register_id:any):
+    if _session is None:
+        _backend.delete(_backend.index(), register_id)
+        return
+    _page_ids().pop(register_id)
+    _session.pages.pop(register_id, None)
+    _session.touched.pop(register_id, None)
+    _session.dirty.discard(register_id)
+    _session.removed.add(register_id)
+
+def _drop_all():
+    if _session is None:
+        _backend.remove()
+        return
+    _session.ids = {}
+    _session.pages = {}
+    _session.touched = {}
+    _session.dirty = set()
+    _session.removed = set()
+    _session.cleared = True
+
+def _flush(session:_Session):
+    """Escribe en disco los cambios acumulados durante la sesion. Las
+    paginas que se leyeron en la sesion se mezclan con lo que haya 
+    ahora en disco (otro proceso las puede haber cambiado)"""
+    changed = session.dirty or session.removed
+    if not session.cleared and not changed:
+        return
+    with _disk_access(exclusive=True), _backend.batch():
+        if session.cleared:
+            register = {}
+            for register_id in session.ids:
+                page = session.pages[register_id]
+                register[register_id] = unpickle_bytes(page)
+            _backend.write_all(register)
+            return
+        index = _backend.index()
+        if index is None: index = {}
+        for register_id in session.ids:
+            if register_id in session.dirty:
+                page = unpickle_bytes(session.pages[register_id])
+                if register_id in index and register_id in session.base:
+                    base = session.base[register_id]
+                    if base is not None: base = unpickle_bytes(base)
+                    theirs = _backend.read(index, register_id)
+                    page = _merge(base, page, theirs)
+                _backend.write(index, register_id, page)
+        for register_id in session.removed:
+            if register_id in index:
+                _backend.delete(index, register_id)
+
+def _merge(base:object, mine:object, theirs:object) -> object:
+    """Aplica sobre lo que hay en disco (theirs) los cambios de la
+    sesion (mine) respecto a lo que leyo (base). Los diccionarios se
+    mezclan por clave y las listas de objetos con nombre (contenedores,
+    bridges) por nombre y, dentro de cada objeto, por atributo. El
+    resto de paginas se sobreescriben"""
+    if type(mine) == dict and type(theirs) == dict:
+        if type(base) != dict: base = {}
+        merged = dict(theirs)
+        for key in base:
+            if key not in mine: merged.pop(key, None)
+        for key, value in mine.items():
+            if key not in base or _changed(base[key], value):
+                merged[key] = value
+        return merged
+    if _named(mine) and _named(theirs):
+        if base is None: base = []
+        if not _named(base): return mine
+        base_objs = {obj.name: obj for obj in base}
+        mine_names = {obj.name for obj in mine}
+        merged = [
+            obj for obj in theirs 
+                if obj.name in mine_names or obj.name not in base_objs
+        ]
+        positions = {obj.name: i for i, obj in enumerate(merged)}
+        for obj in mine:
+            old = base_objs.get(obj.name)
+            if old is not None and not _changed(old, obj): continue
+            if obj.name in positions:
+                i = positions[obj.name]
+                merged[i] = _merge_attrs(old, obj, merged[i])
+            else:
+                positions[obj.name] = len(merged)
+                merged.append(obj)
+        return merged
+    return mine
 
-@lock     
-def _reg_exists():
-    return os.path.exists(REL_PATH)
+def _merge_attrs(base:object, mine:object, theirs:object) -> object:
+    """Aplica sobre el objeto de disco (theirs) solo los atributos que
+    la sesion (mine) ha cambiado respecto a lo que leyo (base)"""
+    if base is None or not type(base) == type(mine) == type(theirs):
+        return mine
+    base_attrs = obj_attrs(base)
+    theirs_attrs = obj_attrs(theirs)
+    for attr, value in obj_attrs(mine).items():
+        old = base_attrs.get(attr)
+        if attr in base_attrs and not _changed(old, value): continue
+        setattr(theirs, attr, _merge(old, value, theirs_attrs.get(attr)))
+    return theirs
 
-# -------------------------------------------------------------------- 
+def _named(page:object) -> bool:
+    return type(page) == list and all(hasattr(o, "name") for o in page)
+
+def _changed(old:object, new:object) -> bool:
+    return pickle.dumps(old) != pickle.dumps(new)
+
+@contextmanager
+def transaction():
+    """Abre una sesion sobre el registro. Todas las operaciones que
+    se realicen dentro del bloque se hacen en memoria y al salir se
+    guardan las paginas modificadas de una sola vez (aunque el bloque
+    termine con una excepcion, ya que los cambios registrados reflejan
+    acciones que ya se han realizado). Las sesiones se pueden anidar,
+    solo se guarda al cerrar la mas externa
+    """
+    global _session
+    with reg_lock:
+        if _session is None:
+            _session = _Session()
+        _session.depth += 1
+    try:
+        yield
+    finally:
+        with reg_lock:
+            _session.depth -= 1
+            if _session.depth == 0:
+                session = _session
+                _session = None
+                _flush(session)
+
+def transactional(func):
+    """Decorador que ejecuta la funcion dentro de una transaccion"""
+    def in_transaction(*args, **opt_args):
+        with transaction():
+            return func(*args, **opt_args)
+    return in_transaction
+
+# --------------------------------------------------------------------
 def config_location(path, name=".register"):
-    """Permite configurar la ubicacion del registro y su nombre. 
+    """Permite configurar la ubicacion del registro y su nombre.
     Por defecto se crea en la carpeta principal del proyecto
 
     Args:
         path ([type]): Ubicacion de la carpeta donde se quiere guardar
         name (str, optional): Nombre del registro
     """
-    global REL_PATH
+    global REL_PATH, _backend
     REL_PATH = path+name
+    if _backend.name == "sqlite":
+        from .sqlite_backend import SqliteBackend
+        _backend = SqliteBackend(REL_PATH)
+
+@lock()
+def config_backend(name:str="pickle"):
+    """Permite elegir donde se guarda el registro: "pickle" (carpeta
+    con un fichero por pagina) o "sqlite" (base de datos con las
+    listas de objetos guardadas como filas indexadas). Si el registro
+    existe en el otro formato se migra al elegido
+
+    Args:
+        name (str, optional): Nombre del almacenamiento a usar
+
+    Raises:
+        RegisterError: Si el almacenamiento no existe o hay una
+            transaccion abierta
+    """
+    global _backend
+    if _session is not None:
+        err = " The register backend can't be changed inside a transaction"
+        raise RegisterError(err)
+    if name == _backend.name:
+        return
+    if name == "sqlite":
+        from .sqlite_backend import SqliteBackend
+        new_backend = SqliteBackend(REL_PATH)
+    elif name == "pickle":
+        new_backend = _PageFiles()
+    else:
+        raise RegisterError(f" Unknown register backend '{name}'")
+    old_index = _backend.index()
+    if old_index is not None and new_backend.index() is None:
+        register = {}
+        for register_id in old_index:
+            register[register_id] = _backend.read(old_index, register_id)
+        with new_backend.batch():
+            new_backend.write_all(register)
+        _backend.remove()
+    _backend = new_backend
 
-# --------------------------------------------------------------------   
+def backend_in_use() -> str:
+    """Devuelve el nombre del almacenamiento que se esta usando"""
+    return _backend.name
+
+# --------------------------------------------------------------------
+@lock()
 def add(register_id:any, obj:object):
     """Crea una nueva pagina del registro. Si el registro no existe
     lo crea
@@ -72,30 +651,24 @@ def add(register_id:any, obj:object):
         obj (object): Variable que se quiere almacenar
 
     Raises:
-        RegisterError: [description]
+        RegisterError: Si ya existe una pagina con esa clave
     """
-    if not _reg_exists():
-        register = {}
-    else:
-        register = load()
-    
-    if register_id in register:
+    if register_id in _page_ids():
         err = f" id -> '{register_id}' is already used in the register"
         raise RegisterError(err)
-    else:
-        register[register_id] = obj
-    _save(register) 
+    _put_page(register_id, obj)
 
-# -------------------------------------------------------------------- 
+# --------------------------------------------------------------------
+@lock()
 def update(register_id:any, obj:object, override:bool=True, dict_id:any=None):
     """Acualiza una pagina del registro
 
     Args:
         register_id (any): Clave que identifica a la pagina
-        obj (object): Objeto que se quiere almacenar 
+        obj (object): Objeto que se quiere almacenar
         override (bool, optional): Sobreescribe lo que hubiera
             guardado anteriormente
-        dict_id (any, optional): Sirve para indicar, en caso de que 
+        dict_id (any, optional): Sirve para indicar, en caso de que
             override=False y en la pagina del registro hubiera
             almacenado un diccionario, la clave para guardar dentro
             el objeto
@@ -104,40 +677,39 @@ def update(register_id:any, obj:object, override:bool=True, dict_id:any=None):
         RegisterError: Si la pagina no existe en el registro o hay
             algun fallo al añadir el objeto a la pagina
     """
-    register = load()
-    if register == None or register_id not in register:
+    if register_id not in _page_ids():
         err_msg = f" id -> '{register_id}' was not found in the register"
         raise RegisterError(err_msg)
     if override == True:
-        register[register_id] = obj
-    else:
-        value_saved = register[register_id]
-        if type(value_saved) == list:
-            value_saved.append(obj)
-        elif type(value_saved) == set:
-            value_saved.add(obj)
-        elif type(value_saved) == dict:
-            if dict_id != None:
-                value_saved[dict_id] = obj
-            else:
-                err_msg = (
-                    " A key is needed ('dict_id' property) for updating " + 
-                        "(without overriding) the dictionary saved in the " + 
-                            f"register with id '{register_id}'"
-                )
-                raise RegisterError(err_msg)
-        elif type(value_saved) == tuple:
+        _put_page(register_id, obj)
+        return
+    value_saved = _get_page(register_id)
+    if type(value_saved) == list:
+        value_saved.append(obj)
+    elif type(value_saved) == set:
+        value_saved.add(obj)
+    elif type(value_saved) == dict:
+        if dict_id != None:
+            value_saved[dict_id] = obj
+        else:
             err_msg = (
-                    " A tuple object needs to be override it " + 
-                    f"(change 'override' property)"
-                )
+                " A key is needed ('dict_id' property) for updating " +
+                    "(without overriding) the dictionary saved in the " +
+                        f"register with id '{register_id}'"
+            )
             raise RegisterError(err_msg)
-        else:
-            array = [value_saved, obj]
-            register[register_id] = array
-    _save(register)  
+    elif type(value_saved) == tuple:
+        err_msg = (
+                " A tuple object needs to be override it " +
+                f"(change 'override' property)"
+            )
+        raise RegisterError(err_msg)
+    else:
+        value_saved = [value_saved, obj]
+    _put_page(register_id, value_saved)
 
-# --------------------------------------------------------------------     
+# --------------------------------------------------------------------
+@lock(exclusive=False)
 def load(register_id:any=None) -> object:
     """Devuelve la informacion guardada en una pagina del registro.
     Si no se especifica ninguna se devuelve todo el registro
@@ -150,31 +722,82 @@ def load(register_id:any=None) -> object:
         ser tambien iterables)
     """
     try:
-        register = _load()
+        page_ids = _page_ids()
+        if len(page_ids) == 0:
+            return None
         if register_id == None:
+            register = {}
+            for page_id in list(page_ids):
+                register[page_id] = _get_page(page_id)
             return register
-        else:
-            if register_id in register:
-                return register[register_id]
-            else:
-                return None
+        if register_id in page_ids:
+            return _get_page(register_id)
+        return None
     except FileNotFoundError:
         return None
 
-# -------------------------------------------------------------------- 
+# --------------------------------------------------------------------
+@lock(exclusive=False)
+def exists(register_id:any) -> bool:
+    """Indica si existe una pagina en el registro sin cargarla
+
+    Args:
+        register_id (any): clave de la pagina
+    """
+    return register_id in _page_ids()
+
+@lock(exclusive=False)
+def query(register_id:any, **filters) -> list:
+    """Devuelve los objetos de una pagina (que debe ser una lista)
+    cuyos atributos coinciden con los filtros, manteniendo el orden.
+    ej: query("containers", tag="server", state="RUNNING")
+    Con el almacenamiento sqlite solo se deserializan las filas que
+    cumplen los filtros (name, tag y state estan indexados)
+
+    Args:
+        register_id (any): clave de la pagina a consultar
+        filters: atributo=valor (o lista de valores validos)
+
+    Returns:
+        list: objetos que cumplen los filtros (vacia si no hay o la
+            pagina no existe)
+    """
+    try:
+        return _query_page(register_id, filters)
+    except FileNotFoundError:
+        return []
+
+def find(register_id:any, name:str) -> object:
+    """Devuelve el objeto de una pagina (lista) con el nombre indicado
+
+    Args:
+        register_id (any): clave de la pagina a consultar
+        name (str): valor del atributo name del objeto
+
+    Returns:
+        object: objeto encontrado o None si no existe
+    """
+    found = query(register_id, name=name)
+    return found[0] if len(found) > 0 else None
+
+# --------------------------------------------------------------------
+@lock()
 def override(register:dict):
     """Sobreescribe el registro con un registro nuevo
 
     Args:
         register (dict): Registro nuevo
     """
-    _save(register)
+    _drop_all()
+    for register_id, obj in register.items():
+        _put_page(register_id, obj)
 
-# --------------------------------------------------------------------   
+# --------------------------------------------------------------------
+@lock()
 def remove(register_id:any=None):
     """Elimina una pagina del registro. Si no se especifica ninguna
     se elimina todo el registro. Si el registro queda vacio al
-    eliminar una pagina, el archivo se elimina
+    eliminar una pagina, el registro se elimina
 
     Args:
         register_id (any, optional): Pagina del registro a eliminar
@@ -183,22 +806,17 @@ def remove(register_id:any=None):
         RegisterError: Si la pagina especificada no existe
     """
     if register_id != None:
-        register = load()
-        if register_id in register:
-            register.pop(register_id)
-            if len(register) == 0:
-                _remove()
-            else:
-                override(register)
+        if register_id in _page_ids():
+            _drop_page(register_id)
         else:
             raise RegisterError(f" id '{register_id}' was not found")
     else:
-        _remove()
+        _drop_all()
 
-# -------------------------------------------------------------------- 
+# --------------------------------------------------------------------
 class RegisterError(Exception):
     """Error personalizado para los fallos del registro"""
     def __init__(self, msg):
         super().__init__(msg)
 
-# -------------------------------------------------------------------- 
+# --------------------------------------------------------------------
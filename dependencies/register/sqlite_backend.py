@@ -0,0 +1,260 @@
+import os
+import pickle
+import sqlite3
+from contextlib import contextmanager
+
+from .register import matches, unpickle_bytes
+
+# ------------------------ SQLITE BACKEND  ---------------------------
+# --------------------------------------------------------------------
+# Almacenamiento alternativo del registro en una base de datos SQLite
+# (fichero <registro>.db). Cada pagina es una fila de la tabla pages.
+# Si la pagina es una lista de objetos con atributo name (contenedores,
+# bridges...) cada objeto se guarda como una fila de la tabla records
+# junto con su nombre, tag y estado, que estan indexados. Asi se puede
+# buscar un contenedor o filtrar por tag/estado deserializando solo
+# los objetos que cumplen la condicion. El resto de paginas se guardan
+# serializadas enteras (kind = 'blob')
+# --------------------------------------------------------------------
+# La tabla meta guarda un numero de generacion que aumenta con cada
+# escritura. Mientras no cambie (ni el fichero) el proceso reutiliza
+# el indice y las paginas que ya habia deserializado
+# --------------------------------------------------------------------
+
+# Extension del fichero de la base de datos
+DB_EXT = ".db"
+# Atributos de los objetos que se guardan en columnas indexadas
+INDEXED_ATTRS = ("name", "tag", "state")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id BLOB PRIMARY KEY,
+    pos INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    data BLOB
+);
+CREATE TABLE IF NOT EXISTS records (
+    page BLOB NOT NULL,
+    pos INTEGER NOT NULL,
+    name TEXT,
+    tag TEXT,
+    state TEXT,
+    data BLOB NOT NULL,
+    PRIMARY KEY (page, pos)
+);
+CREATE INDEX IF NOT EXISTS records_name ON records (page, name);
+CREATE INDEX IF NOT EXISTS records_tag ON records (page, tag);
+CREATE INDEX IF NOT EXISTS records_state ON records (page, state);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta VALUES ('generation', 0);
+"""
+# --------------------------------------------------------------------
+def _key(register_id:any) -> bytes:
+    return pickle.dumps(register_id)
+
+def _is_rows(obj:object) -> bool:
+    """Indica si la pagina se puede guardar como filas"""
+    if type(obj) != list: return False
+    return all(hasattr(elem, "name") for elem in obj)
+
+def _sql_value(value:any) -> bool:
+    """Indica si el valor de un filtro se puede resolver en SQL"""
+    if type(value) in (list, tuple, set):
+        return all(type(v) == str for v in value)
+    return type(value) == str
+
+# --------------------------------------------------------------------
+class SqliteBackend:
+    """Almacenamiento del registro en una base de datos SQLite con la
+    misma interfaz que el almacenamiento por defecto (ficheros)"""
+    name = "sqlite"
+    indexed = True
+
+    def __init__(self, rel_path:str):
+        self.path = rel_path + DB_EXT
+        self._conn = None
+        self._pid = None
+        self._in_batch = False
+        # Paginas ya leidas: clave -> ((inodo, mtime, generacion), 
+        # bytes de la pagina o lista con los de cada fila). Cada 
+        # lectura deserializa su propia copia. El indice se guarda con
+        # la clave None
+        self._cache = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        # Una conexion por proceso (no se puede compartir tras un fork)
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False
+            )
+            self._conn.executescript(_SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+    def _state(self) -> tuple:
+        """Devuelve (inodo, mtime, generacion) de la base de datos"""
+        stat = os.stat(self.path)
+        generation, = self._connection().execute(
+            "SELECT value FROM meta WHERE key = 'generation'"
+        ).fetchone()
+        return (stat.st_ino, stat.st_mtime_ns, generation)
+
+    def _cached(self, key:bytes, state:tuple) -> object:
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == state:
+            return cached[1]
+        return None
+
+    @contextmanager
+    def _tx(self):
+        if self._in_batch:
+            self._cache = {}
+            yield self._connection()
+            return
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+            conn.execute(
+                "UPDATE meta SET value = value + 1 WHERE key = 'generation'"
+            )
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self._cache = {}
+
+    @contextmanager
+    def batch(self):
+        """Agrupa todas las escrituras del bloque en una sola
+        transaccion de la base de datos"""
+        if self._in_batch:
+            yield
+            return
+        with self._tx():
+            self._in_batch = True
+            try:
+                yield
+            finally:
+                self._in_batch = False
+
+    # ----------------------------------------------------------------
+    def index(self) -> dict:
+        if not os.path.exists(self.path):
+            return None
+        state = self._state()
+        index = self._cached(None, state)
+        if index is None:
+            rows = self._connection().execute(
+                "SELECT id, kind FROM pages ORDER BY pos"
+            ).fetchall()
+            index = {pickle.loads(key): kind for key, kind in rows}
+            self._cache[None] = (state, index)
+        if len(index) == 0:
+            return None
+        return dict(index)
+
+    def read(self, index:dict, register_id:any) -> object:
+        key = _key(register_id)
+        state = self._state()
+        data = self._cached(key, state)
+        if data is None:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT kind, data FROM pages WHERE id = ?", (key,)
+            ).fetchone()
+            if row is None:
+                raise FileNotFoundError(f"page '{register_id}' not found")
+            kind, data = row
+            if kind != "blob":
+                records = conn.execute(
+                    "SELECT data FROM records WHERE page = ? ORDER BY pos",
+                    (key,)
+                )
+                data = [data for data, in records]
+            self._cache[key] = (state, data)
+        if type(data) == list:
+            return [unpickle_bytes(d) for d in data]
+        return unpickle_bytes(data)
+
+    def query(self, index:dict, register_id:any, filters:dict) -> list:
+        if index.get(register_id) != "rows":
+            page = self.read(index, register_id)
+            if type(page) != list: return []
+            return [obj for obj in page if matches(obj, filters)]
+        sql = "SELECT data FROM records WHERE page = ?"
+        params = [_key(register_id)]
+        py_filters = {}
+        for attr, value in filters.items():
+            if attr not in INDEXED_ATTRS or not _sql_value(value):
+                py_filters[attr] = value
+            elif type(value) == str:
+                sql += f" AND {attr} = ?"
+                params.append(value)
+            else:
+                marks = ", ".join("?" * len(value))
+                sql += f" AND {attr} IN ({marks})"
+                params.extend(value)
+        sql += " ORDER BY pos"
+        found = []
+        for data, in self._connection().execute(sql, params):
+            obj = unpickle_bytes(data)
+            if matches(obj, py_filters):
+                found.append(obj)
+        return found
+
+    def write(self, index:dict, register_id:any, obj:object):
+        key = _key(register_id)
+        kind = "rows" if _is_rows(obj) else "blob"
+        with self._tx() as conn:
+            conn.execute("DELETE FROM records WHERE page = ?", (key,))
+            data = None if kind == "rows" else pickle.dumps(obj)
+            if register_id in index:
+                conn.execute(
+                    "UPDATE pages SET kind = ?, data = ? WHERE id = ?",
+                    (kind, data, key)
+                )
+            else:
+                conn.execute(
+                    "INSERT INTO pages (id, pos, kind, data) VALUES (?, " +
+                        "(SELECT COALESCE(MAX(pos), -1) + 1 FROM pages), ?, ?)",
+                    (key, kind, data)
+                )
+            if kind == "rows":
+                conn.executemany(
+                    "INSERT INTO records VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (key, pos) + tuple(
+                            getattr(elem, attr, None)
+                                for attr in INDEXED_ATTRS
+                        ) + (pickle.dumps(elem),)
+                        for pos, elem in enumerate(obj)
+                    ]
+                )
+        index[register_id] = kind
+
+    def delete(self, index:dict, register_id:any):
+        index.pop(register_id)
+        key = _key(register_id)
+        with self._tx() as conn:
+            conn.execute("DELETE FROM records WHERE page = ?", (key,))
+            conn.execute("DELETE FROM pages WHERE id = ?", (key,))
+
+    def write_all(self, register:dict):
+        with self.batch():
+            self.remove()
+            index = {}
+            for register_id, obj in register.items():
+                self.write(index, register_id, obj)
+
+    def remove(self):
+        if not os.path.exists(self.path):
+            return
+        with self._tx() as conn:
+            conn.execute("DELETE FROM records")
+            conn.execute("DELETE FROM pages")
+
+# --------------------------------------------------------------------
@@ -1,5 +1,7 @@
 
+import asyncio
 import logging
+import threading
 from math import floor
 from logging import Logger
 from time import time
@@ -34,37 +36,84 @@ def timer(func):
     return f
 
 # -------------------------------------------------------------------- 
-# LXC NO SOPORTA HILOS, CREA CADA CONTENEDOR SECUENCIALMENTE !!!!
-def catch_foreach_thread(logger:Logger=None):
-    """Ejecuta una funcion tantas veces como argumentos no opcionales
-    se hayan pasado a la funcion y maneja las excepciones que puedan 
-    surgir durante la ejecucion. Utiliza un hilo por cada ejecucion.
-    Hay que tener cuidado de que las funciones que se pasen, no 
-    compartan el acceso a variables comunes o que estan esten 
-    bloqueadas con candado mientras se modifica su valor. Podrian 
-    saltar errores raros (por ejemplo en pickle si se accede a la vez
-    a un fichero podria saltar -> ERROR:Ran out of input. Tambien 
-    tiene la opcion de ejecutar de forma no concurrente """
+# Numero maximo de hilos que usa catch_foreach_parallel a la vez
+MAX_WORKERS = 8
+# Si es verdadero las ejecuciones se hacen de una en una (flag -s)
+_sequential = False
+# Candados para no ejecutar a la vez dos operaciones sobre el mismo
+# objeto (uno por nombre)
+_key_locks = {}
+_key_locks_lock = threading.Lock()
+
+def config_execution(sequential:bool=False, max_workers:int=None):
+    """Configura como se ejecutan catch_foreach_parallel y
+    catch_foreach_async
+
+    Args:
+        sequential (bool, optional): Si es verdadero se ejecuta de uno
+            en uno en vez de a la vez
+        max_workers (int, optional): Numero maximo de hilos
+    """
+    global _sequential, MAX_WORKERS
+    _sequential = sequential
+    if max_workers is not None:
+        if max_workers < 1:
+            raise ValueError(f" Numero de hilos '{max_workers}' no valido")
+        MAX_WORKERS = max_workers
+
+def sequential_execution() -> bool:
+    """Devuelve si se ha pedido ejecutar de uno en uno (flag -s)"""
+    return _sequential
+
+def _key_lock(key:any) -> threading.RLock:
+    with _key_locks_lock:
+        if key not in _key_locks:
+            _key_locks[key] = threading.RLock()
+        return _key_locks[key]
+
+def _report(logger:Logger, err:Exception):
+    if str(err) == "":
+        pass
+    elif logger == None:
+        print(f"ERROR:{err}")  
+    else:
+        logger.error(err)
+
+def catch_foreach_parallel(logger:Logger=None):
+    """Igual que catch_foreach pero ejecuta la funcion a la vez para 
+    todos los argumentos con un numero limitado de hilos (MAX_WORKERS).
+    Dos ejecuciones sobre el mismo objeto (mismo atributo name) nunca
+    se hacen a la vez, aunque vengan de llamadas distintas. Las 
+    funciones que se pasen deben modificar el registro con 
+    register.atomic() (un solo hilo escribe a la vez). Devuelve los 
+    argumentos cuya ejecucion ha terminado sin errores en el mismo 
+    orden en el que se pasaron. Si se ha pedido ejecucion secuencial
+    (config_execution) se comporta como catch_foreach"""
     def _catch_foreach(func):
-        def catch_concurrently(*args, **optionals):
-            successful = []; threads = {}
-            with conc.ThreadPoolExecutor() as executor:
-                for a in args:
-                    thread = executor.submit(func, a, **optionals)
-                    threads[thread] = a
-            for thread in threads:  
-                try:
-                    thread.result()
-                    successful.append(threads[thread])
-                except Exception as err:
-                    if str(err) == "":
-                        pass
-                    elif logger == None:
-                        print(f"ERROR:{err}")  
-                    else:
-                        logger.error(err)    
+        def attempt(a, optionals) -> Exception:
+            try:
+                with _key_lock(getattr(a, "name", id(a))):
+                    func(a, **optionals)
+            except Exception as err:
+                return err
+            return None
+        def catch(*args, **optionals):
+            if _sequential or len(args) <= 1:
+                errors = [attempt(a, optionals) for a in args]
+            else:
+                workers = min(MAX_WORKERS, len(args))
+                with conc.ThreadPoolExecutor(workers) as executor:
+                    errors = list(executor.map(
+                        lambda a: attempt(a, optionals), args
+                    ))
+            successful = []
+            for a, err in zip(args, errors):
+                if err is None:
+                    successful.append(a)
+                else:
+                    _report(logger, err)
             return successful
-        return catch_concurrently
+        return catch
     return _catch_foreach
 
 # -------------------------------------------------------------------- 
@@ -77,13 +126,42 @@ def catch_foreach(logger:Logger=None):
                     func(a, **optionals)
                     successful.append(a)
                 except Exception as err:
-                    if str(err) == "":
-                        pass
-                    elif logger == None:
-                        print(f"ERROR:{err}")  
-                    else:
-                        logger.error(err)    
+                    _report(logger, err)
+            return successful
+        return catch
+    return _catch_foreach
+    
+# -------------------------------------------------------------------- 
+def catch_foreach_async(logger:Logger=None):
+    """Igual que catch_foreach pero para corrutinas. Lanza una
+    ejecucion por cada argumento a la vez (asyncio.gather) y espera a
+    que terminen todas. Los limites de concurrencia los pone quien 
+    ejecute las ordenes (lxc.run_async). Devuelve los argumentos cuya
+    ejecucion ha terminado sin errores en el mismo orden. Si se ha 
+    pedido ejecucion secuencial se espera a cada una antes de lanzar
+    la siguiente"""
+    def _catch_foreach(func):
+        async def gather(args, optionals):
+            if not _sequential:
+                return await asyncio.gather(
+                    *(func(a, **optionals) for a in args),
+                    return_exceptions=True
+                )
+            results = []
+            for a in args:
+                try:
+                    results.append(await func(a, **optionals))
+                except Exception as err:
+                    results.append(err)
+            return results
+        def catch(*args, **optionals):
+            successful = []
+            results = asyncio.run(gather(args, optionals))
+            for a, result in zip(args, results):
+                if not isinstance(result, Exception):
+                    successful.append(a)
+                else:
+                    _report(logger, result)
             return successful
         return catch
     return _catch_foreach
-    
\ No newline at end of file
@@ -1,6 +1,8 @@
 
 from math import floor, ceil
+from hashlib import sha256
 from contextlib import suppress
+import os
 import re
 import copy
 
@@ -10,6 +12,74 @@ import copy
 # para que sean utilizadas por otros modulos
 # -------------------------------------------------------------------- 
 
+# --------------------------------------------------------------------
+def obj_attrs(obj:object) -> dict:
+    """Devuelve una copia de los atributos de un objeto, tanto si los
+    guarda en un __dict__ como en __slots__ (los de la clase base
+    primero)
+
+    Args:
+        obj (object): objeto cuyos atributos se quieren obtener
+
+    Returns:
+        dict: atributo -> valor
+    """
+    attr_dict = {}
+    for klass in reversed(type(obj).__mro__):
+        slots = klass.__dict__.get("__slots__", ())
+        if type(slots) == str: slots = (slots,)
+        for attr in slots:
+            if hasattr(obj, attr):
+                attr_dict[attr] = getattr(obj, attr)
+    if hasattr(obj, "__dict__"):
+        attr_dict.update(vars(obj))
+    return attr_dict
+
+# --------------------------------------------------------------------
+def dir_manifest(path:str) -> dict:
+    """Calcula el hash (sha256) del contenido de todos los ficheros de
+    una carpeta
+
+    Args:
+        path (str): carpeta a recorrer
+
+    Returns:
+        dict: ruta relativa a path de cada fichero -> hash
+    """
+    manifest = {}
+    for root, _, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            digest = sha256()
+            with open(file_path, "rb") as file:
+                for chunk in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(chunk)
+            rel_path = os.path.relpath(file_path, path)
+            manifest[rel_path] = digest.hexdigest()
+    return manifest
+
+def dir_signature(path:str) -> str:
+    """Calcula un hash de la ruta, el tamaño y la fecha de modificacion
+    de todos los ficheros de una carpeta (sin leerlos). Si no cambia se
+    puede reutilizar el manifest calculado antes
+
+    Args:
+        path (str): carpeta a recorrer
+
+    Returns:
+        str: hash de la carpeta
+    """
+    digest = sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            st = os.stat(file_path)
+            rel_path = os.path.relpath(file_path, path)
+            entry = f"{rel_path}\0{st.st_size}\0{st.st_mtime_ns}\n"
+            digest.update(entry.encode())
+    return digest.hexdigest()
+
 # --------------------------------------------------------------------        
 def pretty(obj:object, *attr_colums, firstcolum_order:list=None) -> str:
     """Devuelve los atributos de un objeto en forma de string. (Como
@@ -32,7 +102,11 @@ def pretty(obj:object, *attr_colums, firstcolum_order:list=None) -> str:
     Returns:
         str: Tabla con los atributos del objeto
     """
-    attr_dict = vars(obj)
+    # Los atributos privados (_attr) no se muestran
+    attr_dict = {
+        attr: attr_val for attr, attr_val in obj_attrs(obj).items()
+            if not attr.startswith("_")
+    }
     # Pasamos a strings los valores del diccionario
     for attr, attr_val in attr_dict.items(): 
         attr_dict[attr] = str(attr_val)
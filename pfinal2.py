@@ -32,16 +32,27 @@ def main():
             args_processed, indent=4, sort_keys=True
         )
         # Configuramos la cantidad de info que se va a mostrar
-        _config_verbosity(args_processed.pop("gflags"))
+        gflags = args_processed.pop("gflags")
+        _config_verbosity(gflags)
+        _config_register(gflags)
+        _config_execution(gflags)
         main_logger.info(" Programa iniciado")
         # Realizamos unas comprobaciones previas (ProgramError)
         program.check_dependencies()
-        program.check_platform_updates()
-        # Ejecutamos la orden
-        main_logger.debug(f" Ejecutando la orden : \n{args_as_json}")
-        bash.execute(args_processed)
-        # Actualizamos la plataforma
-        platform.update_conexions()
+        # Toda la orden trabaja sobre el registro en memoria y se 
+        # guarda una unica vez al terminar
+        with register.transaction():
+            program.check_platform_updates()
+            # Ejecutamos la orden
+            main_logger.debug(f" Ejecutando la orden : \n{args_as_json}")
+            try:
+                bash.execute(args_processed)
+            finally:
+                # Las imagenes que se esten construyendo en segundo
+                # plano terminan antes de guardar el registro
+                images.finish()
+            # Actualizamos la plataforma
+            platform.update_conexions()
     # Manejamos los errores que puedan surgir 
     except CmdLineError as clErr:
         main_logger.error(f" {clErr}")
@@ -88,8 +99,33 @@ def _config_verbosity(flags:list):
     root_logger = logging.getLogger()
     root_logger.setLevel(logLvl) 
 
+# --------------------------------------------------------------------
+def _config_register(flags:list):
+    """Elige donde se guarda el registro. Se usa la base de datos
+    SQLite si se pide con el flag --sqlite o si ya existe de una
+    ejecucion anterior (si no, una carpeta con un fichero por pagina)
+
+    Args:
+        flags (list): Flags que se han pasado en la linea de comandos
+    """
+    if "--sqlite" in flags or os.path.exists(register.REL_PATH + ".db"):
+        register.config_backend("sqlite")
+
+# --------------------------------------------------------------------
+def _config_execution(flags:list):
+    """Si se ha pasado el flag -s, las operaciones sobre varios
+    contenedores o bridges se hacen de una en una en vez de a la vez
+
+    Args:
+        flags (list): Flags que se han pasado en la linea de comandos
+    """
+    if "-s" in flags:
+        decorators.config_execution(sequential=True)
+        lxc.config_concurrency(1)
+
 # --------------------------------------------------------------------
 if __name__ == "__main__":
+    import os
     import sys
     import json
     import logging
@@ -98,6 +134,9 @@ if __name__ == "__main__":
     from dependencies.cli.cli import Cli, CmdLineError
     from program import program
     from program.program import ProgramError
-    from program.platform import platform
+    from program.platform import platform, images
+    from dependencies.register import register
+    from dependencies.utils import decorators
+    from dependencies.lxc import lxc
     main()
 # --------------------------------------------------------------------
@@ -110,7 +110,11 @@ def add_app(path:str, with_name:str=None):
         process.shell(f"cp -r {path} {app_path}/ROOT/index.html")
     app_logger.info(f" App '{name}' añadida con exito")
         
-def use_app(app_name:str, *servs):
+def use_app(app_name:str, *servs, mount:bool=False, limit:int=None):
+    """Cambia la aplicacion de los servidores. Con mount la carpeta de
+    la aplicacion se monta en los servidores en vez de copiarse. Si se
+    copia, se envia a la vez a varios servidores (como mucho limit a 
+    la vez, por defecto servers.DISTRIBUTION_LIMIT)"""
     if app_name in get_appnames() or app_name == "default":
         msg = (f" Actualizando app '{app_name}' en servidores...")
         default = get_defaultapp()
@@ -147,8 +151,11 @@ def use_app(app_name:str, *servs):
             servs = list(filter(
                 lambda s: s.name in servs, existing_servs
             )) 
-        for s in servs:
-            servers.change_app(s, root_path, app_name)
+        if mount:
+            for s in servs:
+                servers.mount_app(s, root_path, app_name)
+        else:
+            servers.distribute_app(servs, root_path, app_name, limit=limit)
     else:
         err = (f" La aplicacion '{app_name}' no existe en el " + 
                     "repositorio local de aplicaciones")
@@ -4,27 +4,27 @@ import logging
 from dependencies.register import register
 from dependencies.utils.tools import objectlist_as_dict
 from dependencies.lxc.lxc_classes.bridge import Bridge, LxcNetworkError
-
-if True:
-    from dependencies.utils.decorators import catch_foreach
-else:
-    from dependencies.utils.decorators import (
-        catch_foreach_thread as catch_foreach
-    )
+from dependencies.utils.decorators import catch_foreach_parallel
 
 # --------------- CONTROLADOR DE BRIDGES (PUENTES) -------------------
 # --------------------------------------------------------------------
 # Proporciona funciones para manipular los bridges de forma sencilla
 # y maneja las excepciones y errores que se puedan dar a la hora
-# de manipularlos (catch_foreach, se encarga de atrapar las 
+# de manipularlos (catch_foreach_parallel, se encarga de atrapar las 
 # excepciones cada vez que se llama a la funcion)
 # --------------------------------------------------------------------
+# init y delete se ejecutan a la vez sobre todos los bridges (con un
+# numero limitado de hilos, o de uno en uno con el flag -s). Los 
+# cambios en el registro se hacen dentro de register.atomic() para
+# que los hilos no pisen los cambios de los demas
+# --------------------------------------------------------------------
 
 # Id con el que se van a guardar los bridges en el registro
 ID = "bridges"
 bgs_logger = logging.getLogger(__name__)
 # -------------------------------------------------------------------
-@catch_foreach(bgs_logger)
+@register.transactional
+@catch_foreach_parallel(bgs_logger)
 def init(b:Bridge=None):
     bgs_logger.info(f" Creando bridge '{b.name}'...")
     try:
@@ -44,7 +44,8 @@ def init(b:Bridge=None):
     _add_bridge(b)
 
 # -------------------------------------------------------------------
-@catch_foreach(bgs_logger)
+@register.transactional
+@catch_foreach_parallel(bgs_logger)
 def delete(b:Bridge=None):
     bgs_logger.info(f" Eliminando bridge '{b.name}'...")
     try:
@@ -92,18 +93,19 @@ def _update_bridges(*bs_to_update:Bridge, remove=False):
         remove (bool, optional): Si es verdadero, se elimina el
             contenedor del registro. Por defecto es False
     """
-    bgs = register.load(ID)
-    bgs_dict = objectlist_as_dict(bgs, key_attribute="name")
-    for b in bs_to_update:
-        if b.name in bgs_dict:
-            if remove:
-                bgs_dict.pop(b.name)
-            else:
-                bgs_dict[b.name] = b
-    if len(bgs_dict) == 0:
-        register.remove(ID)
-    else:
-        register.update(ID, list(bgs_dict.values()))
+    with register.atomic():
+        bgs = register.load(ID)
+        bgs_dict = objectlist_as_dict(bgs, key_attribute="name")
+        for b in bs_to_update:
+            if b.name in bgs_dict:
+                if remove:
+                    bgs_dict.pop(b.name)
+                else:
+                    bgs_dict[b.name] = b
+        if len(bgs_dict) == 0:
+            register.remove(ID)
+        else:
+            register.update(ID, list(bgs_dict.values()))
 
 def _add_bridge(b_to_add:Bridge):
     """Añade un bridge al registro
@@ -111,11 +113,12 @@ def _add_bridge(b_to_add:Bridge):
     Args:
         b_to_add (Bridge): Bridge a añadir
     """
-    bgs = register.load(register_id=ID)
-    if bgs == None:
-        register.add(ID, [b_to_add])
-    else:
-        register.update(ID, b_to_add, override=False)
+    with register.atomic():
+        bgs = register.load(register_id=ID)
+        if bgs == None:
+            register.add(ID, [b_to_add])
+        else:
+            register.update(ID, b_to_add, override=False)
         
 # -------------------------------------------------------------------      
 
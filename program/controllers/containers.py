@@ -1,35 +1,50 @@
 
 import logging
-from os import remove
-from contextlib import suppress
 
 from dependencies.register import register
 from dependencies.utils.tools import objectlist_as_dict
-if True:
-    from dependencies.utils.decorators import catch_foreach
-else:
-    from dependencies.utils.decorators import (
-        catch_foreach_thread as catch_foreach
-    )
-from dependencies.lxc.lxc_classes.container import Container, LxcError
+from dependencies.utils.decorators import (
+    catch_foreach_parallel, catch_foreach_async, sequential_execution
+)
+from dependencies.lxc.lxc_classes.container import (
+    Container, LxcError, RUNNING, FROZEN, STOPPED
+)
 from program.platform.machines import load_balancer, servers
 
 # ------------------ CONTROLADOR DE CONTENEDORES ---------------------
 # --------------------------------------------------------------------
 # Proporciona funciones para manipular los contenedores de forma
 # sencilla y maneja las excepciones y errores que se puedan dar a la 
-# hora de manipularlos (catch_foreach, se encarga de atrapar las 
-# excepciones cada vez que se llama a la funcion)
+# hora de manipularlos (catch_foreach_parallel, se encarga de atrapar
+# las excepciones cada vez que se llama a la funcion)
+# --------------------------------------------------------------------
+# init se ejecuta a la vez sobre todos los contenedores
+# (catch_foreach_async). lxc.run_async limita cuantas ordenes se
+# ejecutan a la vez y las de un mismo contenedor van en orden. start,
+# pause, stop y delete usan una sola orden de lxc para todos los
+# contenedores (Container.start_many, ...) y una sola escritura en el
+# registro. Con el flag -s todo se hace de uno en uno 
+# (sequential_execution)
+# --------------------------------------------------------------------
+# Los cambios en el registro se hacen dentro de register.atomic() para
+# que los hilos (catch_foreach_parallel, deploy) no pisen los cambios
+# de los demas
 # --------------------------------------------------------------------
 
 # Id con el que se van a guardar los contenedores en el registro
 ID = "containers"
 cs_logger = logging.getLogger(__name__)
 # --------------------------------------------------------------------
-@catch_foreach(cs_logger)
-def init(c:Container=None):            
+@register.transactional
+@catch_foreach_async(cs_logger)
+async def init(c:Container=None, source:str=None):
+    # Con source el contenedor se copia de otro en vez de crearse
+    # desde su imagen
     cs_logger.info(f" Inicializando {c.tag} '{c.name}'...")
-    c.init()
+    if source is None:
+        await c.init_async()
+    else:
+        await c.copy_async(source)
     register.update(
         "updates", True, override=False, dict_id="cs_num"
     ) 
@@ -41,70 +56,83 @@ def init(c:Container=None):
     _add_container(c)
     
 # --------------------------------------------------------------------
-@catch_foreach(cs_logger)
-def start(c:Container=None):
-    cs_logger.info(f" Arrancando {c.tag} '{c.name}'...")
-    c.start()
-    register.update(
-        "updates", True, override=False, dict_id="cs_state"
-    ) 
-    if c.tag == servers.TAG:
-        register.update(
-            "updates", True, override=False, dict_id="s_state"
-        )
-    cs_logger.info(f" {c.tag} '{c.name}' arrancado con exito")
-    _update_container(c)
+@register.transactional
+def start(*cs) -> list:
+    return _apply_many(
+        cs, Container.start_many, ("Arrancando", "arrancado"), "state"
+    )
         
 # --------------------------------------------------------------------
-@catch_foreach(cs_logger)
-def pause(c:Container=None):
-    cs_logger.info(f" Pausando {c.tag} '{c.name}'...")
-    c.pause()
-    register.update(
-        "updates", True, override=False, dict_id="cs_state"
-    ) 
-    if c.tag == servers.TAG:
-        register.update(
-            "updates", True, override=False, dict_id="s_state"
-        )
-    cs_logger.info(f" {c.tag} '{c.name}' pausado con exito")
-    _update_container(c)
+@register.transactional
+def pause(*cs) -> list:
+    return _apply_many(
+        cs, Container.pause_many, ("Pausando", "pausado"), "state"
+    )
         
 # --------------------------------------------------------------------
-@catch_foreach(cs_logger)
-def stop(c:Container=None):
-    cs_logger.info(f" Deteniendo {c.tag} '{c.name}'...")
-    c.stop()
-    register.update(
-        "updates", True, override=False, dict_id="cs_state"
-    ) 
-    if c.tag == servers.TAG:
-        register.update(
-            "updates", True, override=False, dict_id="s_state"
-        )
-    cs_logger.info(f" {c.tag} '{c.name}' detenido con exito")
-    _update_container(c)
+@register.transactional
+def stop(*cs) -> list:
+    return _apply_many(
+        cs, Container.stop_many, ("Deteniendo", "detenido"), "state"
+    )
 
 # --------------------------------------------------------------------
-@catch_foreach(cs_logger)
-def delete(c:Container=None):
-    with suppress(Exception):
-        c.stop()
-        _update_container(c) 
-    cs_logger.info(f" Eliminando {c.tag} '{c.name}'...")
-    c.delete()
+@register.transactional
+def delete(*cs) -> list:
+    # Primero se detienen los que esten arrancados o pausados
+    to_stop = [c for c in cs if c.state in (RUNNING, FROZEN)]
+    Container.stop_many(to_stop)
+    update_containers(*filter(lambda c: c.state == STOPPED, to_stop))
+    return _apply_many(
+        cs, Container.delete_many, ("Eliminando", "eliminado"), "num",
+        remove=True
+    )
+
+def _apply_many(cs:tuple, bulk, words:tuple, change:str, 
+                remove:bool=False) -> list:
+    """Aplica una operacion a todos los contenedores con una sola
+    orden de lxc (bulk) y guarda el resultado en el registro de una 
+    vez. Muestra los errores de cada contenedor
+
+    Args:
+        cs (tuple): Contenedores
+        bulk: Operacion (Container.start_many, ...)
+        words (tuple): Palabras para los mensajes (accion, resultado)
+        change (str): Cambio a registrar en updates ("state" o "num")
+        remove (bool, optional): Si se eliminan del registro
+
+    Returns:
+        list: Contenedores con los que la operacion ha tenido exito
+    """
+    for c in cs:
+        cs_logger.info(f" {words[0]} {c.tag} '{c.name}'...")
+    if sequential_execution():
+        errors = {}
+        for c in cs: errors.update(bulk([c]))
+    else:
+        errors = bulk(list(cs))
+    successful = []
+    for c in cs:
+        if c.name in errors:
+            if str(errors[c.name]) != "":
+                cs_logger.error(errors[c.name])
+            continue
+        cs_logger.info(f" {c.tag} '{c.name}' {words[1]} con exito")
+        successful.append(c)
+    if len(successful) == 0: return successful
     register.update(
-        "updates", True, override=False, dict_id="cs_num"
+        "updates", True, override=False, dict_id=f"cs_{change}"
     ) 
-    if c.tag == servers.TAG:
+    if any(c.tag == servers.TAG for c in successful):
         register.update(
-            "updates", True, override=False, dict_id="s_num"
+            "updates", True, override=False, dict_id=f"s_{change}"
         )
-    cs_logger.info(f" {c.tag} '{c.name}' eliminado con exito")
-    _update_container(c, remove=True)
+    update_containers(*successful, remove=remove)
+    return successful
 
 # --------------------------------------------------------------------
-@catch_foreach(cs_logger)
+@register.transactional
+@catch_foreach_parallel(cs_logger)
 def open_terminal(c:Container=None):
     c.open_terminal()
         
@@ -149,51 +177,46 @@ def configure_netfile(c:Container):
     msg = (f" Configurando el net_file del {c.tag} '{c.name}'... ")
     cs_logger.info(msg)
     cs_logger.debug("\n" + config_file)
-    file1= "50-cloud-init.yaml"
-    file2 = "99-disable-network-config.cfg"
-    with open(file1, "w") as file:
-        file.write(config_file)
-    path1 = "/etc/netplan/"
-    with open(file2, "w") as file:
-        file.write("network: {config: disabled}")
-    path2 = "/etc/cloud/cloud.cfg.d/"
-    c.push(file1, path1)
-    c.push(file2, path2)
+    c.push_bytes(config_file, "/etc/netplan/50-cloud-init.yaml")
+    c.push_bytes(
+        "network: {config: disabled}", 
+        "/etc/cloud/cloud.cfg.d/99-disable-network-config.cfg"
+    )
     msg = f" Net del {c.tag} '{c.name}' configurada con exito"
     cs_logger.info(msg)
-    remove(file1)
-    remove(file2)
     
 # -------------------------------------------------------------------- 
 def update_containers(*cs, remove:bool=False):
-    for c in cs:
-        _update_container(c, remove=remove)
-   
-def _update_container(c:Container, remove:bool=False):
-    """Actualiza el objeto de un contenedor en el registro
+    """Actualiza los objetos de varios contenedores en el registro 
+    (con una sola escritura)
 
     Args:
-        c_to_update (Container): Contenedor a actualizar
-        remove (bool, optional): Si es verdadero, se elimina el
-            contenedor del registro. Por defecto es False
+        cs (Container): Contenedores a actualizar
+        remove (bool, optional): Si es verdadero, se eliminan los
+            contenedores del registro. Por defecto es False
     """
-    cs = register.load(ID)
-    if cs == None:
-        _add_container(c)
-        return
-    cs_dict = objectlist_as_dict(cs, key_attribute="name")
-    if c.name in cs_dict:
-        if remove:
-            cs_dict.pop(c.name)
+    if len(cs) == 0: return
+    with register.atomic():
+        stored = register.load(ID)
+        cs_dict = {}
+        if stored is not None:
+            cs_dict = objectlist_as_dict(stored, key_attribute="name")
+        for c in cs:
+            if remove:
+                cs_dict.pop(c.name, None)
+            else:
+                cs_dict[c.name] = c
+        if len(cs_dict) == 0:
+            if stored is not None:
+                register.remove(ID)
+        elif stored is None:
+            register.add(ID, list(cs_dict.values()))
         else:
-            cs_dict[c.name] = c
-    else:
-        if not remove:
-            cs_dict[c.name] = c
-    if len(cs_dict) == 0:
-        register.remove(ID)
-    else:
-        register.update(ID, list(cs_dict.values()))
+            register.update(ID, list(cs_dict.values()))
+   
+def _update_container(c:Container, remove:bool=False):
+    """Actualiza el objeto de un contenedor en el registro"""
+    update_containers(c, remove=remove)
     
 def _add_container(c_to_add:Container):
     """Añade un contenedor al registro
@@ -201,10 +224,46 @@ def _add_container(c_to_add:Container):
     Args:
         c_to_add (Container): Contenedor a añadir
     """
-    cs = register.load(register_id=ID)
-    if cs == None:
-        register.add(ID, [c_to_add])
-    else:
-        register.update(ID, c_to_add, override=False)
+    with register.atomic():
+        cs = register.load(register_id=ID)
+        if cs == None:
+            register.add(ID, [c_to_add])
+        else:
+            register.update(ID, c_to_add, override=False)
+    
+# --------------------------------------------------------------------
+# Los contenedores guardados antes de usar registros compactos (con
+# sus atributos en un __dict__) se cargan con esta clase para poder
+# migrarlos a la clase de su rol
+class _LegacyContainer:
+    pass
+
+register.rename_class(
+    "dependencies.lxc.lxc_classes.container", "Container", _LegacyContainer
+)
+
+def migrate_records(record_types:dict):
+    """Convierte los contenedores del registro guardados con el
+    formato antiguo a la clase de su rol
+
+    Args:
+        record_types (dict): Clase que corresponde a cada tag. Los
+            tags que no esten se convierten a Container
+    """
+    cs = register.load(ID)
+    if cs is None: return
+    if not any(isinstance(c, _LegacyContainer) for c in cs): return
+    migrated = []
+    for c in cs:
+        if isinstance(c, _LegacyContainer):
+            attrs = dict(vars(c))
+            if "has_config_error" in attrs:
+                attrs["config_error"] = attrs.pop("has_config_error")
+            cls = record_types.get(attrs.get("tag"), Container)
+            c = cls.__new__(cls)
+            c.__setstate__(attrs)
+        migrated.append(c)
+    cs_logger.debug(f" Migrados {len(migrated)} contenedores del registro")
+    register.update(ID, migrated)
     
 # --------------------------------------------------------------------
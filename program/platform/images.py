@@ -0,0 +1,515 @@
+import os
+import re
+import json
+import fcntl
+import hashlib
+import logging
+import threading
+import concurrent.futures as conc
+from contextlib import suppress, contextmanager
+
+from dependencies.register import register
+from dependencies.lxc import lxc
+from dependencies.lxc.lxc_classes.container import Container
+from dependencies.utils.decorators import sequential_execution
+
+# ---------------------- IMAGENES DE LOS ROLES -----------------------
+# --------------------------------------------------------------------
+# Cada rol de la plataforma (servidores, balanceador, base de datos y
+# cliente) tiene una receta con la que se configura su imagen: imagen
+# de partida, paquetes que se instalan y ficheros de configuracion que
+# se meten en ella. La receta se resume en una clave (hash) y la
+# imagen se publica con un alias que la incluye (rol-clave). Solo la
+# primera vez se configura un contenedor desde la imagen de partida
+# (apt-get) y se publica su imagen; las siguientes veces, mientras la
+# receta no cambie y la imagen siga en lxc, los contenedores del rol
+# se crean directamente con ella
+# --------------------------------------------------------------------
+# En el registro se guarda la ultima imagen de cada rol (clave, alias
+# y huella), de forma que si se le cambia el alias desde fuera se
+# sigue encontrando. Si el registro se ha borrado (destroy) la imagen
+# se busca por su alias
+# --------------------------------------------------------------------
+# Las imagenes se construyen en un contenedor auxiliar (build-rol) que
+# se elimina al publicar la imagen. En vez de rearrancarlo para evitar
+# fallos de dpkg, se espera a que cloud-init termine y a que nadie
+# tenga el candado de apt, y todo se instala con una sola orden. Con
+# prepare() se lanzan a la vez las construcciones de las imagenes que
+# falten y cada rol espera solo a la suya (ensure)
+# --------------------------------------------------------------------
+# Los paquetes que se descargan (/var/cache/apt/archives) y las listas
+# de paquetes (/var/lib/apt/lists) se guardan en una carpeta del 
+# anfitrion (APT_CACHE, junto al programa) que se monta en los 
+# contenedores de construccion, asi cada paquete se descarga una sola
+# vez aunque lo usen varios roles (openjdk, libc...) o se vuelva a construir la
+# imagen. apt bloquea estas carpetas con fcntl y el bloqueo seria 
+# comun a todos los contenedores, por lo que las listas se actualizan
+# y los paquetes se descargan de una en una (_apt_cache_lock). Con el
+# candado tomado cada contenedor se copia las listas, y despues 
+# instala a la vez que los demas con su copia y sin descargar nada 
+# (solo lee de la cache). Opcionalmente se puede usar un repositorio
+# local (APT_MIRROR) en vez de los de internet
+# --------------------------------------------------------------------
+# El root del contenedor es otro usuario del anfitrion, por lo que las
+# carpetas de la cache se le dan a el (chown). Eso solo lo puede hacer
+# el root del anfitrion: si el programa lo ejecuta otro usuario (el
+# caso normal de un usuario del grupo lxd) las carpetas se dejan con
+# permiso de escritura para todos y se avisa una vez. Si tampoco se
+# puede, se construye sin la cache
+# --------------------------------------------------------------------
+
+img_logger = logging.getLogger(__name__)
+# Id con el que se guardan las imagenes de los roles en el registro
+ID = "images"
+# Se aumenta si cambia la forma de configurar las imagenes (invalida
+# todas las publicadas hasta ahora)
+RECIPES_VERSION = 2
+# Carpeta con los ficheros de configuracion de las recetas
+CONFIG_PATH = "program/resources/config_files"
+# Prefijo de los contenedores en los que se construyen las imagenes
+BUILD_PREFIX = "build-"
+# Espera a que termine el primer arranque (cloud-init) y a que se 
+# libere el candado de apt. Antes se paran los temporizadores de las
+# actualizaciones automaticas para que no empiecen otras despues
+APT_WAIT = (
+    "systemctl stop apt-daily.timer apt-daily-upgrade.timer " + 
+    ">/dev/null 2>&1; cloud-init status --wait >/dev/null 2>&1; " +
+    "while fuser /var/lib/dpkg/lock-frontend /var/lib/dpkg/lock " + 
+    "/var/lib/apt/lists/lock >/dev/null 2>&1; do sleep 1; done"
+)
+APT_INSTALL = "apt-get install -y --no-install-recommends"
+# Carpeta del anfitrion donde se guardan los paquetes y las listas de
+# apt de las construcciones
+APT_CACHE = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", ".apt_cache"
+))
+# Carpeta del anfitrion con un repositorio local de paquetes (plano o
+# con dists/) que sustituye a los de internet. None si no se usa
+APT_MIRROR = None
+# Donde se montan en los contenedores de construccion (apt las usa
+# solo cuando se le indica, ver _install)
+APT_SHARED = "/var/cache/apt-shared"
+APT_MOUNTS = {"archives": f"{APT_SHARED}/archives",
+              "lists": f"{APT_SHARED}/lists"}
+MIRROR_PATH = "/srv/apt-mirror"
+# Construcciones en curso o fallidas en esta orden (clave de la 
+# receta -> Future) e hilos lanzados con prepare()
+_builds = {}
+_threads = []
+_builds_lock = threading.Lock()
+# Si ya se ha avisado de que la cache de apt tiene permisos abiertos
+_apt_open_warned = False
+# --------------------------------------------------------------------
+class Recipe:
+    """Receta de la imagen de un rol
+
+        Args:
+            role (str): Rol de los contenedores (su tag)
+            packages (list, optional): Paquetes que se instalan
+            files (list, optional): Ficheros de configuracion (de
+                CONFIG_PATH) que se meten en la imagen
+            base_image (str, optional): Imagen de partida. Por defecto
+                platform.default_image
+            setup (optional): Funcion que recibe el contenedor en el
+                que se construye la imagen (arrancado y con los 
+                paquetes instalados) y mete los ficheros de 
+                configuracion. Debe lanzar LxcError si falla
+        """
+    __slots__ = ("role", "packages", "files", "base_image", "setup")
+
+    def __init__(self, role:str, packages:list=[], files:list=[],
+                 base_image:str=None, setup=None):
+        self.role = role
+        self.packages = list(packages)
+        self.files = list(files)
+        self.base_image = base_image
+        self.setup = setup
+
+    def image(self) -> str:
+        """Imagen de partida de la receta"""
+        if self.base_image is None:
+            # Se importa aqui porque platform importa los roles, que
+            # definen sus recetas al importarse
+            from program.platform import platform
+            return platform.default_image
+        return self.base_image
+
+    def key(self) -> str:
+        """Hash de todo lo que define la imagen (si cambia algo,
+        incluido el contenido de los ficheros, cambia la clave)"""
+        h = hashlib.sha256()
+        h.update(json.dumps(
+            [RECIPES_VERSION, self.role, self.image(), self.packages]
+        ).encode())
+        for file_name in self.files:
+            with open(f"{CONFIG_PATH}/{file_name}", "rb") as file:
+                h.update(hashlib.sha256(file.read()).digest())
+        return h.hexdigest()
+
+    def alias(self) -> str:
+        """Alias con el que se publica la imagen (rol-clave)"""
+        return f"{_role_slug(self.role)}-{self.key()[:12]}"
+
+    def __str__(self):
+        return self.alias()
+
+def _role_slug(role:str) -> str:
+    return role.replace(" ", "-")
+
+# --------------------------------------------------------------------
+def image_for(recipe:Recipe) -> str:
+    """Devuelve la imagen ya configurada de un rol si se ha publicado
+    con la misma receta y sigue existiendo en lxc
+
+    Args:
+        recipe (Recipe): Receta del rol
+
+    Returns:
+        str: Alias (o huella si no tiene) de la imagen o None si hay
+            que configurarla
+    """
+    key = recipe.key()
+    images = lxc.lxc_image_list()
+    saved = _saved_images().get(recipe.role)
+    if saved is not None and saved["key"] == key:
+        fgp = saved["fingerprint"]
+        if fgp in images:
+            # Vemos el alias de la imagen por si se ha modificado
+            alias = images[fgp]["ALIAS"]
+            if alias != saved["alias"]:
+                _save_image(recipe.role, key, alias, fgp)
+            msg = f" Imagen del rol '{recipe.role}' -> '{fgp}'"
+            img_logger.debug(msg)
+            return fgp if alias == "" else alias
+    # Si no esta en el registro se busca por su alias
+    alias = recipe.alias()
+    for fgp, info in images.items():
+        if info["ALIAS"] == alias:
+            _save_image(recipe.role, key, alias, fgp)
+            msg = f" Imagen del rol '{recipe.role}' -> '{fgp}'"
+            img_logger.debug(msg)
+            return alias
+    return None
+
+def publish(recipe:Recipe, c:Container) -> str:
+    """Publica la imagen de un contenedor configurado con la receta
+    y elimina las imagenes de recetas anteriores del mismo rol
+
+    Args:
+        recipe (Recipe): Receta con la que se ha configurado
+        c (Container): Contenedor configurado (parado)
+
+    Raises:
+        LxcError: Si no se puede publicar la imagen
+
+    Returns:
+        str: Alias de la imagen publicada
+    """
+    alias = recipe.alias()
+    msg = f" Publicando imagen del {c.tag} con alias '{alias}'..."
+    img_logger.info(msg)
+    c.publish(alias=alias)
+    images = lxc.lxc_image_list()
+    fingerprint = ""
+    # Imagenes publicadas con recetas anteriores del mismo rol
+    slug = re.escape(_role_slug(recipe.role))
+    old = re.compile(rf"{slug}-[0-9a-f]{{12}}")
+    for fgp, info in images.items():
+        if info["ALIAS"] == alias:
+            fingerprint = fgp
+        elif old.fullmatch(info["ALIAS"]):
+            msg = f" Eliminando imagen antigua '{info['ALIAS']}'"
+            img_logger.debug(msg)
+            with suppress(lxc.LxcError):
+                lxc.run(["lxc", "image", "delete", fgp])
+    _save_image(recipe.role, recipe.key(), alias, fingerprint)
+    img_logger.info(" Publicacion completada")
+    return alias
+
+# --------------------------------------------------------------------
+def prepare(*recipes) -> list:
+    """Lanza a la vez la construccion de las imagenes que falten (sin
+    esperar a que terminen, finish() espera a todas al terminar la
+    orden). Si se ha pedido ejecucion secuencial (flag -s) no hace
+    nada y cada imagen se construye cuando se pida con ensure()
+
+    Args:
+        recipes (Recipe): Recetas de los roles
+
+    Returns:
+        list: Recetas cuya imagen se ha empezado a construir
+    """
+    if sequential_execution(): return []
+    started = []
+    for recipe in recipes:
+        with _builds_lock:
+            if recipe.key() in _builds: continue
+            if image_for(recipe) is not None: continue
+            future = conc.Future()
+            _builds[recipe.key()] = future
+        thread = threading.Thread(
+            target=_run_build, args=(recipe, future)
+        )
+        with _builds_lock: _threads.append(thread)
+        thread.start()
+        started.append(recipe)
+    return started
+
+def finish():
+    """Espera a que terminen las construcciones lanzadas con prepare()
+    y olvida las que han fallado. Se llama al terminar cada orden, 
+    antes de guardar el registro"""
+    with _builds_lock:
+        threads = list(_threads)
+        _threads.clear()
+    for thread in threads:
+        thread.join()
+    with _builds_lock:
+        _builds.clear()
+
+def ensure(recipe:Recipe) -> str:
+    """Devuelve la imagen de un rol construyendola si hace falta (o
+    esperando a que termine si ya se esta construyendo)
+
+    Args:
+        recipe (Recipe): Receta del rol
+
+    Returns:
+        str: Alias de la imagen o None si no se ha podido construir
+    """
+    with _builds_lock:
+        future = _builds.get(recipe.key())
+        if future is None:
+            image = image_for(recipe)
+            if image is not None: return image
+            future = conc.Future()
+            _builds[recipe.key()] = future
+            owner = True
+        else:
+            owner = False
+    if owner: _run_build(recipe, future)
+    try:
+        return future.result()
+    except lxc.LxcError as err:
+        err_msg = (f" Fallo al crear la imagen del rol '{recipe.role}', " +
+                    f"error de lxc: {err}")
+        img_logger.error(err_msg)
+        return None
+
+def _run_build(recipe:Recipe, future:conc.Future):
+    try:
+        alias = _build(recipe)
+    except Exception as err:
+        # El fallo se guarda hasta que termine la orden (finish) para
+        # no volver a construir la misma imagen
+        future.set_exception(err)
+        return
+    future.set_result(alias)
+    with _builds_lock:
+        _builds.pop(recipe.key(), None)
+
+def _build(recipe:Recipe) -> str:
+    """Configura un contenedor auxiliar con la receta, publica su
+    imagen y lo elimina"""
+    name = f"{BUILD_PREFIX}{_role_slug(recipe.role)}"
+    c = Container(name, recipe.image(), tag=recipe.role)
+    # Si quedo alguno de una ejecucion anterior se elimina
+    if name in lxc.lxc_names():
+        lxc.run(["lxc", "delete", "--force", name])
+    img_logger.info(f" Creando la imagen del rol '{recipe.role}'...")
+    c.init()
+    try:
+        cached = len(recipe.packages) > 0 and _mount_apt(c)
+        c.start()
+        if len(recipe.packages) > 0:
+            _install(c, recipe.packages, cached)
+        if recipe.setup is not None:
+            recipe.setup(c)
+        c.stop()
+        alias = publish(recipe, c)
+    finally:
+        with suppress(lxc.LxcError):
+            lxc.run(["lxc", "delete", "--force", name])
+    img_logger.info(f" Imagen del rol '{recipe.role}' creada con exito")
+    return alias
+
+# --------------------------------------------------------------------
+def config_apt(cache:str=None, mirror:str=None):
+    """Configura de donde obtienen los paquetes las construcciones
+
+    Args:
+        cache (str, optional): Carpeta del anfitrion donde se guardan
+            los paquetes descargados. Por defecto APT_CACHE
+        mirror (str, optional): Carpeta del anfitrion con un 
+            repositorio local de paquetes a usar en vez de los de 
+            internet
+    """
+    global APT_CACHE, APT_MIRROR
+    if cache is not None: APT_CACHE = cache
+    APT_MIRROR = mirror
+
+def _mount_apt(c:Container) -> bool:
+    """Monta la cache de apt del anfitrion (y el repositorio local si
+    se usa) en el contenedor de construccion
+
+    Returns:
+        bool: Si se ha montado la cache (si no se instala sin ella)
+    """
+    if APT_MIRROR is not None:
+        c.add_device(
+            "apt-mirror", "disk", source=os.path.abspath(APT_MIRROR),
+            path=MIRROR_PATH, readonly=True
+        )
+    # El root del contenedor no es el del anfitrion
+    uid = _root_id(c)
+    sources = {}
+    for folder in APT_MOUNTS:
+        # Las listas de un repositorio local no se mezclan con las de
+        # los de internet
+        if folder == "lists" and APT_MIRROR is not None: continue
+        source = os.path.abspath(os.path.join(APT_CACHE, folder))
+        os.makedirs(source, mode=0o755, exist_ok=True)
+        if not _own_apt_dir(source, uid, c.name): return False
+        sources[folder] = source
+    for folder, source in sources.items():
+        c.add_device(
+            f"apt-{folder}", "disk", source=source, 
+            path=APT_MOUNTS[folder]
+        )
+    return True
+
+def _own_apt_dir(source:str, uid:int, name:str) -> bool:
+    """Da la carpeta de la cache al root del contenedor. Si no se
+    puede (no se es root en el anfitrion) se deja abierta para todos
+    
+    Returns:
+        bool: Si el contenedor podra escribir en la carpeta
+    """
+    global _apt_open_warned
+    try:
+        if os.stat(source).st_uid != uid:
+            os.chown(source, uid, uid)
+        return True
+    except PermissionError:
+        pass
+    except OSError as err:
+        warn = (f" No se puede dar la cache de apt '{source}' al root " +
+                f"de '{name}' ({err}), se instala sin ella")
+        img_logger.warning(warn)
+        return False
+    try:
+        os.chmod(source, 0o777)
+    except OSError as err:
+        warn = (f" No se puede dar permiso de escritura en la cache de " +
+                f"apt '{source}' ({err}), se instala sin ella")
+        img_logger.warning(warn)
+        return False
+    if not _apt_open_warned:
+        _apt_open_warned = True
+        warn = (f" Solo el root del anfitrion puede dar la cache de apt " +
+                f"'{APT_CACHE}' a los contenedores, se deja con permiso " +
+                 "de escritura para todos los usuarios")
+        img_logger.warning(warn)
+    return True
+
+def _root_id(c:Container) -> int:
+    """Uid (y gid) del anfitrion que corresponde al root del 
+    contenedor (0 si el contenedor es privilegiado)"""
+    base = lxc.run(
+        ["lxc", "config", "get", c.name, "volatile.idmap.base"]
+    ).strip()
+    return int(base) if base.isdigit() else 0
+
+def _install(c:Container, packages:list, cached:bool=True):
+    """Actualiza las listas y descarga los paquetes en la cache 
+    compartida (de uno en uno) y los instala desde la cache (a la vez
+    que el resto de construcciones)
+
+    Args:
+        c (Container): Contenedor de construccion
+        packages (list): Paquetes a instalar
+        cached (bool, optional): Si tiene montada la cache de apt. Si
+            no se descargan e instalan en el propio contenedor
+    """
+    packages = " ".join(packages)
+    msg = f" Instalando {packages} en '{c.name}' (puede tardar)..."
+    img_logger.info(msg)
+    archives = f"-o Dir::Cache::Archives={APT_MOUNTS['archives']}/"
+    shared = archives
+    sources = ""; restore = ""; copy_lists = ""
+    if APT_MIRROR is not None:
+        # Se usa solo el repositorio local y se deja como estaba al
+        # terminar (la imagen no debe depender de el)
+        sources = (
+            "mv /etc/apt/sources.list /etc/apt/sources.list.orig && " +
+            f"echo \"{_mirror_source()}\" > /etc/apt/sources.list && "
+        )
+        restore = (
+            " && mv /etc/apt/sources.list.orig /etc/apt/sources.list" +
+            " && rm -rf /var/lib/apt/lists/*"
+        )
+    env = ["env", "DEBIAN_FRONTEND=noninteractive", "sh", "-c"]
+    if not cached:
+        c.execute(env + [
+            f"{APT_WAIT}; {sources}apt-get update && " +
+            f"{APT_INSTALL} {packages}{restore}"
+        ])
+        return
+    if APT_MIRROR is None:
+        # Las listas compartidas solo se tocan con el candado, cada
+        # contenedor instala con su propia copia
+        lists = APT_MOUNTS["lists"]
+        shared += f" -o Dir::State::Lists={lists}/"
+        copy_lists = f" && cp -r {lists}/. /var/lib/apt/lists/"
+    with _apt_cache_lock():
+        c.execute(env + [
+            f"{APT_WAIT}; {sources}apt-get {shared} update && " +
+            f"{APT_INSTALL} {shared} --download-only {packages}" + 
+            copy_lists
+        ])
+    # Sin el candado solo se lee de la cache: si falta algun paquete
+    # falla en vez de descargarlo. NoLocking tambien quita el candado
+    # de dpkg, asi que antes se vuelve a esperar a que este libre
+    c.execute(env + [
+        f"{APT_WAIT}; {APT_INSTALL} {archives} --no-download " + 
+        f"-o Debug::NoLocking=true {packages}{restore}"
+    ])
+
+def _mirror_source() -> str:
+    if os.path.isdir(os.path.join(APT_MIRROR, "dists")):
+        codename = "$(. /etc/os-release; echo $VERSION_CODENAME)"
+        return (f"deb [trusted=yes] file:{MIRROR_PATH} {codename} " +
+                 "main universe")
+    return f"deb [trusted=yes] file:{MIRROR_PATH} ./"
+
+@contextmanager
+def _apt_cache_lock():
+    """Solo una construccion (de este o de otro proceso) descarga a la
+    vez en la cache compartida"""
+    os.makedirs(APT_CACHE, exist_ok=True)
+    fd = os.open(
+        os.path.join(APT_CACHE, ".lock"), os.O_RDWR | os.O_CREAT, 0o644
+    )
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+# --------------------------------------------------------------------
+def _saved_images() -> dict:
+    saved = register.load(ID)
+    return {} if saved is None else saved
+
+def _save_image(role:str, key:str, alias:str, fingerprint:str):
+    image_info = {
+        "key": key, "alias": alias, "fingerprint": fingerprint
+    }
+    with register.atomic():
+        if register.exists(ID):
+            register.update(ID, image_info, override=False, dict_id=role)
+        else:
+            register.add(ID, {role: image_info})
+
+# --------------------------------------------------------------------
@@ -3,7 +3,7 @@ import logging
 
 from program.controllers import containers
 from dependencies.lxc.lxc_classes.container import Container
-from program.platform import platform
+from program.platform import platform, images
 from dependencies.lxc import lxc
 from dependencies.register import register
 
@@ -17,6 +17,16 @@ from dependencies.register import register
 cl_logger = logging.getLogger(__name__)
 # Tag e id de registro para la imagen configurada
 TAG = "client"
+# Receta de la imagen del cliente
+RECIPE = images.Recipe(TAG, packages=["lynx"])
+# --------------------------------------------------------------------
+class Client(Container):
+    """Contenedor con el rol de cliente (lynx)"""
+    __slots__ = ()
+
+    def __init__(self, name:str, base_image:str):
+        super().__init__(name, base_image, tag=TAG)
+
 # --------------------------------------------------------------------
 def create_client(name, image:str=None) -> Container:
     # Comprobamos que si hace falta configurar una imagen base para
@@ -26,49 +36,25 @@ def create_client(name, image:str=None) -> Container:
         err = " Ya existe un contenedor cliente"
         cl_logger.error(err)
         return None
-    j = 1
-    while name in lxc.lxc_list():
+    j = 1; existing_names = lxc.lxc_names()
+    while name in existing_names:
         name = f"cl{j}"
         j += 1
     # Creamos los objetos de lo cliente
-    cl = Container(name, image, tag=TAG)
+    cl = Client(name, image)
     cl.add_to_network("eth0", with_ip="10.0.1.2")
     if image is None:
-        cl.base_image = platform.default_image
-        _config_client(cl)
-    else:
-        successful = containers.init(cl)
-        if len(successful) == 0: cl = None
+        image = images.ensure(RECIPE)
+        if image is None:
+            cl.config_error = True
+            image = platform.default_image
+        cl.base_image = image
+    successful = containers.init(cl)
+    if len(successful) == 0: cl = None
     return cl
 
 def get_client():
-    cs = register.load(containers.ID)
-    if cs != None:
-        for c in cs:
-            if c.tag == TAG:
-                return c
-    return None
+    found = register.query(containers.ID, tag=TAG)
+    return found[0] if len(found) > 0 else None
 
 # --------------------------------------------------------------------
-def _config_client(cl:Container):
-    cl_logger.info(" Configurando cliente...")
-    # Lanzamos el contenedor e instalamos modulos
-    containers.init(cl); containers.start(cl)
-    cl_logger.info(" Instalando lynx (puede tardar)...")
-    cl.restart() # Para evitar posibles fallos en la instalacion (dpkg)
-    try:
-        cl.update_apt()
-        cl.install("lynx")
-        cl_logger.info(" lynx instalado con exito")
-    except lxc.LxcError as err:
-        err_msg = (" Fallo al instalar lynx, " + 
-                            "error de lxc: " + str(err))
-        cl_logger.error(err_msg)
-        setattr(cl, "config_error", True)
-        containers.stop(cl)
-    else:
-        containers.stop(cl)
-        cl_logger.info(" Cliente configurado con exito\n")
-    containers.update_containers(cl)
-
-# --------------------------------------------------------------------
\ No newline at end of file
@@ -1,6 +1,5 @@
 
 import logging
-from os import remove
 
 from dependencies import lxc
 from program.controllers import containers
@@ -8,7 +7,7 @@ from dependencies.register import register
 from dependencies.lxc.lxc_classes.container import Container
 from dependencies.lxc import lxc
 from program.platform.machines import servers
-from program.platform import platform
+from program.platform import platform, images
 
 # ---------------------- BALANCEADOR DE CARGA ------------------------
 # --------------------------------------------------------------------
@@ -19,12 +18,43 @@ from program.platform import platform
 
 lb_logger = logging.getLogger(__name__)
 # Tag e id de registro para la imagen configurada
-TAG = "load balancer"; IMG_ID = "lb_image" 
+TAG = "load balancer"
 # Algoritmo de balanceo de trafico
 default_algorithm = "roundrobin"
 # Puerto en el que se va a ejecutar para aceptar conexiones de clientes
 # por defecto
 default_port = 80
+# --------------------------------------------------------------------
+class LoadBalancer(Container):
+    """Contenedor con el rol de balanceador de carga (haproxy)
+
+        Args:
+            name (str): Nombre del balanceador
+            base_image (str): Imagen con la que se va a crear
+            port (int, optional): Puerto en el que acepta conexiones
+            algorithm (str, optional): Algoritmo de balanceo
+        """
+    __slots__ = ("port", "algorithm")
+    FIELD_DEFAULTS = {"port": default_port, "algorithm": default_algorithm}
+
+    def __init__(self, name:str, base_image:str, port:int=default_port,
+                 algorithm:str=default_algorithm):
+        super().__init__(name, base_image, tag=TAG)
+        self.port = port
+        self.algorithm = algorithm
+
+# --------------------------------------------------------------------
+def _setup_image(c:Container):
+    """Configura en la imagen las dos tarjetas de red del balanceador
+    (una para cada bridge)"""
+    c.add_to_network("eth0"); c.add_to_network("eth1")
+    containers.configure_netfile(c)
+
+# Receta de la imagen del balanceador. base_haproxy.cfg no va en la
+# imagen (se genera la configuracion en cada despliegue), asi que no
+# forma parte de la receta
+RECIPE = images.Recipe(TAG, packages=["haproxy"], setup=_setup_image)
+
 # --------------------------------------------------------------------
 def create_lb(image:str=None, balance:str=None, port:int=None) -> Container:
     """Devuelve el objeto del LB configurado
@@ -40,8 +70,8 @@ def create_lb(image:str=None, balance:str=None, port:int=None) -> Container:
     """
     # Comprobamos que si hace falta configurar una imagen base para
     # el balanceador o ya se ha creado antes y esta disponible
-    j = 1; name = "lb"
-    while name in lxc.lxc_list():
+    j = 1; name = "lb"; existing_names = lxc.lxc_names()
+    while name in existing_names:
         name = f"lb{j}"
         j += 1
     if balance is None:
@@ -50,65 +80,30 @@ def create_lb(image:str=None, balance:str=None, port:int=None) -> Container:
     msg = (f" Creando balanceador con imagen '{image}' " + 
            f"y algoritmo de balanceo '{balance}'")
     lb_logger.debug(msg)
-    lb = Container(name, image, tag=TAG)
-    lb.add_to_network("eth0", with_ip="10.0.0.10")
-    lb.add_to_network("eth1", with_ip="10.0.1.10")
     if port is None:
         port = default_port
-    setattr(lb, "port", port)
-    setattr(lb, "algorithm", balance)
+    lb = LoadBalancer(name, image, port=port, algorithm=balance)
+    lb.add_to_network("eth0", with_ip="10.0.0.10")
+    lb.add_to_network("eth1", with_ip="10.0.1.10")
     if image is None:
-        lb.base_image = platform.default_image
-        _config_loadbalancer(lb)
-    else:
-        successful = containers.init(lb)
-        if len(successful) == 0: 
-            lb = None
-        else:
-            lb.start(); update_haproxycfg(lb); lb.stop()
+        image = images.ensure(RECIPE)
+        if image is None:
+            lb.config_error = True
+            image = platform.default_image
+        lb.base_image = image
+    successful = containers.init(lb)
+    if len(successful) == 0: 
+        lb = None
+    elif not lb.config_error:
+        # El puerto, el algoritmo y los servidores pueden no ser los 
+        # mismos que cuando se configuro la imagen
+        lb.start(); update_haproxycfg(lb); lb.stop()
     return lb
 
 def get_lb():
-    cs = register.load(containers.ID)
-    if cs != None:
-        for c in cs:
-            if c.tag == TAG:
-                return c
-    return None
+    found = register.query(containers.ID, tag=TAG)
+    return found[0] if len(found) > 0 else None
     
-# --------------------------------------------------------------------
-def _config_loadbalancer(lb:Container):
-    """Crea una imagen para el balanceador de carga completamente
-    configurada y funcional a partir de la default_image
-
-    Returns:
-        str: alias de la imagen creada
-    """
-    lb_logger.info(" Configurando balanceador de carga...")
-    # Lanzamos el contenedor e instalamos modulos
-    containers.init(lb); containers.start(lb)
-    # Configuramos el netfile
-    containers.configure_netfile(lb)
-    lb_logger.info(" Instalando haproxy (puede tardar)...")
-    lb.restart() # Para evitar posibles fallos en la instalacion (dpkg)
-    try:
-        lb.update_apt()
-        lb.install("haproxy")
-        lb.execute(["service","haproxy","start"])
-    except lxc.LxcError as err:
-        err_msg = (" Fallo al instalar haproxy, " + 
-                            "error de lxc: " + str(err))
-        lb_logger.error(err_msg)
-        setattr(lb, "config_error", True)
-        containers.stop(lb)
-    else:
-        # Configurmaos el haproxy file
-        update_haproxycfg(lb)
-        containers.stop(lb)
-        msg = " Balanceador de carga configurado con exito\n"
-        lb_logger.info(msg)
-    containers.update_containers(lb) 
-
 # --------------------------------------------------------------------
 def update_haproxycfg(lb:Container, reset_on_fail=True):
     # Miramos si el lb esta arrancado para actualizar (si no lo 
@@ -130,14 +125,7 @@ def update_haproxycfg(lb:Container, reset_on_fail=True):
          "backend webservers\n" +
         f"        balance {lb.algorithm}\n"
     )
-    cs = register.load(containers.ID)
-    if cs is None:
-        servs = []
-    else:
-        servs = list(filter(
-            lambda c: c.tag == servers.TAG and c.state == "RUNNING",
-            cs
-        ))
+    servs = register.query(containers.ID, tag=servers.TAG, state="RUNNING")
     for i, s in enumerate(servs):
         l = f"        server webserver{i+1} {s.name}:{s.port}\n"
         config += l
@@ -147,19 +135,16 @@ def update_haproxycfg(lb:Container, reset_on_fail=True):
     config += "        option httpchk"
     lb_logger.debug(config)
     # Leemos la info basica del fichero basic_haproxy.cfg
-    basicfile_path = "program/resources/config_files/base_haproxy.cfg"
+    basicfile_path = f"{images.CONFIG_PATH}/base_haproxy.cfg"
     with open(basicfile_path, "r") as file:
         base_file = file.read()
     # Juntamos los ficheros
     configured_file = base_file + config
-    # Creamos el fichero haproxy.cfg lo enviamos al contenedor y
-    # eliminamos el fichero que ya no nos hace falta
+    # Enviamos el fichero haproxy.cfg al contenedor
     fail = False
     try:
         path = "/etc/haproxy/"; file_name = "haproxy.cfg"
-        with open(file_name, "w") as file:
-            file.write(configured_file)
-        lb.push(file_name, path)
+        lb.push_bytes(configured_file, path+file_name)
         lb.execute(["haproxy", "-f", path+file_name, "-c"])
         lb.execute(["service","haproxy","restart"])
         lb_logger.info(" Fichero haproxy actualizado con exito")
@@ -167,7 +152,6 @@ def update_haproxycfg(lb:Container, reset_on_fail=True):
         fail = True
         err_msg = f" Fallo al configurar el fichero haproxy: {err}" 
         lb_logger.error(err_msg)
-    remove("haproxy.cfg")
     if fail: 
         if reset_on_fail:
             reset_config()
@@ -1,13 +1,18 @@
 
 import os
+import re
+import asyncio
 import logging
+from contextlib import suppress
 
 from program.controllers import containers
 from dependencies.register import register
-from dependencies.lxc.lxc_classes.container import Container
+from dependencies.lxc.lxc_classes.container import Container, pack_tar
 from dependencies.lxc import lxc
-from program.platform import platform
-from dependencies.utils.tools import concat_array
+from program.platform import platform, images
+from dependencies.utils.tools import (
+    concat_array, dir_manifest, dir_signature
+)
 
 # --------------------------- SERVIDORES -----------------------------
 # --------------------------------------------------------------------
@@ -18,11 +23,55 @@ from dependencies.utils.tools import concat_array
 
 serv_logger = logging.getLogger(__name__)
 # Tag e id de registro para la imagen configurada
-TAG = "server"; IMG_ID = "s_image"
+TAG = "server"
 # Puerto en que se van a ejecutar (default de tomcat8)
 PORT = 8080
 # Donde se guardan las aplicaciones (default de tomcat8)
 tomcat_app_path = "/var/lib/tomcat8/webapps"
+# Dispositivo (disk) con el que se monta la aplicacion en el servidor
+APP_DEVICE = "app"
+# Numero maximo de servidores a los que se envia una aplicacion a la vez
+DISTRIBUTION_LIMIT = 4
+# Receta de la imagen de los servidores
+RECIPE = images.Recipe(TAG, packages=["tomcat8"])
+# Servidor plantilla (parado, creado con la imagen de los servidores
+# y con la aplicacion por defecto ya copiada) del que se copian los
+# servidores nuevos. No esta en el registro de contenedores (ningun
+# comando lo ve), lo que tiene se guarda en TEMPLATE_ID y se elimina 
+# al destruir la plataforma (remove_template). Ningun servidor puede
+# llamarse como ella
+TEMPLATE_ID = "s_template"
+TEMPLATE_NAME = f"{TAG}-template"
+# Si los servidores se crean copiando la plantilla (lxc copy) en vez
+# de desde la imagen
+USE_TEMPLATE = True
+# --------------------------------------------------------------------
+class Server(Container):
+    """Contenedor con el rol de servidor (tomcat8)
+
+        Args:
+            name (str): Nombre del servidor
+            base_image (str): Imagen con la que se va a crear
+            port (int, optional): Puerto en el que se ejecuta tomcat8
+        """
+    # _manifest: hash de cada fichero de la ultima aplicacion enviada
+    # al servidor (None si no se sabe lo que tiene)
+    # mounted: si la aplicacion esta montada desde el anfitrion
+    __slots__ = ("port", "app", "marked", "_manifest", "mounted")
+    RECORD_VERSION = 3
+    FIELD_DEFAULTS = {
+        "port": PORT, "app": None, "marked": False, "_manifest": None,
+        "mounted": False
+    }
+
+    def __init__(self, name:str, base_image:str, port:int=PORT):
+        super().__init__(name, base_image, tag=TAG)
+        self.port = port
+        self.app = None
+        self.marked = False
+        self._manifest = None
+        self.mounted = False
+
 # --------------------------------------------------------------------
 def create_servers(num:int, *names, image:str=None) -> list:
     """Devuelve los objetos de los servidores que se vayan a crear 
@@ -48,9 +97,9 @@ def create_servers(num:int, *names, image:str=None) -> list:
             ips.append(c.networks.get("eth0",""))
     for name in server_names:
         if image == None:
-            server = Container(name, platform.default_image, tag=TAG)
+            server = Server(name, platform.default_image)
         else:
-            server = Container(name, image, tag=TAG)
+            server = Server(name, image)
         # Lo añadimos a una red con una ip que no este usando ningun
         # otro contenedor
         ip = "10.0.0.11"
@@ -60,9 +109,6 @@ def create_servers(num:int, *names, image:str=None) -> list:
             ip = f"10.0.0.1{j}"
         ips.append(ip)
         server.add_to_network("eth0", with_ip=ip)
-        setattr(server, "port", PORT)
-        setattr(server, "app", None)
-        setattr(server, "marked", False)
         servers.append(server)
     successful = _config_servs(*servers, image=image)
     return successful
@@ -72,81 +118,182 @@ def _config_servs(*servs, image=None) -> list:
     # Comprobamos que si hace falta configurar una imagen base para
     # los servidores en base a si ya la hemos creado antes o 
     #  nos han pasado una en concreto para usar
-    servs = list(servs); successful = []
     serv_logger.info(f" Inicializando servidores '{concat_array(servs)}'")
-    if image == None and platform.is_imageconfig_needed(IMG_ID):
-        serv:Container = servs.pop(0)
-        serv_logger.info(" Creando la imagen base de los servidores...")
-        msg = (f" Contenedor usado para crear imagen " + 
-            f"de servidores -> '{serv}'")
-        serv_logger.debug(msg)
-        # Lanzamos el contenedor e instalamos tomcat8
-        containers.init(serv); containers.start(serv)
-        serv_logger.info(f" Configurando {serv.tag} '{serv}'...")
-        # Rearrancamos por si acaso para evitar fallos al instalar
-        serv.restart() # Para evitar posibles fallos en la instalacion (dpkg)
-        serv_logger.info(" Instalando tomcat8 (puede tardar)...")
-        try:
-            serv.update_apt()
-            serv.install("tomcat8")
-            serv_logger.info(" Tomcat8 instalado con exito")
-        except lxc.LxcError as err:
-            err_msg = (" Fallo al instalar tomcat8, " + 
-                                "error de lxc: " + str(err))
-            serv_logger.error(err_msg)
+    if image == None:
+        # Se inicializan todos en cuanto este la imagen
+        image = images.ensure(RECIPE)
+        template = None
+        if image is None:
             image = platform.default_image
-            setattr(serv, "has_config_error", True)
+            for s in servs: s.config_error = True
+        elif USE_TEMPLATE:
+            template = _template(image)
+        for s in servs: s.base_image = image
+        if template is not None:
+            # Los servidores nacen con la aplicacion de la plantilla
             for s in servs:
-                setattr(s, "has_config_error", True)
-            containers.stop(serv)
+                s.app = template["app"]
+                s._manifest = template["manifest"]
+            return containers.init(*servs, source=TEMPLATE_NAME)
+    return containers.init(*servs)
+
+# --------------------------------------------------------------------
+def _template(image:str) -> dict:
+    """Devuelve lo que tiene la plantilla de los servidores (imagen,
+    pool, aplicacion y su manifest) creandola de nuevo si no existe o
+    si ha cambiado la imagen, el pool o la aplicacion por defecto. El
+    manifest solo se vuelve a calcular si cambia la firma (tamaños y
+    fechas) de la aplicacion
+
+    Args:
+        image (str): Imagen de los servidores
+
+    Returns:
+        dict: Informacion de la plantilla o None si no se ha podido
+            crear
+    """
+    # Se importa aqui porque apps_handler importa este modulo
+    from program import apps_handler
+    app = apps_handler.get_defaultapp()
+    app_path = None; manifest = None; signature = None
+    saved = register.load(TEMPLATE_ID)
+    if app is not None:
+        app_path = f"{apps_handler.apps_default_path}/{app}/ROOT"
+        if os.path.isdir(app_path):
+            signature = dir_signature(app_path)
+            if (saved is not None and saved.get("app") == app and 
+                    saved.get("signature") == signature):
+                manifest = saved["manifest"]
+            else:
+                manifest = dir_manifest(app_path)
         else:
-            _publish_tomcat_image(serv)
-            msg = (" Configuracion de imagen base de servidores " + 
-                   "realizada con exito\n")
-            serv_logger.info(msg)
-        successful.append(serv)
-    if image == None:
-        image_saved = register.load(IMG_ID)
-        alias = image_saved["alias"]
-        image = alias
-        if alias == "": image = image_saved["fingerprint"]
-        for s in servs: s.base_image = alias
-    successful += containers.init(*servs)
-    return successful
+            app = None
+    template = {
+        "image": image, "pool": lxc.STORAGE_POOL, 
+        "app": app, "manifest": manifest, "signature": signature
+    }
+    if saved == template and TEMPLATE_NAME in lxc.lxc_names():
+        serv_logger.debug(f" Plantilla de servidores '{TEMPLATE_NAME}'")
+        return template
+    try:
+        _build_template(image, app, app_path)
+    except lxc.LxcError as err:
+        err_msg = (f" Fallo al crear la plantilla de los servidores, " +
+                   f"se crean desde la imagen: {err}")
+        serv_logger.error(err_msg)
+        return None
+    with register.atomic():
+        if register.exists(TEMPLATE_ID):
+            register.update(TEMPLATE_ID, template)
+        else:
+            register.add(TEMPLATE_ID, template)
+    return template
 
-def _publish_tomcat_image(serv:Container):
-    # Vemos que no existe una imagen con el alias que vamos a usar
-    alias = "tomcat8_serv"
-    k = 1
-    images = lxc.lxc_image_list()
-    aliases = list(map(lambda f: images[f]["ALIAS"], images))  
-    while alias in aliases:
-        alias = f"tomcat8_serv{k}"
-        k += 1
-    # Una vez el alias es valido publicamos la imagen
-    msg = (f" Publicando imagen base de servidores " + 
-        f"con alias '{alias}'...")
+def _build_template(image:str, app:str, app_path:str):
+    msg = f" Creando plantilla de los servidores '{TEMPLATE_NAME}'..."
     serv_logger.info(msg)
-    containers.stop(serv); serv.publish(alias=alias)
-    serv_logger.info(" Publicacion completada")
-    # Guardamos la imagen en el registro
-    # (obtenemos tambien la huella que le ha asignado lxc)
-    images = lxc.lxc_image_list()
-    fingerprint = ""
-    for f, info in images.items():
-        if info["ALIAS"] == alias:
-            fingerprint = f
-    image_info = {"alias": alias, "fingerprint": fingerprint}
-    register.add(IMG_ID, image_info)
+    # La plantilla anterior (de otra imagen o aplicacion) se elimina
+    if TEMPLATE_NAME in lxc.lxc_names():
+        lxc.run(["lxc", "delete", "--force", TEMPLATE_NAME])
+    with suppress(register.RegisterError):
+        register.remove(TEMPLATE_ID)
+    template = Server(TEMPLATE_NAME, image)
+    template.init()
+    try:
+        if app is not None:
+            template.start()
+            template.execute(["rm", "-rf", f"{tomcat_app_path}/ROOT"])
+            template.push_tar(
+                pack_tar([(app_path, "ROOT")]), f"{tomcat_app_path}/"
+            )
+            template.stop()
+    except lxc.LxcError:
+        with suppress(lxc.LxcError):
+            lxc.run(["lxc", "delete", "--force", TEMPLATE_NAME])
+        raise
+    serv_logger.info(" Plantilla de los servidores creada con exito")
+
+def remove_template():
+    """Elimina la plantilla de los servidores (si existe) y lo que se
+    guarda de ella en el registro"""
+    try:
+        if TEMPLATE_NAME in lxc.lxc_names():
+            lxc.run(["lxc", "delete", "--force", TEMPLATE_NAME])
+    except lxc.LxcError as err:
+        err_msg = (f" No se ha podido eliminar la plantilla de los " +
+                   f"servidores '{TEMPLATE_NAME}': {err}")
+        serv_logger.error(err_msg)
+        return
+    with suppress(register.RegisterError):
+        register.remove(TEMPLATE_ID)
 
 # --------------------------------------------------------------------
 def change_app(server:Container, app_path:str, name:str):
+    """Envia una aplicacion al servidor. Si se sabe que aplicacion
+    tiene (manifest) solo se envian los ficheros nuevos o modificados
+    y se eliminan los que sobran. Si no, se sustituye entera"""
+    distribute_app([server], app_path, name)
+
+def distribute_app(servs:list, app_path:str, name:str, 
+                   limit:int=None) -> list:
+    """Envia una aplicacion a varios servidores a la vez (como mucho
+    limit a la vez). El manifest de la aplicacion se calcula una sola 
+    vez y cada tar distinto que haya que enviar (la aplicacion entera
+    o los mismos ficheros modificados) se empaqueta una sola vez
+
+    Args:
+        servs (list): Servidores a los que enviar la aplicacion
+        app_path (str): Carpeta ROOT de la aplicacion
+        name (str): Nombre de la aplicacion
+        limit (int, optional): Numero maximo de servidores a los que
+            se envia a la vez. Por defecto DISTRIBUTION_LIMIT
+
+    Returns:
+        list: Servidores actualizados con exito
+    """
+    if len(servs) == 0: return []
+    limit = DISTRIBUTION_LIMIT if limit is None else limit
+    manifest = dir_manifest(app_path)
+    async def distribute():
+        sem = asyncio.Semaphore(max(1, limit))
+        packs = {}
+        async def change(s):
+            async with sem:
+                return await _change_app_async(
+                    s, app_path, name, manifest, packs
+                )
+        return await asyncio.gather(*(change(s) for s in servs))
+    results = asyncio.run(distribute())
+    successful = [s for s, ok in zip(servs, results) if ok]
+    failed = [s for s, ok in zip(servs, results) if not ok]
+    if len(servs) > 1:
+        if len(successful) > 0:
+            msg = (f" Aplicacion '{name}' actualizada en " + 
+                   f"'{concat_array(successful)}'")
+            serv_logger.info(msg)
+        if len(failed) > 0:
+            err = (f" No se pudo actualizar la aplicacion '{name}' en " + 
+                   f"'{concat_array(failed)}'")
+            serv_logger.error(err)
+    return successful
+
+async def _get_pack(packs:dict, members:list, to_path:str) -> bytes:
+    # Los servidores que necesiten el mismo tar esperan al mismo
+    # empaquetado (se hace en otro hilo)
+    key = (to_path,) + tuple(arcname for _, arcname in members)
+    if key not in packs:
+        loop = asyncio.get_running_loop()
+        packs[key] = loop.run_in_executor(None, pack_tar, members)
+    return await packs[key]
+
+async def _change_app_async(server:Container, app_path:str, name:str,
+                            manifest:dict, packs:dict) -> bool:
     webapps_dir = f"{tomcat_app_path}/"
     root_dir = f"{tomcat_app_path}/ROOT"
     if server.state != "RUNNING":
         err = f" El servidor {server.name} no esta arrancado"
         serv_logger.error(err)
-        return
+        return False
     # if server.app == name:
     #     err = (f" El servidor '{server.name}' ya esta usando la " + 
     #             f"aplicacion '{name}'")
@@ -154,93 +301,211 @@ def change_app(server:Container, app_path:str, name:str):
     #     return
     msg = f" Actualizando aplicacion de servidor '{server.name}'..."
     serv_logger.info(msg)
+    if server.mounted:
+        # Se desmonta la aplicacion y vuelve a verse la que tenia
+        # copiada (_manifest)
+        try:
+            await server.remove_device_async(APP_DEVICE)
+        except lxc.LxcError as err:
+            err_msg = (f" Error al desmontar la aplicacion anterior: {err}")
+            serv_logger.error(err_msg)
+            return False
+        server.mounted = False
+        _hide_mark(server)
+    deployed = server._manifest
+    if deployed is not None and server.marked:
+        # El index.html marcado ya no es el de la aplicacion (se
+        # vuelve a enviar o se elimina)
+        deployed = dict(deployed)
+        deployed["index.html"] = None
+    if deployed is not None:
+        changed = [f for f, h in manifest.items() if deployed.get(f) != h]
+        removed = [f for f in deployed if f not in manifest]
+        msg = (f" Sincronizando '{server.name}': {len(changed)} ficheros " +
+               f"nuevos o modificados y {len(removed)} eliminados")
+        serv_logger.debug(msg)
+    # Si falla a medias no se sabe lo que queda en el servidor
+    server._manifest = None
     try: 
-        # Eliminamos la aplicacion anterior
-        server.execute(["rm", "-rf", root_dir])
+        # Eliminamos la aplicacion anterior (o los ficheros que sobran)
+        if deployed is None:
+            await server.execute_async(["rm", "-rf", root_dir])
+        else:
+            paths = [f"{root_dir}/{f}" for f in removed]
+            # Por tandas para no pasarnos del limite de argumentos
+            for i in range(0, len(paths), 500):
+                await server.execute_async(
+                    ["rm", "-f", "--"] + paths[i:i+500]
+                )
+            # Carpetas de la aplicacion anterior que ya no tienen
+            # ficheros de la nueva (solo se borran si quedan vacias)
+            stale = _stale_dirs(removed, manifest)
+            dirs = [f"{root_dir}/{d}" for d in stale]
+            for i in range(0, len(dirs), 500):
+                # Si no se pueden borrar solo queda basura
+                with suppress(lxc.LxcError):
+                    await server.execute_async(
+                        ["find"] + dirs[i:i+500] + 
+                        ["-depth", "-type", "d", "-empty", "-delete"]
+                    )
     except lxc.LxcError as err:
         err_msg = (f" Error al eliminar la aplicacion anterior: {err}")
         serv_logger.error(err_msg)
-        return
+        containers.update_containers(server)
+        return False
     try:
-        server.push(app_path, webapps_dir)
+        if deployed is None:
+            members = [(app_path, "ROOT")]; to_path = webapps_dir
+        else:
+            members = [(os.path.join(app_path, f), f) for f in changed]
+            to_path = root_dir
+        if len(members) > 0:
+            tar = await _get_pack(packs, members, to_path)
+            await server.push_tar_async(tar, to_path)
     except lxc.LxcError as err:
         err_msg = (f" Error al añadir la aplicacion: {err}")
         serv_logger.error(err_msg)
-        return
+        containers.update_containers(server)
+        return False
     msg = (f" Actualizacion de aplicacion de servidor '{server.name}' " + 
                 "realizada con exito")
     server.app = name
     server.marked = False
+    server._manifest = manifest
+    containers.update_containers(server)
+    serv_logger.info(msg)
+    return True
+
+def _stale_dirs(removed:list, manifest:dict) -> list:
+    """Carpetas (las mas externas) de los ficheros eliminados que no
+    contienen ningun fichero de la aplicacion nueva"""
+    used = set()
+    for f in manifest:
+        parent = os.path.dirname(f)
+        while parent != "":
+            used.add(parent)
+            parent = os.path.dirname(parent)
+    stale = set()
+    for f in removed:
+        parent = os.path.dirname(f); top = None
+        while parent != "" and parent not in used:
+            top = parent
+            parent = os.path.dirname(parent)
+        if top is not None: stale.add(top)
+    return sorted(stale)
+
+# --------------------------------------------------------------------
+def mount_app(server:Container, app_path:str, name:str):
+    """Monta la carpeta de la aplicacion del anfitrion en el servidor
+    (dispositivo disk de solo lectura en la carpeta ROOT de tomcat8)
+    en vez de copiarla. Cambiar de aplicacion es cambiar el
+    dispositivo: no se copia nada ni ocupa espacio en el servidor. Los
+    cambios en la carpeta del anfitrion se ven en el servidor"""
+    root_dir = f"{tomcat_app_path}/ROOT"
+    msg = f" Montando aplicacion '{name}' en servidor '{server.name}'..."
+    serv_logger.info(msg)
+    try:
+        if server.mounted:
+            server.remove_device(APP_DEVICE)
+            server.mounted = False
+        server.add_device(
+            APP_DEVICE, "disk", 
+            source=os.path.abspath(app_path), path=root_dir, readonly=True
+        )
+    except lxc.LxcError as err:
+        err_msg = (f" Error al montar la aplicacion: {err}")
+        serv_logger.error(err_msg)
+        containers.update_containers(server)
+        return
+    server.app = name
+    _hide_mark(server)
+    server.mounted = True
     containers.update_containers(server)
+    msg = (f" Aplicacion '{name}' montada en servidor '{server.name}' " + 
+                "con exito")
     serv_logger.info(msg)
 
+def _hide_mark(server:Container):
+    """Al montar (o desmontar) una aplicacion la copiada sigue debajo
+    con su index.html marcado. El servidor deja de estar marcado pero
+    el index.html se da por distinto para que se vuelva a enviar"""
+    if server.marked and server._manifest is not None:
+        server._manifest = dict(server._manifest)
+        server._manifest["index.html"] = None
+    server.marked = False
+
 # --------------------------------------------------------------------
-def mark_htmlindexes(s:Container, undo=False):
-    # Para modificar el index.html de la aplicacion de cada servidor
-    # y ver quien es quien. Replace elimina el index.html que haya
-    # en el contenedor
+def mark_htmlindexes(*servs, undo=False) -> list:
+    """Marca (o desmarca con undo) el index.html de la aplicacion de 
+    los servidores para ver quien es quien. El fichero se modifica
+    dentro de cada servidor con una sola orden (sed) y todos los
+    servidores se marcan a la vez
+
+    Returns:
+        list: Servidores marcados (o desmarcados) con exito
+    """
+    async def mark_all():
+        return await asyncio.gather(
+            *(_mark_htmlindex_async(s, undo) for s in servs)
+        )
+    results = asyncio.run(mark_all())
+    return [s for s, ok in zip(servs, results) if ok]
+
+async def _mark_htmlindex_async(s:Container, undo:bool) -> bool:
     word1 = "Marcando"
     if undo:
         word1 = "Desmarcando"
-    index_dir = f"{tomcat_app_path}/ROOT/"
-    index_path = index_dir+"index.html"
+    index_path = f"{tomcat_app_path}/ROOT/index.html"
     if s.state != "RUNNING":
         serv_logger.error(f" El servidor {s.name} no esta arrancado")
-        return
+        return False
+    if s.mounted:
+        serv_logger.error(f" La aplicacion del servidor {s.name} esta " + 
+                           "montada en modo lectura y no se puede marcar")
+        return False
     if s.marked and not undo: 
         serv_logger.error(f" El servidor {s.name} ya esta marcado")
-        return
+        return False
     if not s.marked and undo:
         serv_logger.error(f" El servidor {s.name} no esta marcado")
-        return
+        return False
     serv_logger.info(f" {word1} servidor '{s.name}'")
-    pulled_file = "index.html"
-    try:  
-        s.pull(index_path, pulled_file)
-    except lxc.LxcError as err:
-        err_msg = (f" Error al descargar el index.html " + 
-                            f"del contenedor '{s.name}':" + str(err))
-        serv_logger.error(err_msg)
-        return
-    with open(pulled_file, "r") as file:
-        index = file.read()
-    # Vemos donde hay que introducir/quitar la marca
-    mark = f"\n<h1> Servidor {s.name} </h1>" 
+    # La marca se pone justo despues de la etiqueta <html ...> (-z 
+    # para que sed trate el fichero entero como una sola linea). Si no
+    # se sustituye nada (no hay <html>) sed termina con error (q1)
+    mark = f"<h1> Servidor {s.name} </h1>"
     if not undo:
-        simbol = "<html"
-        chars = list(index)
-        start = index.find(simbol)
-        html_label = ""
-        for i in range(start,len(chars)):
-            char = chars[i]
-            html_label += char
-            if char == ">":
-                break
-        old = html_label
-        new = html_label + mark
+        script = ["-e", f"s|<html[^>]*>|&\\n{_sed_replacement(mark)}|",
+                  "-e", "t", "-e", "q1"]
     else:
-        old = mark
-        new = ""
-    # Marcamos o desmarcamos el index.html
-    configured_index = index.replace(old, new)
-    with open(pulled_file, "w") as f:
-        f.write(configured_index)
-    try:  
-        s.push(pulled_file, index_dir)
+        script = ["-e", f"s|\\n{_sed_regex(mark)}||g"]
+    try:
+        await s.execute_async(["sed", "-z", "-i"] + script + [index_path])
     except lxc.LxcError as err:
-        err_msg = (f" Error al enviar el index.html marcado" + 
-                            f"al contenedor '{s.name}':" + str(err))
+        err_msg = (f" Error al modificar el index.html " + 
+                   f"del contenedor '{s.name}' (¿tiene etiqueta " +
+                   "<html>?): " + str(err))
         serv_logger.error(err_msg)
-        return
+        return False
     if undo:
         s.marked = False
     else:
         s.marked = True
     word2 = word1.lower().replace("n", "")
     serv_logger.info(f" Servidor '{s.name}' {word2}")
-    os.remove("index.html")
     containers.update_containers(s)
+    return True
     
+def _sed_regex(text:str) -> str:
+    """Escapa un texto para buscarlo literalmente en una expresion de
+    sed (BRE) con | como separador"""
+    return re.sub(r"([\\.*\[\]^$|])", r"\\\1", text)
+
+def _sed_replacement(text:str) -> str:
+    """Escapa un texto para usarlo literalmente como sustitucion en
+    una expresion de sed con | como separador"""
+    return re.sub(r"([\\&|])", r"\\\1", text).replace("\n", "\\n")
+
 # --------------------------------------------------------------------
 def _process_names(num:int, *names) -> list:
     """Se encarga de proporcionar una lista con nombres validos 
@@ -263,12 +528,19 @@ def _process_names(num:int, *names) -> list:
         cs_names = []
     else:
         cs_names = list(map(lambda c: c.name, cs)) 
-    existing_names = cs_names + list(lxc.lxc_list().keys())
+    existing_names = cs_names + lxc.lxc_names()
     server_names = []
     for i in range(num):
         try:
             name = names[i] 
         except:
+            name = None
+        if name == TEMPLATE_NAME:
+            err_msg = (f" El nombre '{name}' esta reservado para la " +
+                       "plantilla de los servidores, se usa otro")
+            serv_logger.error(err_msg)
+            name = None
+        if name is None:
             # Si no nos han proporcionado mas nombres, buscamos
             # uno que no exista ya o no nos hayan pasado antes
             name = f"s{j}"
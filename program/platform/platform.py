@@ -5,10 +5,10 @@ from program.platform.machines import data_base
 from dependencies.utils.tools import (
     pretty, objectlist_as_dict, remove_many, remove_ntimes
 )
-from dependencies.lxc import lxc
 from program.controllers import containers, bridges
 from dependencies.register import register
 from .machines import load_balancer, net_devices, servers, client
+from . import storage
 
 # --------------------- FUNCIONES DE PLATAFORMA ------------------------
 # --------------------------------------------------------------------
@@ -23,42 +23,40 @@ plt_logger = logging.getLogger(__name__)
 default_image = "ubuntu:18.04"
 # --------------------------------------------------------------------
 def is_deployed():
-    if register.load(bridges.ID) is None:
-        return False
-    return True
+    return register.exists(bridges.ID)
 
 def have_containers():
-    if register.load(containers.ID) is None:
-        return False
-    return True
+    return register.exists(containers.ID)
 
 def search_cs(cs_names:list=[], tags:list=[], skip:list=[], talk:bool=True):
-    existing_cs = register.load(containers.ID)
-    if existing_cs is None: 
+    if not register.exists(containers.ID):
         plt_logger.error(" No existen contenedores en el programa")
         return None
     check_tags = True
     if len(tags) == 0: check_tags = False
     all_cs = len(cs_names) == 0
+    # Solo se cargan los contenedores pedidos (busqueda por nombre)
     if all_cs:
-        cs_names = list(map(str, existing_cs))
+        candidates = [(c.name, c) for c in register.query(containers.ID)]
+    else:
+        candidates = [
+            (c_name, register.find(containers.ID, c_name))
+                for c_name in cs_names
+        ]
     found = []; skipped = False
-    for c_name in cs_names:
-        for ex_c in existing_cs:
-            if c_name == ex_c.name:
-                if not check_tags or ex_c.tag in tags:
-                    if not ex_c.name in skip:
-                        found.append(ex_c)
-                    else:
-                        skipped = True
-                elif talk:
-                    msg = f" El contenedor '{c_name}' no es del tipo {tags}"
-                    plt_logger.error(msg)
-                break
-        else:
+    for c_name, ex_c in candidates:
+        if ex_c is None:
             if talk:
                 msg = f" El contenedor '{c_name}' no se existe en el programa"
                 plt_logger.error(msg)
+        elif not check_tags or ex_c.tag in tags:
+            if not ex_c.name in skip:
+                found.append(ex_c)
+            else:
+                skipped = True
+        elif talk:
+            msg = f" El contenedor '{c_name}' no es del tipo {tags}"
+            plt_logger.error(msg)
     if len(found) == 0:
         if all_cs and not skipped:
             msg = f" No existen {tags} para realizar la operacion"
@@ -149,6 +147,8 @@ def print_state(machines:list=[]):
     # Vemos los contenedores a mostrar
     ex_cs = register.load(register_id=containers.ID)
     ex_bgs = register.load(register_id=bridges.ID)
+    # El almacenamiento solo se muestra con el estado completo
+    show_storage = len(machines) == 0
     if len(machines) > 0:
         cs = []
         for c in ex_cs:
@@ -196,6 +196,13 @@ def print_state(machines:list=[]):
                 print(pretty(b))
         else:
             print("     No hay bridges creados en la plataforma")
+    if show_storage:
+        print(" + ALMACENAMIENTO")
+        pool, driver = storage.current()
+        if pool is None:
+            print("     No hay ningun pool de almacenamiento en lxc")
+        else:
+            print(f"     Pool '{pool}' (driver {driver})")
 
 def print_info():
     print("""
@@ -238,32 +245,3 @@ def print_info():
     """)
   
 # --------------------------------------------------------------------
-def is_imageconfig_needed(reg_id_ofimage:str) -> bool:
-    reg_id = reg_id_ofimage
-    img_saved = register.load(reg_id)
-    if img_saved is None:
-        return True
-    else:
-        # Comprobamos que la imagen no se haya borrado en lxc
-        fgp = img_saved["fingerprint"]
-        msg = (f" Imagen anterior guardada en " + 
-                        f"registro '{reg_id}' -> '{fgp}'")
-        plt_logger.debug(msg)
-        images = lxc.lxc_image_list()
-        if fgp in images:
-            # Vemos el alias de la imagen por si se ha modificado 
-            alias = images[fgp]["ALIAS"] 
-            image_info = {"alias": alias, "fingerprint": fgp}
-            register.update(reg_id, image_info, override=True)
-            msg = (" Alias actual de la imagen " + 
-                    f"guardada en registro {reg_id} -> '{alias}'")
-            plt_logger.debug(msg)
-            return False
-        else:
-            # Como se ha eliminado creamos otra nueva
-            msg = (f" Imagen guardada en registro '{reg_id}' se ha " + 
-                    "borrado desde fuera del programa")
-            plt_logger.debug(msg)
-            register.remove(reg_id)
-            return True    
-# --------------------------------------------------------------------
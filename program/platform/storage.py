@@ -0,0 +1,114 @@
+import re
+import logging
+from contextlib import suppress
+
+from dependencies.register import register
+from dependencies.lxc import lxc
+
+# ------------------ ALMACENAMIENTO DE LA PLATAFORMA -----------------
+# --------------------------------------------------------------------
+# Por defecto los contenedores se crean en el pool del perfil default
+# de lxc (el que creara 'lxd init', muchas veces con el driver dir, en
+# el que crear, copiar o publicar un contenedor es copiar todos sus
+# ficheros). Al desplegar se puede pedir un pool propio de la
+# plataforma: un fichero (loop) del tamaño indicado con un sistema de
+# ficheros btrfs, en el que las copias son clones copy-on-write. El
+# pool elegido se guarda en el registro y se usa para todos los
+# contenedores que se creen mientras exista la plataforma (tambien
+# para construir las imagenes y la plantilla de los servidores)
+# --------------------------------------------------------------------
+
+storage_logger = logging.getLogger(__name__)
+# Id con el que se guarda el pool de la plataforma en el registro
+ID = "storage"
+# Nombre y driver del pool propio de la plataforma
+POOL_NAME = "pfinal2"
+DRIVER = "btrfs"
+# Tamaños que acepta lxc (512MiB, 20GB...)
+_SIZE = re.compile(r"[1-9][0-9]*[kMGTPE]i?B")
+# --------------------------------------------------------------------
+def valid_size(size:str) -> bool:
+    return _SIZE.fullmatch(size) is not None
+
+def create(size:str, driver:str=DRIVER) -> str:
+    """Crea el pool de la plataforma (si no existe ya de un despliegue
+    anterior) y hace que los contenedores se creen en el
+
+    Args:
+        size (str): Tamaño del fichero del pool (ej: 20GB)
+        driver (str, optional): Driver del pool. Por defecto DRIVER
+
+    Raises:
+        LxcError: Si no se puede crear el pool o ya existe con otro
+            driver
+
+    Returns:
+        str: Nombre del pool
+    """
+    pools = lxc.lxc_storage_list()
+    if POOL_NAME in pools:
+        if pools[POOL_NAME]["DRIVER"] != driver:
+            err = (f" Ya existe el pool '{POOL_NAME}' con el driver " +
+                   f"'{pools[POOL_NAME]['DRIVER']}' en vez de '{driver}'")
+            raise lxc.LxcError(err)
+        msg = f" Se reutiliza el pool '{POOL_NAME}' ({driver}) existente"
+        storage_logger.info(msg)
+    else:
+        msg = (f" Creando pool de almacenamiento '{POOL_NAME}' " +
+               f"({driver}, {size})...")
+        storage_logger.info(msg)
+        lxc.run(["lxc", "storage", "create", POOL_NAME, driver,
+                 f"size={size}"])
+        storage_logger.info(f" Pool '{POOL_NAME}' creado con exito")
+    use(POOL_NAME)
+    return POOL_NAME
+
+def use(pool:str):
+    """Guarda el pool de la plataforma y crea en el los contenedores"""
+    lxc.config_storage(pool)
+    with register.atomic():
+        if register.exists(ID):
+            register.update(ID, {"pool": pool})
+        else:
+            register.add(ID, {"pool": pool})
+
+def forget():
+    """Vuelve a usar el pool del perfil default"""
+    lxc.config_storage(None)
+    with suppress(register.RegisterError):
+        register.remove(ID)
+
+def restore() -> bool:
+    """Configura el pool guardado en el registro. Si se ha eliminado
+    desde fuera del programa se avisa y se usa el del perfil default
+
+    Returns:
+        bool: Si se ha avisado al usuario de algun cambio
+    """
+    saved = register.load(ID)
+    if saved is None: return False
+    pool = saved["pool"]
+    if pool not in lxc.lxc_storage_list():
+        warn = (f" El pool de almacenamiento '{pool}' ha sido " +
+                 "eliminado fuera del programa, los contenedores se " +
+                 "crearan en el del perfil default")
+        storage_logger.warning(warn)
+        forget()
+        return True
+    lxc.config_storage(pool)
+    return False
+
+def current() -> tuple:
+    """Devuelve el pool en el que se crean los contenedores y su
+    driver (None si no se puede saber)"""
+    try:
+        pool = lxc.STORAGE_POOL
+        if pool is None:
+            pool = lxc.lxc_default_pool()
+        info = lxc.lxc_storage_list().get(pool)
+    except lxc.LxcError as err:
+        storage_logger.error(f" No se ha podido consultar el pool: {err}")
+        return lxc.STORAGE_POOL, None
+    return pool, None if info is None else info["DRIVER"]
+
+# --------------------------------------------------------------------
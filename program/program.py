@@ -1,15 +1,17 @@
 
-from time import sleep
 from typing import Container
-from program.platform.machines import load_balancer, servers
+from program.platform.machines import (
+    load_balancer, servers, data_base, client
+)
 from dependencies.utils.tools import pretty
 from contextlib import suppress
 import logging
 import platform as plt
 import subprocess
 
-from dependencies.lxc import lxc
+from dependencies.lxc import lxc, readiness
 from program.controllers import containers, bridges
+from program.platform import storage
 from dependencies.register import register
 
 # --------------------- FUNCIONES DE PROGRAMA ------------------------
@@ -71,27 +73,16 @@ def list_lxc_containers(*cs:Container):
     running = list(filter(lambda c: c.state == "RUNNING", cs))
     frozen = list(filter(lambda c: c.state == "FROZEN", cs))
     total = running+frozen
-    finished = False; timeout = False
-    tf = 10; t = 0; twait = 0.1
-    while not finished:
-        if timeout:
-            err = (" timeout de 'lxc list', no se pudieron " + 
-                    "cargar todas las ips")
-            program_logger.error(err)
-            return
-        cs_list = lxc.lxc_list()
-        for c in total:
-            for net in c.networks:
-                if net not in cs_list[c.name]["IPV4"]:
-                    break
-            else:
-                continue
-            break
-        else:
-            finished = True
-        sleep(twait); t += twait
-        if t >= tf:
-            timeout = True
+    # Esperamos a que aparezcan las ips de los contenedores arrancados
+    expected = {c.name: list(c.networks) for c in total}
+    try:
+        readiness.wait_for_ips(expected, timeout=10)
+    except lxc.LxcError:
+        err = (" timeout de 'lxc list', no se pudieron " + 
+                "cargar todas las ips")
+        program_logger.error(err)
+        return
+    # La tabla se genera con la lista que ya se ha pedido (cache)
     table = lxc.lxc_list(as_str=True)
     cs_names = list(map(str, cs))
     filtered_table = lxc.filter_lxc_table(table, *cs_names)
@@ -175,6 +166,14 @@ def check_platform_updates():
     producido cambios que se deban actualizar en el programa""" 
     with suppress(Exception):
         register.add("updates", {})
+    # Pasamos los contenedores guardados con el formato antiguo a la
+    # clase de su rol
+    containers.migrate_records({
+        servers.TAG: servers.Server,
+        load_balancer.TAG: load_balancer.LoadBalancer,
+        data_base.TAG: data_base.DataBase,
+        client.TAG: client.Client
+    })
     # Cambiamos el nvl del logger para que siempre se muestren los
     # warning
     root_logger = logging.getLogger()
@@ -188,6 +187,9 @@ def check_platform_updates():
     # Detecamos los cambios que se hayan producido fuera del programa
     # de los bridge   
     warned = _check_bridges() or warned
+    # Vemos si sigue existiendo el pool de almacenamiento de la
+    # plataforma
+    warned = storage.restore() or warned
     # Volvemos a poner el nvl de logger de antes y nos aseguramos que 
     # el usuario lea los warnings
     root_logger.level = lvl